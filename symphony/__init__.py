@@ -1,4 +1,4 @@
-from .engine import Cluster, SymphonyConfig, AddressBook
+from .engine import Cluster, SymphonyConfig, AddressBook, LaunchResult
 from .kube import (KubeCluster, GKEDispatcher, KubeProcessSpec,
                    KubeProcessGroupSpec, KubeExperimentSpec)
 from .tmux import (
@@ -122,6 +122,10 @@ class SymphonyParser(object):
                         '--force',
                         action='store_true',
                         help='force delete, do not show confirmation message.')
+    parser.add_argument('-w',
+                        '--wait',
+                        action='store_true',
+                        help='wait until all experiments are fully deleted.')
     self.add_dry_run(parser)
 
   def _setup_scp(self):
@@ -156,7 +160,10 @@ class SymphonyParser(object):
   # ==================== Query API ====================
   def _setup_log(self):
     parser = self.add_subparser('log', aliases=['logs', 'l'])
-    self._add_component_arg(parser)
+    parser.add_argument(
+        'component_name',
+        help='[<process_group>/]<process>, "<process_group>/*" or "*" to '
+        'merge the logs of a whole process group or experiment.')
     self._add_experiment_name(parser, required=False, positional=True)
     parser.add_argument('-f',
                         '--follow',
@@ -360,15 +367,33 @@ class SymphonyParser(object):
 
   def action_delete_batch(self, args):
     """
-        Stop an experiment, delete corresponding pods, services, and namespace.
-        If experiment_name is omitted, default to deleting the current namespace.
-        Matches all possible experiments
+        Stop experiments, delete corresponding pods, services, and namespaces.
+        Deletes every experiment matched by one of the regexes at once,
+        --wait blocks until all of them are gone.
         """
-    for experiment_name in args.experiment_names:
-      experiments = self.cluster.list_experiments()
-      for experiment in experiments:
-        if re.match(experiment_name, experiment):
-          self._delete(experiment, args.force, args.dry_run)
+    experiments = self.cluster.list_experiments()
+    to_delete = [
+        experiment for experiment in experiments
+        if any(re.match(name, experiment) for name in args.experiment_names)
+    ]
+    if not to_delete:
+      print('no experiment matches')
+      return
+    print('\n'.join(to_delete))
+    if args.dry_run:
+      return
+    if not args.force:
+      ans = input('Confirm delete {} experiments? <enter>=yes,<n>=no: '.format(
+          len(to_delete)))
+      if ans not in ['', 'y', 'yes', 'Y']:
+        print('aborted')
+        return
+
+    deletion = self.cluster.delete_batch(to_delete)
+    print('deleting all resources under {} experiments'.format(len(to_delete)))
+    if args.wait and deletion is not None:
+      deletion.wait(progress=lambda done, total: print(
+          '{}/{} experiments deleted'.format(done, total)))
 
   def action_list_experiments(self, _):
     """
@@ -456,9 +481,18 @@ class SymphonyParser(object):
     """
         Show logs of components:
         """
+    if (args.component_name == '*' or args.component_name.endswith('/*')) \
+        and not self.cluster.multi_process_logs:
+      print_err('[Error] multi-process logs are only supported on kubernetes')
+      sys.exit(1)
     experiment_name = self._get_experiment(args)
-    process_group_name, process_name = \
-        self._interactive_find_process(args.component_name, experiment_name)
+    if args.component_name == '*':
+      process_group_name, process_name = None, None
+    elif args.component_name.endswith('/*'):
+      process_group_name, process_name = args.component_name[:-2], None
+    else:
+      process_group_name, process_name = \
+          self._interactive_find_process(args.component_name, experiment_name)
     self.cluster.get_log(experiment_name=experiment_name,
                          process_name=process_name,
                          process_group=process_group_name,
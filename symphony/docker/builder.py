@@ -50,6 +50,12 @@ class DockerServiceYML(DockerConfigYML):
         for k, v in di.items():
             self.set_env(k, v)
 
+    def add_env_file(self, env_file):
+        if 'env_file' not in self.data.keys():
+            self.data['env_file'] = []
+        if env_file not in self.data['env_file']:
+            self.data['env_file'].append(env_file)
+
     def set_hostname(self, hostname):
         self.data.hostname = hostname
 
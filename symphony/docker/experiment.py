@@ -12,15 +12,30 @@ class DockerExperimentSpec(ExperimentSpec):
     _ProcessClass = DockerProcessSpec
     _ProcessGroupClass = DockerProcessGroupSpec
 
-    def __init__(self, name, port_range=None):
+    def __init__(self, name, port_range=None, env_file=None):
+        """
+        Args:
+            name: name of the experiment
+            env_file: env file shared by all services, referenced with
+                env_file in the compose file instead of copying its
+                variables into every service
+        """
         check_valid_project_name(name)
+        self.env_file = env_file
         super().__init__(name)
 
+    def add_process(self, process, lone=True):
+        super().add_process(process, lone=lone)
+        if self.env_file is not None:
+            process.add_env_file(self.env_file)
+
     def _load_dict(self, di):
+        self.env_file = di.get('env_file')
         super()._load_dict(di)
 
     def dump_dict(self):
         data = super().dump_dict()
+        data['env_file'] = self.env_file
         return data
 
     def yml(self):
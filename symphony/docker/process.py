@@ -38,6 +38,9 @@ class DockerProcessSpec(ProcessSpec):
         for name, value in di.items():
             self.service_yml.set_env(name, value)
 
+    def add_env_file(self, env_file):
+        self.service_yml.add_env_file(env_file)
+
     def set_port(self, port):
         self.service_yml.set_port(port)
 
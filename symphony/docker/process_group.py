@@ -39,3 +39,7 @@ class DockerProcessGroupSpec(ProcessGroupSpec):
     def set_envs(self, di):
         for process in self.list_processes():
             process.set_envs(di)
+
+    def add_env_file(self, env_file):
+        for process in self.list_processes():
+            process.add_env_file(env_file)
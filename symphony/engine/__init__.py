@@ -1,3 +1,4 @@
-from .cluster import Cluster
+from .cluster import Cluster, LaunchResult
 from .application_config import SymphonyConfig
-from .address_book import AddressBook
\ No newline at end of file
+from .address_book import AddressBook
+from .port_allocator import PortAllocator
\ No newline at end of file
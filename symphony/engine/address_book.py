@@ -1,5 +1,8 @@
 
 
+import os
+
+
 class AddressBook(object):
     def __init__(self, di=None):
         self.entries = {}
@@ -23,6 +26,19 @@ class AddressBook(object):
                 '{}:{}'.format(entry['host'], entry['port'])
         return output
 
+    def dump_env_file(self, file_path):
+        """
+        Writes dump() as KEY=VALUE lines, readable by docker compose env_file
+        and by `set -a; . file_path; set +a` in a shell.
+        The file is replaced atomically, processes never see half of it
+        """
+        file_path = os.path.expanduser(file_path)
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for k, v in self.dump().items():
+                f.write('{}={}\n'.format(k, v))
+        os.replace(tmp_path, file_path)
+
     def format_name(self, name):
         formatted_name = name.upper()
         formatted_name = formatted_name.replace('-', '_')
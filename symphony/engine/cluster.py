@@ -1,8 +1,10 @@
 """
 Cluster subclasses are the actual execution engines
 """
+import time
+import concurrent.futures as futures
 from symphony.engine.application_config import SymphonyConfig
-from symphony.utils.common import deduplicate_with_order
+from symphony.utils.common import deduplicate_with_order, print_err
 
 
 _BACKEND_REGISTRY = {}
@@ -19,7 +21,59 @@ class _BackendRegistry(type):
         return cls
 
 
+class LaunchResult(object):
+    """
+    Outcome of launching one experiment in Cluster.launch_batch()
+    """
+    def __init__(self, name, success, duration=0., error=None, cancelled=False):
+        """
+        Args:
+            name: name of the experiment
+            success: True if launch() returned without raising
+            duration: seconds spent in compile + submit
+            error: the exception raised by launch(), if any
+            cancelled: True if the launch never started because an earlier
+                one failed with stop_on_failure
+        """
+        self.name = name
+        self.success = success
+        self.duration = duration
+        self.error = error
+        self.cancelled = cancelled
+
+    def __repr__(self):
+        if self.success:
+            status = 'success'
+        elif self.cancelled:
+            status = 'cancelled'
+        else:
+            status = 'failed: {!r}'.format(self.error)
+        return 'LaunchResult({}, {}, {:.2f}s)'.format(
+            self.name, status, self.duration)
+
+
+def _timed_launch(cluster, experiment_config, launch_kwargs):
+    """
+    Module level so that it can be shipped to a ProcessPoolExecutor
+    """
+    start_time = time.time()
+    try:
+        cluster.launch(experiment_config, **launch_kwargs)
+    except Exception as e:
+        return LaunchResult(experiment_config.name, False,
+                            time.time() - start_time, error=e)
+    return LaunchResult(experiment_config.name, True, time.time() - start_time)
+
+
 class Cluster(metaclass=_BackendRegistry):
+    # Maximum number of launch() calls that can safely run at the same time.
+    # None means no limit. Backends whose client is not thread-safe should
+    # set this to 1.
+    launch_concurrency = None
+    # Whether get_log() takes process_name=None to merge the logs of a
+    # whole process group or experiment
+    multi_process_logs = False
+
     def __init__(self, **kwargs):
         pass
 
@@ -62,9 +116,75 @@ class Cluster(metaclass=_BackendRegistry):
         """
         raise NotImplementedError
 
-    def launch_batch(self, experiment_configs):
-        for exp in experiment_configs:
-            self.launch(exp)
+    def launch_batch(self, experiment_configs, max_workers=1,
+                     executor='thread', stop_on_failure=False,
+                     **launch_kwargs):
+        """
+        Launches multiple experiments, running compile and submit of up to
+        @max_workers experiments at the same time.
+
+        Args:
+            experiment_configs: list of experiment specs
+            max_workers: size of the worker pool. Capped by the class
+                variable launch_concurrency of the backend
+            executor: 'thread' or 'process'. The process pool requires the
+                cluster and the experiment specs to be picklable
+            stop_on_failure: do not start any new launch once one has failed
+            launch_kwargs: forwarded to launch(), e.g. force=True
+
+        Returns:
+            list of LaunchResult, in the same order as @experiment_configs
+        """
+        experiment_configs = list(experiment_configs)
+        max_workers = self._get_launch_workers(max_workers)
+        if max_workers == 1:
+            results = []
+            for exp in experiment_configs:
+                if results and stop_on_failure and not results[-1].success:
+                    results.append(LaunchResult(exp.name, False, cancelled=True))
+                    continue
+                result = _timed_launch(self, exp, launch_kwargs)
+                self._report_launch_failure(result)
+                results.append(result)
+            return results
+
+        if executor == 'thread':
+            executor_cls = futures.ThreadPoolExecutor
+        elif executor == 'process':
+            executor_cls = futures.ProcessPoolExecutor
+        else:
+            raise ValueError('executor must be "thread" or "process", got {}'
+                             .format(executor))
+        with executor_cls(max_workers=max_workers) as pool:
+            pending = [pool.submit(_timed_launch, self, exp, launch_kwargs)
+                       for exp in experiment_configs]
+            for future in futures.as_completed(pending):
+                if future.cancelled():
+                    continue
+                result = future.result()
+                self._report_launch_failure(result)
+                if stop_on_failure and not result.success:
+                    for f in pending:
+                        f.cancel()
+        results = []
+        for exp, future in zip(experiment_configs, pending):
+            if future.cancelled():
+                results.append(LaunchResult(exp.name, False, cancelled=True))
+            else:
+                results.append(future.result())
+        return results
+
+    def _get_launch_workers(self, max_workers):
+        if max_workers is None or max_workers < 1:
+            raise ValueError('max_workers must be a positive integer')
+        if self.launch_concurrency is not None:
+            max_workers = min(max_workers, self.launch_concurrency)
+        return max_workers
+
+    def _report_launch_failure(self, result):
+        if not result.success:
+            print_err('[Error] Failed to launch experiment {}: {!r}'
+                      .format(result.name, result.error))
 
     # ========================================================
     # ===================== Action API =======================
@@ -153,6 +273,8 @@ class Cluster(metaclass=_BackendRegistry):
         Returns output of the process <process_name> under experiment
         <experiment_name>
         Args:
+            process_name(string): None for all processes of process_group,
+                or of the experiment, if multi_process_logs
             process_group(string): None if process is standalone
             follow(bool): set to True to wait for new logs
             since(int): the line to start getting logs from
@@ -0,0 +1,115 @@
+from symphony.utils.common import compact_range_dumps, compact_range_loads
+
+
+class PortAllocator(object):
+    """
+    Keeps track of the free ports of a port range, as a bitmap over
+    [min(ports), max(ports)]. reserve() and release() are O(1).
+    allocate() returns the lowest free port and starts looking at a cursor
+    below which every port is taken, so allocating ports one after another
+    is O(1) amortized
+    """
+    def __init__(self, ports):
+        """
+        Args:
+            ports: iterable of port numbers, e.g. range(7000, 9000)
+        """
+        if isinstance(ports, range) and ports.step == 1:
+            self._low = ports.start
+            self._members = bytearray(b'\x01') * len(ports)
+        else:
+            ports = list(ports)
+            self._low = min(ports) if ports else 0
+            size = max(ports) - self._low + 1 if ports else 0
+            self._members = bytearray(size)
+            for port in ports:
+                self._members[port - self._low] = 1
+        # 1 for every free port
+        self._free = bytearray(self._members)
+        self._num_free = self._free.count(1)
+        self._cursor = 0
+
+    def _index(self, port):
+        i = port - self._low
+        if 0 <= i < len(self._members) and self._members[i]:
+            return i
+        return None
+
+    def __contains__(self, port):
+        return self._index(port) is not None
+
+    def __len__(self):
+        """
+        Returns:
+            number of free ports
+        """
+        return self._num_free
+
+    def is_free(self, port):
+        i = self._index(port)
+        return i is not None and self._free[i] == 1
+
+    def reserve(self, port):
+        """
+        Marks port as taken
+
+        Returns:
+            True if port is in the range and was free
+        """
+        i = self._index(port)
+        if i is None or not self._free[i]:
+            return False
+        self._free[i] = 0
+        self._num_free -= 1
+        return True
+
+    def release(self, port):
+        """
+        Marks port as free again, ports outside of the range are ignored
+        """
+        i = self._index(port)
+        if i is None or self._free[i]:
+            return
+        self._free[i] = 1
+        self._num_free += 1
+        self._cursor = min(self._cursor, i)
+
+    def allocate(self, exclude=None):
+        """
+        Reserves the lowest free port
+
+        Args:
+            exclude: container of ports that must not be returned, they
+                stay free in the allocator
+
+        Returns:
+            port, None if no port is left
+        """
+        i = self._free.find(1, self._cursor)
+        # everything below the first free port is taken
+        self._cursor = len(self._free) if i == -1 else i
+        while i != -1 and exclude is not None and self._low + i in exclude:
+            i = self._free.find(1, i + 1)
+        if i == -1:
+            return None
+        self._free[i] = 0
+        self._num_free -= 1
+        return self._low + i
+
+    def free_ports(self):
+        return [self._low + i for i, free in enumerate(self._free) if free]
+
+    def dumps(self):
+        """
+        Returns:
+            free ports, as compact_range_dumps intervals '7000-7005,7010-8999'
+        """
+        if self._num_free == 0:
+            return ''
+        return compact_range_dumps(self.free_ports())
+
+    @classmethod
+    def loads(cls, description):
+        if not description:
+            return cls([])
+        return cls(compact_range_loads(description))
@@ -1,5 +1,5 @@
 from .cluster import KubeCluster
-from .process import KubeProcessSpec
+from .process import KubeProcessSpec, KubeReplicatedProcessSpec
 from .process_group import KubeProcessGroupSpec
 from .experiment import KubeExperimentSpec
 from .machine_dispatcher import GKEDispatcher
\ No newline at end of file
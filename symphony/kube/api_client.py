@@ -0,0 +1,439 @@
+"""
+Talks to the Kubernetes API server directly over persistent HTTP connections,
+as an alternative to forking a `kubectl` process for every query.
+Credentials are read from the same kubeconfig file that kubectl uses.
+"""
+import os
+import ssl
+import json
+import time
+import queue
+import base64
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import datetime
+from urllib.parse import urlparse, urlencode, quote
+from os.path import expanduser
+from benedict.data_format import load_yaml_file
+from symphony.utils.common import parse_duration
+
+
+# resource alias -> (api prefix, plural, kind used for `-o name`, namespaced)
+_RESOURCES = {}
+
+
+def _register_resource(aliases, prefix, plural, kind, namespaced):
+    for alias in aliases:
+        _RESOURCES[alias] = (prefix, plural, kind, namespaced)
+
+
+_register_resource(['pod', 'pods', 'po'], 'api/v1', 'pods', 'pod', True)
+_register_resource(['service', 'services', 'svc'],
+                   'api/v1', 'services', 'service', True)
+_register_resource(['secret', 'secrets'], 'api/v1', 'secrets', 'secret', True)
+_register_resource(['configmap', 'configmaps', 'cm'],
+                   'api/v1', 'configmaps', 'configmap', True)
+_register_resource(['event', 'events', 'ev'], 'api/v1', 'events', 'event', True)
+_register_resource(['namespace', 'namespaces', 'ns'],
+                   'api/v1', 'namespaces', 'namespace', False)
+_register_resource(['node', 'nodes', 'no'], 'api/v1', 'nodes', 'node', False)
+_register_resource(['deployment', 'deployments', 'deploy'],
+                   'apis/apps/v1', 'deployments', 'deployment.apps', True)
+_register_resource(['statefulset', 'statefulsets', 'sts'],
+                   'apis/apps/v1', 'statefulsets', 'statefulset.apps', True)
+_register_resource(['job', 'jobs'], 'apis/batch/v1', 'jobs', 'job.batch', True)
+
+
+class KubeApiError(RuntimeError):
+    """
+    Non-2xx response from the API server
+    """
+    def __init__(self, status, reason, message=''):
+        self.status = status
+        self.reason = reason
+        super().__init__('Kubernetes API error {} {}: {}'
+                         .format(status, reason, message))
+
+
+class KubeConfig:
+    """
+    Resolves server address and credentials of one context in a kubeconfig
+    https://kubernetes.io/docs/concepts/configuration/organize-cluster-access-kubeconfig/
+    """
+    def __init__(self, config=None, context=None):
+        """
+        Args:
+            config: kubeconfig dict or path. Defaults to the first file in
+                $KUBECONFIG, or ~/.kube/config
+            context: name of the context to use, defaults to current-context
+        """
+        if config is None:
+            config = os.environ.get('KUBECONFIG', '').split(os.pathsep)[0]
+            if not config:
+                config = '~/.kube/config'
+        if not isinstance(config, dict):
+            config = load_yaml_file(expanduser(str(config)))
+        self.config = config
+        if context is None:
+            context = config.get('current-context')
+        context_di = self._find('contexts', context)
+        self.namespace = context_di.get('namespace', 'default')
+        self.cluster = self._find('clusters', context_di['cluster'])
+        if context_di.get('user'):
+            self.user = self._find('users', context_di['user'])
+        else:
+            self.user = {}
+        self.server = self.cluster['server']
+        self._token = None
+        self._token_expiry = None
+        self._tempfiles = []
+
+    def _find(self, section, name):
+        for entry in self.config.get(section) or []:
+            if entry['name'] == name:
+                return entry[section[:-1]] or {}
+        raise ValueError('Cannot find {} "{}" in kubeconfig'
+                         .format(section[:-1], name))
+
+    def _materialize(self, di, key):
+        """
+        Returns a file path for <key> or <key>-data, since ssl only loads
+        client certificates from files
+        """
+        if di.get(key):
+            return expanduser(di[key])
+        if di.get(key + '-data'):
+            f = tempfile.NamedTemporaryFile(delete=False, suffix='.pem')
+            f.write(base64.b64decode(di[key + '-data']))
+            f.close()
+            self._tempfiles.append(f.name)
+            return f.name
+        return None
+
+    def ssl_context(self):
+        if self.cluster.get('insecure-skip-tls-verify'):
+            context = ssl._create_unverified_context()
+        else:
+            context = ssl.create_default_context()
+            if self.cluster.get('certificate-authority-data'):
+                cadata = base64.b64decode(
+                    self.cluster['certificate-authority-data']).decode('utf-8')
+                context.load_verify_locations(cadata=cadata)
+            elif self.cluster.get('certificate-authority'):
+                context.load_verify_locations(
+                    cafile=expanduser(self.cluster['certificate-authority']))
+        certfile = self._materialize(self.user, 'client-certificate')
+        keyfile = self._materialize(self.user, 'client-key')
+        if certfile:
+            context.load_cert_chain(certfile, keyfile)
+        return context
+
+    def auth_headers(self, refresh=False):
+        token = self.token(refresh=refresh)
+        if token:
+            return {'Authorization': 'Bearer ' + token}
+        if self.user.get('username'):
+            credentials = '{}:{}'.format(self.user['username'],
+                                         self.user.get('password', ''))
+            credentials = base64.b64encode(credentials.encode()).decode()
+            return {'Authorization': 'Basic ' + credentials}
+        return {}
+
+    def token(self, refresh=False):
+        """
+        Bearer token from (in order) `token`, `tokenFile`, an `exec` plugin
+        or the access token cached by the gcp auth-provider
+        """
+        if self.user.get('token'):
+            return self.user['token']
+        if self.user.get('tokenFile'):
+            with open(expanduser(self.user['tokenFile'])) as f:
+                return f.read().strip()
+        if self.user.get('exec'):
+            expired = self._token_expiry is not None and \
+                self._token_expiry <= time.time()
+            if self._token is None or refresh or expired:
+                self._run_exec_plugin()
+            return self._token
+        provider = self.user.get('auth-provider') or {}
+        return (provider.get('config') or {}).get('access-token')
+
+    def _run_exec_plugin(self):
+        spec = self.user['exec']
+        env = dict(os.environ)
+        for entry in spec.get('env') or []:
+            env[entry['name']] = entry['value']
+        out = subprocess.check_output([spec['command']] + list(spec.get('args') or []),
+                                      env=env)
+        status = json.loads(out.decode('utf-8'))['status']
+        self._token = status['token']
+        expiry = status.get('expirationTimestamp')
+        if expiry:
+            expiry = datetime.strptime(expiry, '%Y-%m-%dT%H:%M:%SZ')
+            self._token_expiry = (expiry - datetime(1970, 1, 1)).total_seconds()
+
+    def __del__(self):
+        for name in self._tempfiles:
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+
+class KubeApiClient:
+    """
+    Thread-safe client that keeps a pool of keep-alive connections
+    to the API server
+    """
+    def __init__(self, kubeconfig=None, context=None, pool_size=8, timeout=30):
+        """
+        Args:
+            kubeconfig: kubeconfig dict or path, see KubeConfig
+            context: kubeconfig context, defaults to current-context
+            pool_size: maximum number of idle connections kept open
+            timeout: socket timeout in seconds
+        """
+        if not isinstance(kubeconfig, KubeConfig):
+            kubeconfig = KubeConfig(kubeconfig, context)
+        self.kubeconfig = kubeconfig
+        self.pool_size = pool_size
+        self.timeout = timeout
+        url = urlparse(kubeconfig.server)
+        self._scheme = url.scheme
+        self._host = url.hostname
+        self._port = url.port
+        self._base_path = url.path.rstrip('/')
+        self._ssl_context = None
+        self._init_pool()
+
+    def _init_pool(self):
+        self._pool = queue.LifoQueue(maxsize=self.pool_size)
+        self._ssl_lock = threading.Lock()
+
+    def __getstate__(self):
+        # connections cannot be pickled, e.g. for launch_batch process pools
+        state = self.__dict__.copy()
+        for key in ['_pool', '_ssl_lock', '_ssl_context']:
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._ssl_context = None
+        self._init_pool()
+
+    # ==================== connections ====================
+    def _new_connection(self):
+        if self._scheme == 'https':
+            with self._ssl_lock:
+                if self._ssl_context is None:
+                    self._ssl_context = self.kubeconfig.ssl_context()
+            return http.client.HTTPSConnection(self._host, self._port,
+                                               timeout=self.timeout,
+                                               context=self._ssl_context)
+        return http.client.HTTPConnection(self._host, self._port,
+                                          timeout=self.timeout)
+
+    def _get_connection(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._new_connection()
+
+    def _release_connection(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _url(self, path, params=None):
+        url = self._base_path + '/' + path.lstrip('/')
+        if params:
+            params = {k: v for k, v in params.items() if v is not None}
+            if params:
+                url += '?' + urlencode(params)
+        return url
+
+    def open(self, method, path, params=None, body=None, headers=None):
+        """
+        Sends a request and returns (connection, response) with the response
+        body still unread, for streaming. The caller must pass both to
+        release() once the body is consumed.
+        """
+        url = self._url(path, params)
+        request_headers = {'Accept': 'application/json'}
+        request_headers.update(headers or {})
+        if body is not None and not isinstance(body, (bytes, str)):
+            body = json.dumps(body)
+            request_headers.setdefault('Content-Type', 'application/json')
+        for attempt in range(2):
+            all_headers = dict(request_headers)
+            all_headers.update(self.kubeconfig.auth_headers(refresh=attempt > 0))
+            conn = self._get_connection()
+            try:
+                conn.request(method, url, body=body, headers=all_headers)
+                response = conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                # the server may have closed an idle keep-alive connection
+                conn.close()
+                if attempt > 0:
+                    raise
+                continue
+            if response.status == 401 and attempt == 0:
+                response.read()
+                self._release_connection(conn)
+                continue
+            if response.status >= 400:
+                message = response.read().decode('utf-8', errors='replace')
+                self.release(conn, response)
+                try:
+                    message = json.loads(message).get('message', message)
+                except ValueError:
+                    pass
+                raise KubeApiError(response.status, response.reason, message)
+            return conn, response
+
+    def release(self, conn, response):
+        if response.will_close or not response.isclosed():
+            conn.close()
+        else:
+            self._release_connection(conn)
+
+    def request(self, method, path, params=None, body=None, headers=None,
+                raw=False):
+        """
+        Returns:
+            decoded JSON body, or the body string if raw is True
+        """
+        conn, response = self.open(method, path, params, body, headers)
+        try:
+            data = response.read()
+        except Exception:
+            conn.close()
+            raise
+        self.release(conn, response)
+        data = data.decode('utf-8')
+        if raw:
+            return data
+        return json.loads(data) if data else {}
+
+    def get(self, path, params=None, raw=False):
+        return self.request('GET', path, params=params, raw=raw)
+
+    def stream(self, path, params=None):
+        """
+        Generator over a newline-delimited JSON response, e.g. a watch
+        """
+        for line in self.stream_lines(path, params):
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+    def stream_lines(self, path, params=None, timeout=False):
+        """
+        Generator over the lines of a response, without the line ending
+
+        Args:
+            timeout: socket timeout while the response is read, defaults to
+                the timeout of the client. None to wait forever, e.g. for a
+                log stream that can stay idle for long
+        """
+        conn, response = self.open('GET', path, params)
+        if timeout is not False:
+            conn.sock.settimeout(timeout)
+        completed = False
+        try:
+            for line in iter(response.readline, b''):
+                yield line.decode('utf-8', errors='replace').rstrip('\r\n')
+            completed = True
+        finally:
+            if completed and timeout is not False and conn.sock is not None:
+                conn.sock.settimeout(self.timeout)
+            if completed:
+                self.release(conn, response)
+            else:
+                conn.close()
+
+    # ==================== resources ====================
+    def resource_path(self, resource, namespace=None, name=None):
+        if resource not in _RESOURCES:
+            raise ValueError('Resource type {} is not supported by the API '
+                             'transport'.format(resource))
+        prefix, plural, _, namespaced = _RESOURCES[resource]
+        path = prefix
+        if namespaced:
+            if namespace is None:
+                namespace = self.kubeconfig.namespace
+            path += '/namespaces/' + quote(namespace)
+        path += '/' + plural
+        if name is not None:
+            path += '/' + quote(name)
+        return path
+
+    def get_resources(self, resource, names=None, labels='', fields='',
+                      namespace=None):
+        """
+        Same semantics as `kubectl get <resource> -o json`:
+        a single name returns the object, otherwise a List with "items"
+        """
+        if names:
+            if len(names) == 1:
+                return self.get(self.resource_path(resource, namespace, names[0]))
+            items = [self.get(self.resource_path(resource, namespace, name))
+                     for name in names]
+            return {'apiVersion': 'v1', 'kind': 'List', 'items': items}
+        params = {}
+        if labels:
+            params['labelSelector'] = labels
+        if fields:
+            params['fieldSelector'] = fields
+        return self.get(self.resource_path(resource, namespace), params)
+
+    def resource_names(self, resource, labels='', fields='', namespace=None):
+        """
+        Same as `kubectl get <resource> -o name`
+        """
+        kind = _RESOURCES[resource][2]
+        di = self.get_resources(resource, labels=labels, fields=fields,
+                                namespace=namespace)
+        return ['{}/{}'.format(kind, item['metadata']['name'])
+                for item in di.get('items') or []]
+
+    def get_log(self, pod_name, container_name, namespace=None,
+                since=0, tail=-1, timestamps=False):
+        path, params = self._log_request(pod_name, container_name, namespace,
+                                         since, tail, timestamps)
+        return self.get(path, params, raw=True)
+
+    def stream_log(self, pod_name, container_name, namespace=None,
+                   since=0, tail=-1, timestamps=False):
+        """
+        Generator over the log lines of a container, following it until
+        the container terminates
+        """
+        path, params = self._log_request(pod_name, container_name, namespace,
+                                         since, tail, timestamps)
+        params['follow'] = 'true'
+        return self.stream_lines(path, params, timeout=None)
+
+    def _log_request(self, pod_name, container_name, namespace,
+                     since, tail, timestamps):
+        params = {'container': container_name}
+        since = parse_duration(since)
+        if since > 0:
+            params['sinceSeconds'] = since
+        if tail is not None and int(tail) >= 0:
+            params['tailLines'] = int(tail)
+        if timestamps:
+            params['timestamps'] = 'true'
+        path = self.resource_path('pod', namespace, pod_name) + '/log'
+        return path, params
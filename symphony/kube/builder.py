@@ -1,10 +1,18 @@
 import copy
 import base64
+import json
 from os import path
 from pathlib import Path
-from benedict import BeneDict
+import yaml
+from benedict import BeneDict, benedict_to_dict
 from symphony.utils.common import merge_dict, strip_repository_name
 
+try:
+    # libyaml emitter, much faster than the pure python one
+    from yaml import CDumper as _FastDumper
+except ImportError:
+    from yaml import Dumper as _FastDumper
+
 
 class KubeConfigYML(object):
     def __init__(self):
@@ -22,15 +30,31 @@ class KubeConfigYML(object):
         """
         return self.data.dump_yaml_str()
 
+    def render(self, format='yaml', fast=False):
+        """
+        Args:
+            format, fast: see render_data
+        """
+        if format == 'yaml' and not fast:
+            return self.yml()
+        return render_data(self.data, format, fast)
+
 
-"""apiVersion: v1
-kind: Secret
-metadata:
-  name: mysecret
-type: Opaque
-data:
-  username: YWRtaW4=
-  password: MWYyZDFlMmU2N2Rm"""
+def render_data(data, format='yaml', fast=False):
+    """
+    Args:
+        data: dict of one kubernetes object
+        format: 'yaml' or 'json'
+        fast: dump yaml with libyaml if available, same output otherwise
+    """
+    if format == 'json':
+        return json.dumps(data)
+    if format != 'yaml':
+        raise ValueError('Unknown format "{}", use yaml or json'.format(format))
+    if isinstance(data, BeneDict):
+        data = benedict_to_dict(data)
+    return yaml.dump(data, Dumper=_FastDumper if fast else yaml.Dumper,
+                     indent=2, default_flow_style=False)
 
 
 class KubeSecret(KubeConfigYML):
@@ -62,6 +86,20 @@ class KubeSecret(KubeConfigYML):
             })
 
 
+class KubeConfigMap(KubeConfigYML):
+    def __init__(self, name, data):
+        super().__init__()
+        self.name = name
+        self.data = BeneDict({
+            'apiVersion': 'v1',
+            'kind': 'ConfigMap',
+            'metadata': {
+                'name': name,
+            },
+            'data': {k: str(v) for k, v in data.items()},
+            })
+
+
 class KubeService(KubeConfigYML):
     def __init__(self, name):
         super().__init__()
@@ -317,11 +355,13 @@ class KubeContainerYML(KubeConfigYML):
         })
         self.mounted_volumes = []
         self.pod_yml = None
+        self._env_index = None
 
     @classmethod
     def load(cls, di):
         instance = cls('', '')
         instance.data = BeneDict(di['data'])
+        instance._env_index = None
         instance.mounted_volumes = [KubeVolume.load(x) for x in di['mounted_volumes']]
         return instance
 
@@ -340,16 +380,29 @@ class KubeContainerYML(KubeConfigYML):
     def set_env(self, name, value):
         name = str(name)
         value = str(value)
-        for entry in self.data['env']:
-            if entry.name == name:
-                entry.value = value
-                return
-        self.data.env.append(BeneDict({'name': name, 'value': value}))
+        env = self.data['env']
+        # name -> entry of data.env, rebuilt if data.env was edited directly
+        if self._env_index is None or len(self._env_index) != len(env):
+            self._env_index = {entry.name: entry for entry in env}
+        if name in self._env_index:
+            self._env_index[name].value = value
+            return
+        entry = BeneDict({'name': name, 'value': value})
+        env.append(entry)
+        self._env_index[name] = entry
 
     def set_envs(self, di):
         for k, v in di.items():
             self.set_env(k, v)
 
+    def add_env_from(self, config_map_name):
+        """
+        Sets every key of the config map as an environment variable
+        """
+        env_from = self.data.get('envFrom', [])
+        env_from.append(BeneDict({'configMapRef': {'name': config_map_name}}))
+        self.data['envFrom'] = env_from
+
     def mount_volume(self, volume, mount_path):
         assert isinstance(volume, KubeVolume)
         volume_mounts = self.data.get('volumeMounts', [])
@@ -1,66 +1,227 @@
 import shlex
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
 from datetime import datetime
-from pathlib import Path
 from collections import OrderedDict
 from benedict import BeneDict
 from benedict.data_format import load_yaml_str, load_json_str
 from symphony.engine import Cluster
 from symphony.addons import LocalFileManager
-from symphony.utils.common import check_valid_dns, is_sequence
+from symphony.utils.common import check_valid_dns, is_sequence, print_err
 import symphony.utils.runner as runner
 from .experiment import KubeExperimentSpec
+from . import manifest
+from .api_client import KubeApiClient, KubeApiError
+from .informer import PodInformer
+from .namespace_deletion import NamespaceDeletion
+from .log_stream import LogStream
 
 
 _RESERVED_NS = ['default', 'kube-public', 'kube-system']
+_TRANSPORTS = ['kubectl', 'api']
+_WATCH_TIMEOUT = 300
+# seconds to wait for the first list of a PodInformer
+_SYNC_TIMEOUT = 30
 
 
 class KubeCluster(Cluster):
-    def __init__(self):
+    multi_process_logs = True
+
+    def __init__(self, transport='kubectl', kubeconfig=None, context=None,
+                 pod_cache=False):
+        """
+        Args:
+            transport: how queries reach the cluster
+              - kubectl: fork a `kubectl` process per query
+              - api: talk to the API server over pooled keep-alive connections
+            kubeconfig: kubeconfig path or dict for the api transport,
+                defaults to $KUBECONFIG or ~/.kube/config
+            context: kubeconfig context for the api transport,
+                defaults to current-context
+            pod_cache: serve describe_* from a PodInformer that watches the
+                experiment namespace instead of listing pods on every call
+        """
         super().__init__()
+        assert transport in _TRANSPORTS, \
+            'transport must be one of {}'.format(_TRANSPORTS)
         self.fs = LocalFileManager()
+        self.transport = transport
+        self._kubeconfig = kubeconfig
+        self._context = context
+        self._api_client = None
+        self.pod_cache = pod_cache
+        self._informers = {}
+        self._informers_lock = threading.Lock()
+
+    def __getstate__(self):
+        # informer threads stay with the process that started them
+        state = self.__dict__.copy()
+        state['_informers'] = {}
+        del state['_informers_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._informers_lock = threading.Lock()
+
+    @property
+    def api(self):
+        """
+        Lazily created KubeApiClient for the api transport
+        """
+        if self._api_client is None:
+            self._api_client = KubeApiClient(self._kubeconfig, self._context)
+        return self._api_client
 
     def new_experiment(self, *args, **kwargs):
         return KubeExperimentSpec(*args, **kwargs)
 
     def launch(self, experiment_spec, force=False, dry_run=False):
+        """
+        Args:
+            force: relaunch an experiment that was launched before. Only the
+                objects changed since the last launch are applied, with
+                server-side apply, the other pods keep running. Changed pods
+                and jobs are replaced. Without an experiment folder to diff
+                against, every object is applied and the cluster skips
+                the unchanged ones
+        """
         print('launching', experiment_spec.name)
-        launch_plan = experiment_spec.compile()
 
         if dry_run:
-            print(launch_plan)
+            experiment_spec.write_manifest(sys.stdout)
         else:
             # TODO: some of them should be shared
             if self.fs.has_experiment_folder():
-                if not force and self.fs.experiment_exists(experiment_spec.name):
+                exists = self.fs.experiment_exists(experiment_spec.name)
+                if not force and exists:
                     raise ValueError('[Error] Experiment {} already exists'.format(experiment_spec.name))
-                experiment_file = Path(self.fs.save_experiment(experiment_spec))
-                experiment_folder = experiment_file.parent
+                experiment_folder = self.fs.experiment_path(experiment_spec.name)
+                # the index is stale if the experiment was deleted since
+                running = exists and self._namespace_exists(experiment_spec.name)
+                old_index = manifest.load_index(experiment_folder) if running else None
                 launch_plan_file = experiment_folder / 'kube.yml'
                 with launch_plan_file.open('w') as f:
-                    f.write(launch_plan)
-                #TODO: persist yaml file
-                runner.run_verbose('kubectl create namespace ' + experiment_spec.name)
-                runner.run_verbose('kubectl create -f "{}" --namespace {}'.format(launch_plan_file, experiment_spec.name))
+                    diff = manifest.diff_manifest(
+                        old_index, experiment_spec.iter_objects(fast=True), f,
+                        existing=running)
+                # saved once compiled, with its services and ports
+                self.fs.save_experiment(experiment_spec)
+                if running:
+                    self._apply_diff(experiment_spec.name, diff)
+                else:
+                    runner.run_verbose('kubectl create namespace ' + experiment_spec.name)
+                    runner.run_verbose('kubectl create -f "{}" --namespace {}'.format(launch_plan_file, experiment_spec.name))
+                manifest.save_index(experiment_folder, diff.index)
+                self.set_experiment(experiment_spec.name)
+            elif force:
+                self._server_side_apply(experiment_spec.name,
+                                        lambda f: experiment_spec.write_manifest(f, fast=True))
                 self.set_experiment(experiment_spec.name)
             else:
                 runner.run_verbose('kubectl create namespace ' + experiment_spec.name)
-                runner.run_verbose('kubectl create -f - --namespace {}'.format(experiment_spec.name), stdin=launch_plan)
+                runner.run_verbose('kubectl create -f - --namespace {}'.format(experiment_spec.name),
+                                   stdin=lambda f: experiment_spec.write_manifest(f, fast=True))
                 self.set_experiment(experiment_spec.name)
 
+    def _apply_diff(self, namespace, diff):
+        """
+        Deletes the removed and replaced objects of diff, then applies
+        its changed objects
+        """
+        to_delete = diff.deleted + diff.replaced
+        if to_delete:
+            runner.run_verbose('kubectl delete --ignore-not-found --namespace {} {}'
+                               .format(namespace, ' '.join(to_delete)))
+        if diff.changed:
+            def write_changed(f):
+                for _, document in diff.changed:
+                    f.write('---\n')
+                    f.write(document)
+            self._server_side_apply(namespace, write_changed)
+        print(diff.summary())
+
+    def _namespace_exists(self, namespace):
+        if self.transport == 'api':
+            try:
+                self.api.get(self.api.resource_path('namespace', name=namespace))
+            except KubeApiError as e:
+                if e.status == 404:
+                    return False
+                raise
+            return True
+        out, _, _ = runner.run_verbose(
+            'kubectl get namespace {} --ignore-not-found -o name'.format(namespace),
+            print_out=False, raise_on_error=True)
+        return bool(out)
+
+    def _server_side_apply(self, namespace, write_manifest):
+        """
+        Args:
+            write_manifest: writes the objects to apply to the file it is given
+        """
+        # creates the namespace unless it exists
+        runner.run_verbose('kubectl create namespace {} --dry-run=client -o yaml '
+                           '| kubectl apply -f -'.format(namespace), print_out=False)
+        runner.run_verbose('kubectl apply --server-side --force-conflicts '
+                           '--field-manager=symphony -f - --namespace {}'.format(namespace),
+                           stdin=write_manifest)
+
     # ========================================================
     # ===================== Action API =======================
     # ========================================================
 
     def delete(self, experiment_name):
-        assert experiment_name not in _RESERVED_NS, \
-            'cannot delete reserved names: default, kube-public, kube-system'
-        check_valid_dns(experiment_name)
+        self._check_deletable(experiment_name)
         runner.run_verbose(
             'kubectl delete namespace {}'.format(experiment_name),
             print_out=True, raise_on_error=False)
 
-    # def delete_batch(self, experiments):
+    def delete_batch(self, experiment_names):
+        """
+        Requests the deletion of all experiments at once and returns without
+        waiting for their namespaces to terminate
+
+        Returns:
+            NamespaceDeletion, call its wait() to block until the namespaces
+            are gone
+        """
+        experiment_names = list(experiment_names)
+        for name in experiment_names:
+            self._check_deletable(name)
+        if experiment_names:
+            if self.transport == 'api':
+                self._api_delete_namespaces(experiment_names)
+            else:
+                runner.run_verbose(
+                    'kubectl delete namespace --wait=false --ignore-not-found '
+                    + ' '.join(experiment_names),
+                    print_out=True, raise_on_error=False)
+        return NamespaceDeletion(
+            experiment_names,
+            list_func=lambda: self._list_path('/api/v1/namespaces'),
+            watch_func=lambda rv, timeout_seconds: self._watch_path(
+                '/api/v1/namespaces', rv, timeout_seconds))
+
+    def _api_delete_namespaces(self, names):
+        def _delete(name):
+            try:
+                self.api.request('DELETE', self.api.resource_path('namespace',
+                                                                  name=name))
+            except KubeApiError as e:
+                if e.status != 404:
+                    print_err(e)
+        # the client keeps at most pool_size idle connections
+        with ThreadPoolExecutor(max_workers=self.api.pool_size) as pool:
+            list(pool.map(_delete, names))
+
+    def _check_deletable(self, experiment_name):
+        assert experiment_name not in _RESERVED_NS, \
+            'cannot delete reserved names: default, kube-public, kube-system'
+        check_valid_dns(experiment_name)
 
     def transfer_file(self, experiment_name, src_path, dest_path,
                       src_process=None, src_process_group=None,
@@ -138,10 +299,15 @@ class KubeCluster(Cluster):
             }
         }
         """
+        if self.pod_cache:
+            return self._describe_pods(self.pod_informer(experiment_name).pods())
         all_processes = BeneDict(self.query_resources('pod', output_format='json',
                                                       namespace=experiment_name))
+        return self._describe_pods(all_processes.items)
+
+    def _describe_pods(self, pods):
         out = OrderedDict()
-        for pod in all_processes.items:
+        for pod in pods:
             pod_name = pod.metadata.name
             if 'containerStatuses' in pod.status: # Pod is created
                 container_statuses = self._parse_container_statuses(
@@ -240,9 +406,12 @@ class KubeCluster(Cluster):
             'p2': {'status': 'dead'}
         }
         """
-        res = self.query_resources('pod', names=[process_group_name],
-                                   output_format='json',
-                                   namespace=experiment_name)
+        if self.pod_cache:
+            res = self.pod_informer(experiment_name).get(process_group_name)
+        else:
+            res = self.query_resources('pod', names=[process_group_name],
+                                       output_format='json',
+                                       namespace=experiment_name)
         if not res:
             raise ValueError('Cannot find process_group {} in experiment {}' \
                 .format(process_group_name, experiment_name))
@@ -266,11 +435,42 @@ class KubeCluster(Cluster):
 
     def get_log(self, experiment_name, process_name, process_group=None,
                 follow=False, since=0, tail=500, print_logs=False):
+        """
+        Args:
+            process_name: None for the logs of every process in
+                process_group, or in the whole experiment if process_group
+                is None too. Their lines are prefixed with the process name
+                and merged by timestamp, see log_stream()
+        """
+        if process_name is None:
+            stream = self.log_stream(experiment_name, process_group,
+                                     since=since, tail=tail)
+            if follow:
+                for line in stream.follow():
+                    print(line, flush=True)
+                return
+            out = '\n'.join(stream.lines())
+            if print_logs:
+                print(out)
+            return out
+
         if process_group is None:
             pod_name, container_name = process_name, process_name
         else:
             pod_name, container_name = process_group, process_name
 
+        if self.transport == 'api' and not follow:
+            try:
+                out = self.api.get_log(pod_name, container_name,
+                                       namespace=experiment_name,
+                                       since=since, tail=tail)
+            except KubeApiError as e:
+                print_err(e)
+                return ''
+            if print_logs:
+                print(out)
+            return out
+
         cmd = self._get_logs_cmd(
             pod_name, process_name, follow=follow,
             since=since, tail=tail, namespace=experiment_name
@@ -288,6 +488,58 @@ class KubeCluster(Cluster):
             else:
                 return out
 
+    def log_stream(self, experiment_name, process_group=None,
+                   since=0, tail=500, **kwargs):
+        """
+        Logs of every process in process_group, or in the whole experiment
+        if process_group is None. Pending pods are skipped.
+
+        Args:
+            **kwargs: max_workers, buffer_size, merge_window, see LogStream
+
+        Returns:
+            LogStream, lines() to get the logs, follow() to stream them
+        """
+        containers = []
+        for pg, processes in self.describe_experiment(experiment_name).items():
+            if process_group is not None and pg != process_group:
+                continue
+            for process_name in processes:
+                if process_name == '~':  # pod not created yet
+                    continue
+                if pg is None:
+                    containers.append((process_name, process_name, process_name))
+                else:
+                    containers.append((pg, process_name,
+                                       '{}/{}'.format(pg, process_name)))
+        if process_group is not None and not containers:
+            raise ValueError('Cannot find process_group {} in experiment {}'
+                             .format(process_group, experiment_name))
+
+        def fetch(pod_name, container_name):
+            if self.transport == 'api':
+                return self.api.get_log(pod_name, container_name,
+                                        namespace=experiment_name,
+                                        since=since, tail=tail, timestamps=True)
+            cmd = self._get_logs_cmd(pod_name, container_name, follow=False,
+                                     since=since, tail=tail,
+                                     namespace=experiment_name, timestamps=True)
+            out, _, _ = runner.run_verbose(cmd, print_out=False,
+                                           raise_on_error=True)
+            return out
+
+        def stream(pod_name, container_name):
+            if self.transport == 'api':
+                return self.api.stream_log(pod_name, container_name,
+                                           namespace=experiment_name,
+                                           since=since, tail=tail,
+                                           timestamps=True)
+            return runner.stream_lines(self._get_logs_cmd(
+                pod_name, container_name, follow=True, since=since, tail=tail,
+                namespace=experiment_name, timestamps=True))
+
+        return LogStream(containers, fetch, stream, **kwargs)
+
     def get_log_when_alive(self,
                            experiment_name, process_name, process_group=None,
                            follow=False, since=0, tail=500, print_logs=False,
@@ -296,31 +548,141 @@ class KubeCluster(Cluster):
         Wait until the pod is alive and then the same as get_log()
 
         Args:
-            sleep_interval: interval between queries
+            sleep_interval: interval between queries, or between progress
+                messages with pod_cache, which wakes up as soon as the pod
+                is ready
         """
+        if self.pod_cache:
+            stat = self._wait_alive_cached(experiment_name, process_name,
+                                           process_group, sleep_interval)
+        else:
+            stat = self._wait_alive_polling(experiment_name, process_name,
+                                            process_group, sleep_interval)
+        if int(stat['Restarts']) > 0:
+            print('Container has a restart. There is probably something wrong. Exiting.')
+            return
+        # pod is alive
+        return self.get_log(
+            experiment_name=experiment_name,
+            process_name=process_name,
+            process_group=process_group,
+            follow=follow, since=since, tail=tail, print_logs=print_logs
+        )
+
+    def _is_alive_or_restarted(self, stat):
+        return (stat['Ready'] == '1' and stat['State'].startswith('running')) \
+            or int(stat['Restarts']) > 0
+
+    def _wait_alive_polling(self, experiment_name, process_name, process_group,
+                            sleep_interval):
         while True:
             stats_dict = self.describe_experiment(experiment_name)
             try:
                 stat = stats_dict[process_group][process_name]
-            except KeyError as e:
+            except KeyError:
                 print("Waiting for pod and container creation.")
                 time.sleep(sleep_interval)
                 continue
-                # raise KeyError('process_group or process_name not found: {}'.format(e))
-
-            if stat['Ready'] == '1' and stat['State'].startswith('running'):
-                # pod is alive
-                return self.get_log(
-                    experiment_name=experiment_name,
-                    process_name=process_name,
-                    process_group=process_group,
-                    follow=follow, since=since, tail=tail, print_logs=print_logs
-                )
-            if int(stat['Restarts']) > 0:
-                print('Container has a restart. There is probably something wrong. Exiting.')
-                return
+            if self._is_alive_or_restarted(stat):
+                return stat
             time.sleep(sleep_interval)
 
+    def _wait_alive_cached(self, experiment_name, process_name, process_group,
+                           sleep_interval):
+        pod_name = process_name if process_group is None else process_group
+        with self._informers_lock:
+            informer = self._informers.get(experiment_name)
+            started_here = informer is None or not informer.is_alive()
+        informer = self.pod_informer(experiment_name)
+
+        def _alive_or_restarted(pods):
+            if pod_name not in pods:
+                return None
+            pod = pods[pod_name]
+            if 'containerStatuses' not in pod.status:
+                return None
+            statuses = self._parse_container_statuses(pod.status.containerStatuses)
+            stat = statuses.get(process_name)
+            if stat is None or not self._is_alive_or_restarted(stat):
+                return None
+            return stat
+
+        try:
+            stat = informer.wait_for(_alive_or_restarted, timeout=sleep_interval)
+            while stat is None:
+                print("Waiting for pod and container creation.")
+                stat = informer.wait_for(_alive_or_restarted, timeout=sleep_interval)
+            return stat
+        finally:
+            # leave running only the informers someone else started
+            if started_here:
+                self.stop_pod_informer(experiment_name)
+
+    def pod_informer(self, experiment_name, timeout=_SYNC_TIMEOUT):
+        """
+        Returns a synced PodInformer that caches the pods of the experiment.
+        The informer is started on first use and shared afterwards.
+
+        Args:
+            timeout: seconds to wait for the first list of the pods,
+                None to wait forever
+        """
+        with self._informers_lock:
+            informer = self._informers.get(experiment_name)
+            if informer is None or not informer.is_alive():
+                informer = PodInformer(
+                    experiment_name,
+                    list_func=lambda: self._list_pods(experiment_name),
+                    watch_func=lambda rv: self._watch_pods(experiment_name, rv))
+                informer.start()
+                self._informers[experiment_name] = informer
+        if not informer.wait_until_synced(timeout):
+            self.stop_pod_informer(experiment_name)
+            raise RuntimeError('Cannot list the pods of experiment {} within {}s'
+                               .format(experiment_name, timeout))
+        return informer
+
+    def stop_pod_informer(self, experiment_name):
+        with self._informers_lock:
+            informer = self._informers.pop(experiment_name, None)
+        if informer is not None:
+            informer.stop()
+
+    def stop_pod_informers(self):
+        with self._informers_lock:
+            for informer in self._informers.values():
+                informer.stop()
+            self._informers = {}
+
+    def _list_pods(self, namespace):
+        return self._list_path('/api/v1/namespaces/{}/pods'.format(namespace))
+
+    def _watch_pods(self, namespace, resource_version,
+                    timeout_seconds=_WATCH_TIMEOUT):
+        return self._watch_path('/api/v1/namespaces/{}/pods'.format(namespace),
+                                resource_version, timeout_seconds)
+
+    def _list_path(self, path):
+        if self.transport == 'api':
+            return self.api.get(path)
+        # `kubectl get -o json` drops the resourceVersion of the list
+        out, _, _ = runner.run_verbose('kubectl get --raw ' + shlex.quote(path),
+                                       print_out=False, raise_on_error=True)
+        return load_json_str(out)
+
+    def _watch_path(self, path, resource_version,
+                    timeout_seconds=_WATCH_TIMEOUT):
+        params = {
+            'watch': 1,
+            'resourceVersion': resource_version,
+            'allowWatchBookmarks': 'true',
+            'timeoutSeconds': timeout_seconds,
+        }
+        if self.transport == 'api':
+            return self.api.stream(path, params)
+        return runner.stream_json_lines(
+            'kubectl get --raw ' + shlex.quote(path + '?' + urlencode(params)))
+
     def external_url(self, experiment_name, service_name):
         res = BeneDict(self.query_resources(
                         'svc', 'yaml',
@@ -418,6 +780,16 @@ class KubeCluster(Cluster):
         """
         if names and (labels or fields):
             raise ValueError('names and (labels or fields) are mutually exclusive')
+        if self.transport == 'api':
+            if output_format in ['json', 'yaml']:
+                return self.api.get_resources(resource, names=names,
+                                              labels=labels, fields=fields,
+                                              namespace=namespace)
+            elif output_format == 'name' and not names:
+                return self.api.resource_names(resource, labels=labels,
+                                               fields=fields,
+                                               namespace=namespace)
+            # other output formats are rendered by kubectl
         cmd = 'kubectl get ' + resource
         cmd += self._get_ns_cmd(namespace)
         if names is None:
@@ -495,12 +867,13 @@ class KubeCluster(Cluster):
             return ''
 
     def _get_logs_cmd(self, pod_name, container_name,
-                      follow, namespace, since=0, tail=-1):
-        return 'kubectl logs {} {} {} --since={} --tail={}{}'.format(
+                      follow, namespace, since=0, tail=-1, timestamps=False):
+        return 'kubectl logs {} {} {} --since={} --tail={}{}{}'.format(
             pod_name,
             container_name,
             '--follow' if follow else '',
             since,
             tail,
+            ' --timestamps' if timestamps else '',
             self._get_ns_cmd(namespace)
         )
@@ -1,25 +1,28 @@
-import copy
+import io
 from symphony.spec import ExperimentSpec
-from symphony.engine.address_book import AddressBook
+from symphony.engine.port_allocator import PortAllocator
 from symphony.utils.common import compact_range_dumps, compact_range_loads
 from symphony.utils.common import sanitize_name_kubernetes
-from .process import KubeProcessSpec
+from .process import KubeProcessSpec, KubeReplicatedProcessSpec
 from .process_group import KubeProcessGroupSpec
 from .builder import (
     KubeIntraClusterService,
     KubeCloudExternelService,
-    KubeSecret
+    KubeSecret,
+    KubeConfigMap
     )
 
 
 class KubeExperimentSpec(ExperimentSpec):
     _ProcessClass = KubeProcessSpec
     _ProcessGroupClass = KubeProcessGroupSpec
+    _ADDRESS_BOOK_NAME = 'symph-address-book'
 
     def __init__(self,
                  name,
                  port_range=None,
-                 secrets=None):
+                 secrets=None,
+                 shared_env=False):
         """
         Creates an experiment on kubernetes
 
@@ -27,6 +30,9 @@ class KubeExperimentSpec(ExperimentSpec):
             name: name of experiments
             port_range: range of port numbers to assign (default: 7000-9000)
             secrets: list of files to mount as secrets (default: {None})
+            shared_env: publish the address book as one ConfigMap that every
+                container loads with envFrom, instead of copying it into
+                the env of every container (default: {False})
         """
         name = sanitize_name_kubernetes(name)
         super().__init__(name)
@@ -35,37 +41,153 @@ class KubeExperimentSpec(ExperimentSpec):
         if secrets is None:
             secrets = []
         self.port_range = port_range
+        self._ports = PortAllocator(port_range)
         self.binded_services = {}
         self.exposed_services = {}
         self.secrets = secrets
+        self.shared_env = shared_env
+        # component name -> (component, rendered yml)
+        self._rendered = {}
+        self._secret_mounted = set()
 
-    def _compile(self):
-        self.address_book = AddressBook()
+    def new_replicas(self, name, num_replicas, **kwargs):
+        """
+        Declares num_replicas identical processes from a single spec,
+        rendered from it at compile time. Compile cost does not grow with
+        the number of replicas for mode='indexed-job'.
+
+        Args:
+            kwargs: see KubeReplicatedProcessSpec
+
+        Returns:
+            KubeReplicatedProcessSpec
+        """
+        process = KubeReplicatedProcessSpec(name, num_replicas, **kwargs)
+        self.add_process(process)
+        return process
 
-        self.declare_services()
-        self.assign_addresses()
+    def _components(self):
+        """
+        Declares services and assigns addresses of the processes changed
+        since the last compile
+
+        Returns:
+            list of (component name, component, dirty) in launch order
+        """
+        if self._services_changed:
+            self.declare_services(self._list_dirty_processes())
+        config_map = self.assign_addresses()
         secrets = self.add_secret()
 
-        components = {}
+        dirty = set(self._list_dirty_processes())
+        dirty.update(self._list_dirty_process_groups())
+        components = []
         if secrets is not None:
-            components['secrets'] = secrets.yml()
+            components.append(('secrets', secrets, True))
+        if config_map is not None:
+            components.append(('address-book', config_map, True))
         for k, v in self.exposed_services.items():
-            components['exposed-service-' + k] = v.yml()
+            components.append(('exposed-service-' + k, v, False))
         for k, v in self.binded_services.items():
-            components['binded-service-' + k] = v.yml()
-
+            components.append(('binded-service-' + k, v, False))
         for process_group in self.list_process_groups():
-            components['process-group-' + process_group.name] = process_group.yml()
+            components.append(('process-group-' + process_group.name,
+                               process_group, process_group in dirty))
         for process in self.list_processes():
-            components['process-' + process.name] = process.yml()
-
+            components.append(('process-' + process.name, process,
+                               process in dirty))
+        self._clear_dirty()
         return components
 
-    def compile(self):
-        components = self._compile()
-        return ''.join(['---\n' + x for x in components.values()])
+    def _compile(self):
+        """
+        Only the processes and process groups changed since the last compile
+        are looked at again and re-rendered, the other components are reused
+        """
+        return {key: self._render(key, component, dirty)
+                for key, component, dirty in self._components()}
+
+    def _render(self, key, component, dirty=False):
+        """
+        Returns:
+            component.yml(), cached until the component is dirty or replaced
+        """
+        cached = self._rendered.get(key)
+        if dirty or cached is None or cached[0] is not component:
+            cached = (component, component.yml())
+            self._rendered[key] = cached
+        return cached[1]
+
+    def iter_objects(self, format='yaml', fast=False):
+        """
+        Yields (<kind>/<name>, document) for the objects of the launch
+        manifest one at a time
+
+        Args:
+            format: 'yaml' or 'json'
+            fast: dump yaml with libyaml if available. Only the default
+                yaml output is cached between compiles
+        """
+        for key, component, dirty in self._components():
+            if dirty and (format != 'yaml' or fast or
+                          isinstance(component, KubeReplicatedProcessSpec)):
+                # not re-rendered into the cache below
+                self._rendered.pop(key, None)
+            if isinstance(component, KubeReplicatedProcessSpec):
+                yield from component.iter_objects(format, fast)
+                continue
+            yml_object = component
+            if isinstance(component, (KubeProcessSpec, KubeProcessGroupSpec)):
+                yml_object = component.pod_yml
+            name = '{}/{}'.format(yml_object.data['kind'],
+                                  yml_object.data['metadata']['name'])
+            if format == 'yaml' and not fast:
+                yield name, self._render(key, component, dirty)
+            else:
+                yield name, yml_object.render(format, fast)
+
+    def iter_documents(self, format='yaml', fast=False):
+        """
+        Yields the documents of the launch manifest one at a time,
+        see iter_objects
+        """
+        for _, document in self.iter_objects(format, fast):
+            yield document
+
+    def write_manifest(self, f, format='yaml', fast=False):
+        """
+        Streams the launch manifest to the text file f, e.g. kubectl's stdin.
+        json is written as one kubernetes List
+
+        Args:
+            format, fast: see iter_documents
+        """
+        if format == 'json':
+            f.write('{"apiVersion": "v1", "kind": "List", "items": [\n')
+            for i, document in enumerate(self.iter_documents(format, fast)):
+                if i > 0:
+                    f.write(',\n')
+                f.write(document)
+            f.write('\n]}\n')
+        else:
+            for document in self.iter_documents(format, fast):
+                f.write('---\n')
+                f.write(document)
+
+    def compile(self, format='yaml', fast=False):
+        """
+        Returns:
+            the launch manifest as one string, see write_manifest
+        """
+        f = io.StringIO()
+        self.write_manifest(f, format, fast)
+        return f.getvalue()
 
     def assign_addresses(self):
+        """
+        Returns:
+            KubeConfigMap of the address book if shared_env, else None
+        """
         for exposed_service_name in self.exposed_services:
             exposed_service = self.exposed_services[exposed_service_name]
             self.address_book.add_entry(exposed_service.name,
@@ -76,18 +198,29 @@ class KubeExperimentSpec(ExperimentSpec):
             self.address_book.add_entry(binded_service.name,
                                         binded_service.name,
                                         binded_service.port)
-        env_dict = self.address_book.dump()
-        for process in self.list_all_processes():
-            process.set_envs(env_dict)
+        if not self.shared_env:
+            self._push_envs(self.address_book.dump())
+            return None
+        for process in self._list_dirty_processes():
+            if process.name not in self._env_processes:
+                process.add_env_from(self._ADDRESS_BOOK_NAME)
+                self._env_processes.add(process.name)
+        return KubeConfigMap(self._ADDRESS_BOOK_NAME, self.address_book.dump())
 
-    def declare_services(self):
+    def declare_services(self, processes=None):
         """
-            Loop through all processes and assign addresses for all declared ports
+            Loop through processes and assign addresses for all newly declared ports
+
+            Args:
+                processes: defaults to all processes
         """
+        if processes is None:
+            processes = self.list_all_processes()
         exposed = {}
         binded = {}
-        port_range = copy.deepcopy(self.port_range)
-        for process in self.list_all_processes():
+        # (services, name, port) of the ports that were already taken
+        conflicts = []
+        for process in processes:
             if process.standalone:
                 pod_yml = process.pod_yml
             else:
@@ -96,64 +229,121 @@ class KubeExperimentSpec(ExperimentSpec):
             for exposed_service_name in process.exposed_services:
                 pod_yml.add_label('service-' + exposed_service_name, 'expose')
                 port = process.exposed_services[exposed_service_name]
+                if exposed_service_name in self.exposed_services:
+                    if port is None:
+                        continue
+                    self._ports.release(self.exposed_services[exposed_service_name].port)
                 exposed[exposed_service_name] = port
-                if port in self.port_range:
-                    port_range.remove(port)
+                if port is not None and not self._ports.reserve(port):
+                    conflicts.append((exposed, exposed_service_name, port))
 
             for binded_service_name in process.binded_services:
                 pod_yml.add_label('service-' + binded_service_name, 'bind')
                 port = process.binded_services[binded_service_name]
+                if binded_service_name in self.binded_services:
+                    if port is None:
+                        continue
+                    self._ports.release(self.binded_services[binded_service_name].port)
                 binded[binded_service_name] = port
-                if port in self.port_range:
-                    port_range.remove(port)
+                if port is not None and not self._ports.reserve(port):
+                    conflicts.append((binded, binded_service_name, port))
+
+        for services, name, port in conflicts:
+            self._resolve_port_conflict(services, name, port, exposed, binded)
 
         for exposed_service_name, port in exposed.items():
             if port is None:
-                port = self.get_port(port_range)
+                port = self.get_port()
             service = KubeCloudExternelService(exposed_service_name, port)
             self.exposed_services[service.name] = service
         for binded_service_name, port in binded.items():
             if port is None:
-                port = self.get_port(port_range)
+                port = self.get_port()
             service = KubeIntraClusterService(binded_service_name, port)
             self.binded_services[service.name] = service
-        self.validate_connect()
+        self.validate_connect(processes)
+
+    def _resolve_port_conflict(self, services, name, port, exposed, binded):
+        """
+        Called when the port pinned by a service is already taken. A
+        service declared before that did not ask for the port gets a new
+        one and its processes are marked dirty
+
+        Args:
+            services: exposed or binded, the one name belongs to
+            exposed, binded: ports declared in this compile, by service name
+
+        Raises:
+            ValueError if another service asks for the port as well
+        """
+        if port not in self._ports or self._ports.reserve(port):
+            # outside of the range, or given back later in the loop
+            return
+        for new, existing, attr in [(exposed, self.exposed_services, 'exposed_services'),
+                                    (binded, self.binded_services, 'binded_services')]:
+            for other_name, other_port in new.items():
+                if other_port == port and (new is not services or other_name != name):
+                    raise ValueError('Services {} and {} both ask for port {}'
+                                     .format(other_name, name, port))
+            for other_name, service in existing.items():
+                if service.port != port or other_name in new:
+                    continue
+                holders = [process for process in self.list_all_processes()
+                           if other_name in getattr(process, attr)]
+                if any(getattr(process, attr)[other_name] is not None
+                       for process in holders):
+                    raise ValueError('Services {} and {} both ask for port {}'
+                                     .format(other_name, name, port))
+                # gets a new port below
+                new[other_name] = None
+                for process in holders:
+                    process.mark_dirty()
+                return
 
     def add_secret(self):
         default_secret_name = 'symph-default-secret'
         if len(self.secrets) > 0:
             for process in self.list_all_processes():
+                if process.name in self._secret_mounted:
+                    continue
                 process.mount_secret(secret_name=default_secret_name,
                                      mount_path='/etc/secrets')
+                self._secret_mounted.add(process.name)
             return KubeSecret.from_files(
                         default_secret_name,
                         files=self.secrets)
         else:
             return None
 
-    def validate_connect(self):
+    def validate_connect(self, processes=None):
         """
         Check if all connected services are correctly provided
         """
-        for process in self.list_all_processes():
+        if processes is None:
+            processes = self.list_all_processes()
+        for process in processes:
             for connected_service_name in process.connected_services:
                 if connected_service_name not in self.binded_services:
                     raise ValueError('Service {} is connected by process {} but not binded' \
                                      .format(connected_service_name, process.name))
 
-    def get_port(self, port_range):
-        if len(port_range) == 0:
+    def get_port(self):
+        port = self._ports.allocate()
+        if port is None:
             raise ValueError('[Error] Experiment {} ran out of ports on Kubernetes.' \
                              .format(self.name))
-        return port_range.pop(0)
+        return port
 
     def _load_dict(self, di):
         super()._load_dict(di)
         self.port_range = compact_range_loads(di['port_range'])
+        self._ports = PortAllocator(self.port_range)
         self.secrets = di['secrets']
+        self.shared_env = di.get('shared_env', False)
 
     def dump_dict(self):
         data = super().dump_dict()
         data['port_range'] = compact_range_dumps(self.port_range)
         data['secrets'] = self.secrets
+        data['shared_env'] = self.shared_env
         return data
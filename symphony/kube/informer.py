@@ -0,0 +1,131 @@
+"""
+Informer-style local cache of the pods in a namespace.
+Does one list, then follows a resourceVersion-based watch stream to keep the
+cache up to date, and relists whenever the watch is lost.
+https://kubernetes.io/docs/reference/using-api/api-concepts/#efficient-detection-of-changes
+"""
+import time
+import threading
+from benedict import BeneDict
+from symphony.utils.common import print_err
+from symphony.utils.threads import StoppableThread
+
+
+class _WatchExpired(Exception):
+    pass
+
+
+class PodInformer(StoppableThread):
+    def __init__(self, namespace, list_func, watch_func, resync_backoff=1.):
+        """
+        Args:
+            namespace: namespace being watched, informational only
+            list_func: list_func() returns a PodList dict, including
+                metadata.resourceVersion
+            watch_func: watch_func(resource_version) returns an iterable of
+                watch event dicts {'type': ..., 'object': ...}. The iterable
+                should end by itself from time to time (e.g. timeoutSeconds)
+                so that stop() takes effect.
+            resync_backoff: seconds to wait before relisting after an error
+        """
+        super().__init__(daemon=True)
+        self.namespace = namespace
+        self._list_func = list_func
+        self._watch_func = watch_func
+        self._resync_backoff = resync_backoff
+        self._pods = {}
+        self._resource_version = None
+        self._cond = threading.Condition()
+        self._synced = threading.Event()
+        self.resync_count = 0
+
+    # ==================== consumer API ====================
+    def wait_until_synced(self, timeout=None):
+        """
+        Returns:
+            True if the initial list has been loaded
+        """
+        return self._synced.wait(timeout)
+
+    def has_synced(self):
+        return self._synced.is_set()
+
+    def get(self, pod_name):
+        """
+        Returns:
+            the pod as a BeneDict, or None
+        """
+        with self._cond:
+            return self._pods.get(pod_name)
+
+    def pods(self):
+        """
+        Returns:
+            list of pods, sorted by name like `kubectl get pods`
+        """
+        with self._cond:
+            return [self._pods[name] for name in sorted(self._pods)]
+
+    def wait_for(self, predicate, timeout=None):
+        """
+        Block until predicate({pod_name: pod}) is true. The predicate is
+        re-evaluated every time the cache changes.
+
+        Returns:
+            the last value of predicate, falsy if timed out
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: predicate(self._pods), timeout)
+
+    # ==================== watch loop ====================
+    def run(self):
+        while not self.is_stopped():
+            try:
+                self._list()
+                while not self.is_stopped():
+                    self._watch()
+            except _WatchExpired:
+                pass
+            except Exception as e:
+                print_err('[Warning] Lost pod watch on namespace {}: {!r}, '
+                          'resyncing'.format(self.namespace, e))
+                time.sleep(self._resync_backoff)
+            self.resync_count += 1
+
+    def _list(self):
+        pod_list = self._list_func()
+        pods = {}
+        for pod in pod_list.get('items') or []:
+            pods[pod['metadata']['name']] = BeneDict(pod)
+        with self._cond:
+            self._pods = pods
+            self._resource_version = pod_list['metadata']['resourceVersion']
+            self._synced.set()
+            self._cond.notify_all()
+
+    def _watch(self):
+        start_time = time.time()
+        for event in self._watch_func(self._resource_version):
+            if self.is_stopped():
+                return
+            self._apply(event)
+        if time.time() - start_time < self._resync_backoff:
+            # the server keeps closing the stream right away, don't spin
+            time.sleep(self._resync_backoff)
+
+    def _apply(self, event):
+        event_type = event['type']
+        obj = event['object']
+        if event_type == 'ERROR':
+            # 410 Gone: resourceVersion too old, must relist
+            raise _WatchExpired(obj.get('message', ''))
+        with self._cond:
+            self._resource_version = obj['metadata']['resourceVersion']
+            if event_type == 'BOOKMARK':
+                return
+            name = obj['metadata']['name']
+            if event_type == 'DELETED':
+                self._pods.pop(name, None)
+            else:  # ADDED or MODIFIED
+                self._pods[name] = BeneDict(obj)
+            self._cond.notify_all()
@@ -0,0 +1,180 @@
+"""
+Streams the logs of many containers at once, e.g. of a whole process group
+or experiment, as a single stream of lines prefixed with the process name
+and merged by timestamp. Logs are requested with timestamps
+(`kubectl logs --timestamps`) so that lines from different containers can
+be ordered.
+"""
+import heapq
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from symphony.utils.common import print_err
+
+# sentinel put by a reader whose stream has ended
+_END = object()
+
+
+def parse_timestamp(line):
+    """
+    Splits the RFC3339 timestamp that prefixes a log line
+
+    Returns:
+        (sort key, rest of the line), the key is None if the line has no
+        timestamp. Kubernetes trims trailing zeros of the fraction, so it is
+        padded to nanoseconds for the keys to compare as strings.
+    """
+    stamp, sep, text = line.partition(' ')
+    if not sep or len(stamp) < 20 or stamp[10] != 'T' or not stamp.endswith('Z'):
+        return None, line
+    seconds, _, fraction = stamp[:-1].partition('.')
+    if fraction and not fraction.isdigit():
+        return None, line
+    return seconds + '.' + fraction.ljust(9, '0'), text
+
+
+class LogStream:
+    def __init__(self, containers, fetch_func, stream_func,
+                 max_workers=16, buffer_size=1000, merge_window=0.5):
+        """
+        Args:
+            containers: list of (pod_name, container_name, label), every
+                line of the container is prefixed with [label]
+            fetch_func: fetch_func(pod_name, container_name) returns the
+                timestamped log of the container as a string
+            stream_func: stream_func(pod_name, container_name) returns an
+                iterable over the timestamped log lines of the container,
+                following it
+            max_workers: maximum number of concurrent fetches in lines().
+                follow() keeps one stream per container open
+            buffer_size: maximum number of followed lines held in memory.
+                Readers block when it is full, so a slow consumer slows down
+                the streams instead of growing the buffer
+            merge_window: seconds a followed line is held back, waiting for
+                earlier lines of other containers
+        """
+        self.containers = list(containers)
+        self._fetch_func = fetch_func
+        self._stream_func = stream_func
+        self.max_workers = max_workers
+        self.buffer_size = buffer_size
+        self.merge_window = merge_window
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """
+        Ends follow() after the lines already received
+        """
+        self._stop_event.set()
+
+    def lines(self):
+        """
+        Fetches the logs of all containers, at most max_workers at a time
+
+        Returns:
+            list of log lines merged by timestamp
+        """
+        def _fetch(container):
+            pod_name, container_name, label = container
+            try:
+                log = self._fetch_func(pod_name, container_name)
+            except Exception as e:
+                print_err('[Warning] cannot get log of {}: {}'.format(label, e))
+                return []
+            return list(self._keyed_lines(label, log.splitlines()))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            logs = list(pool.map(_fetch, self.containers))
+        return [line for _, line in heapq.merge(*logs, key=lambda x: x[0])]
+
+    def follow(self):
+        """
+        Generator over the log lines of all containers as they are written,
+        until every container terminates or stop() is called. A line is
+        released once the lines of all containers up to its timestamp have
+        been received, or at most merge_window seconds after it arrived.
+        """
+        buffer = queue.Queue(maxsize=self.buffer_size)
+        for index, container in enumerate(self.containers):
+            threading.Thread(target=self._read, args=(index, container, buffer),
+                             daemon=True).start()
+        # key of the last line of each container still streaming
+        last_keys = {index: None for index in range(len(self.containers))}
+        heap = []
+        # (arrival time, key) of the lines not released yet, in arrival order
+        arrivals = deque()
+        window_mark = ''
+        seq = 0
+        try:
+            while last_keys and not self._stop_event.is_set():
+                try:
+                    item = buffer.get(timeout=max(self.merge_window, 0.05))
+                except queue.Empty:
+                    item = None
+                if item is not None:
+                    index, key, line = item
+                    if line is _END:
+                        del last_keys[index]
+                    else:
+                        last_keys[index] = key
+                        heapq.heappush(heap, (key, seq, line))
+                        arrivals.append((time.time(), key))
+                        seq += 1
+                deadline = time.time() - self.merge_window
+                while arrivals and arrivals[0][0] <= deadline:
+                    window_mark = max(window_mark, arrivals.popleft()[1])
+                watermark = window_mark
+                if last_keys and None not in last_keys.values():
+                    # each container logs in order: nothing earlier can come
+                    watermark = max(watermark, min(last_keys.values()))
+                while heap and heap[0][0] <= watermark:
+                    yield heapq.heappop(heap)[2]
+            while heap:
+                yield heapq.heappop(heap)[2]
+        finally:
+            self._stop_event.set()
+
+    def _read(self, index, container, buffer):
+        pod_name, container_name, label = container
+        stream = None
+        try:
+            stream = self._stream_func(pod_name, container_name)
+            for key, line in self._keyed_lines(label, stream):
+                if not self._put(buffer, (index, key, line)):
+                    return
+        except Exception as e:
+            if not self._stop_event.is_set():
+                print_err('[Warning] lost log stream of {}: {}'.format(label, e))
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+            self._put(buffer, (index, None, _END))
+
+    def _put(self, buffer, item):
+        """
+        Blocks while the buffer is full
+
+        Returns:
+            False if stopped
+        """
+        while not self._stop_event.is_set():
+            try:
+                buffer.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _keyed_lines(self, label, lines):
+        """
+        Yields (key, '[label] text'). A line without timestamp, e.g. the
+        remainder of a long line, takes the key of the line before it.
+        """
+        key = ''
+        for line in lines:
+            line_key, text = parse_timestamp(line)
+            if line_key is not None:
+                key = line_key
+            yield key, '[{}] {}'.format(label, text)
@@ -1,5 +1,5 @@
+import bisect
 import json
-import copy
 from os.path import expanduser
 
 _REQUIRED_LABELS = ["name", "cpu", "memory_m"]
@@ -8,6 +8,126 @@ _EFFECT_MAP = {
     'NO_SCHEDULE': 'NoSchedule',
     'PREFER_NO_SCHEDULE': 'PreferNoSchedule'
 }
+# Kept free on every node for the kubelet and system pods when packing,
+# same cpu margin as assign_to_machine
+_RESERVED_CPU = 0.6
+_RESERVED_MEMORY_FRACTION = 0.1
+
+
+class _Pod:
+    """
+    Resources of one pod: a process group or a standalone process
+    """
+    def __init__(self, name, spec):
+        self.name = name
+        self.spec = spec
+        self.cpu = 0.
+        self.memory_m = 0.
+        self.gpu_count = 0
+        self.gpu_type = None
+        self.node_pool_name = None
+        # (process, request)
+        self.processes = []
+
+    def add(self, process, request):
+        self.processes.append((process, request))
+        self.cpu += request.get('cpu') or 0.
+        self.memory_m += request.get('memory_m') or 0.
+        self.gpu_count += request.get('gpu_count') or 0
+        for key in ['gpu_type', 'node_pool_name']:
+            value = request.get(key)
+            if value is None:
+                continue
+            if getattr(self, key) not in (None, value):
+                raise ValueError('Processes of {} ask for different {}: {} and {}'
+                                 .format(self.name, key, getattr(self, key), value))
+            setattr(self, key, value)
+
+
+class _Node:
+    def __init__(self, pool):
+        self.pool = pool
+        self.cpu = pool['cpu']
+        self.memory_m = pool['memory_m']
+        self.gpu_count = pool['gpu_count']
+        self.pods = []
+
+    def fits(self, pod):
+        return (pod.cpu <= self.cpu + 1e-9 and
+                pod.memory_m <= self.memory_m + 1e-9 and
+                pod.gpu_count <= self.gpu_count)
+
+    def add(self, pod):
+        self.pods.append(pod)
+        self.cpu -= pod.cpu
+        self.memory_m -= pod.memory_m
+        self.gpu_count -= pod.gpu_count
+
+    def remove(self, pod):
+        self.pods.remove(pod)
+        self.cpu += pod.cpu
+        self.memory_m += pod.memory_m
+        self.gpu_count += pod.gpu_count
+
+    def slack(self, pod):
+        """
+        Fraction of the node left free after adding pod
+        """
+        pool = self.pool
+        total = ((self.cpu - pod.cpu) / pool['cpu'] +
+                 (self.memory_m - pod.memory_m) / pool['memory_m'])
+        if pool['gpu_count']:
+            total += (self.gpu_count - pod.gpu_count) / pool['gpu_count']
+        return total
+
+
+class DispatchPlan:
+    """
+    Result of GKEDispatcher.dispatch
+    """
+    def __init__(self, nodes, pools, objective, pool_costs):
+        self.objective = objective
+        # [(node pool name, [pod names])], one entry per node
+        self.nodes = [(node.pool['name'], [pod.name for pod in node.pods])
+                      for node in nodes]
+        self.assignments = {pod.name: node.pool['name']
+                            for node in nodes for pod in node.pods}
+        self.node_counts = {}
+        for node in nodes:
+            name = node.pool['name']
+            self.node_counts[name] = self.node_counts.get(name, 0) + 1
+        self.cost = sum(pool_costs[name] * n
+                        for name, n in self.node_counts.items())
+        self._requested = {'cpu': 0., 'memory_m': 0., 'gpu_count': 0.}
+        self._allocatable = {'cpu': 0., 'memory_m': 0., 'gpu_count': 0.}
+        for node in nodes:
+            for key in self._requested:
+                self._requested[key] += sum(getattr(pod, key)
+                                            for pod in node.pods)
+                self._allocatable[key] += pools[node.pool['name']][key]
+
+    def efficiency(self):
+        """
+        Returns:
+            {resource: requested / allocatable on the chosen nodes},
+            for cpu, memory_m and gpu_count (None without GPU nodes)
+        """
+        return {key: (self._requested[key] / self._allocatable[key]
+                      if self._allocatable[key] else None)
+                for key in self._requested}
+
+    def summary(self):
+        lines = ['{} nodes, {} {}'.format(len(self.nodes), self.objective,
+                                          self.cost)]
+        for name, count in sorted(self.node_counts.items()):
+            lines.append('  {}: {} nodes'.format(name, count))
+        for key, value in self.efficiency().items():
+            if value is not None:
+                lines.append('  {} packing efficiency: {:.1%}'.format(key, value))
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return self.summary()
 
 # TODO: add env variable to limit program thread usage
 class GKEDispatcher:
@@ -25,6 +145,46 @@ class GKEDispatcher:
         self.node_pools = self.tf_config["resource"]["google_container_node_pool"]
         for k, v in self.node_pools.items():
             self._check_required_labels(k, v)
+        self._build_index()
+
+    def _build_index(self):
+        """
+        Translates the labels and taints of every node pool once, so that
+        assigning a process does not go through the terraform json again
+        """
+        self._labels = {}
+        self._tolerations = {}
+        # gpu type ('' if unlabeled, None for cpu pools)
+        # -> [(cpu, memory_m, name)] sorted
+        self._pools_by_gpu_type = {}
+        for name, node_pool_di in self.node_pools.items():
+            np_labels = node_pool_di["node_config"]["labels"]
+            self._labels[name] = np_labels
+            tolerations = []
+            for taint in node_pool_di["node_config"].get("taint", []):
+                toleration = dict(taint)
+                if 'value' in toleration:
+                    toleration['operator'] = 'Equal'
+                if 'effect' in toleration:
+                    toleration['effect'] = _EFFECT_MAP[toleration['effect']]
+                tolerations.append(toleration)
+            if 'gpu_count' in np_labels:
+                # Tolerations allow the process to be scheduled
+                tolerations.append({
+                    "effect": "NoSchedule",
+                    "key": "nvidia.com/gpu",
+                    "operator": "Exists"
+                })
+            self._tolerations[name] = tolerations
+            gpu_type = np_labels.get('gpu_type', '') if 'gpu_count' in np_labels else None
+            self._pools_by_gpu_type.setdefault(gpu_type, []).append(
+                (np_labels["cpu"], np_labels["memory_m"], name))
+        for pools in self._pools_by_gpu_type.values():
+            pools.sort()
+        # gpu_type argument of infer_node_pool_name -> matching gpu types
+        self._gpu_type_matches = {}
+        # arguments of infer_node_pool_name -> node pool name
+        self._inferred = {}
 
     def get_node_pools(self):
         """
@@ -64,29 +224,13 @@ class GKEDispatcher:
         """
         if process_group is None:
             process_group = process
-        node_pool_di = self.get_node_pool(node_pool_name)
-
-        np_labels = node_pool_di["node_config"]["labels"]
-        name = np_labels["name"]
+        self.get_node_pool(node_pool_name)
 
         # This selector selects the only node_pool
-        process_group.node_selector("name", name)
-        # Tolerations allow the process to be scheduled
-        if "taint" in node_pool_di["node_config"]:
-            for taint in node_pool_di["node_config"]["taint"]:
-                taint = copy.copy(taint)
-                if 'value' in taint:
-                    taint['operator'] = 'Equal'
-                if 'effect' in taint:
-                    taint['effect'] = _EFFECT_MAP[taint['effect']]
-                process_group.add_toleration(**taint)
+        process_group.node_selector("name", self._labels[node_pool_name]["name"])
+        for toleration in self._tolerations[node_pool_name]:
+            process_group.add_toleration(**toleration)
 
-        if 'gpu_count' in np_labels:
-            process_group.add_toleration(**{
-                "effect": "NoSchedule",
-                "key": "nvidia.com/gpu",
-                "operator": "Exists"
-                })
         if memory_m is not None:
             memory_str = '{}Mi'.format(int(memory_m))
             process.resource_request(memory=memory_str)
@@ -113,11 +257,11 @@ class GKEDispatcher:
             process_per_machine: int, claiming a fraction of the machine's
                 resources rather than the entire machine (default: {1})
         """
-        node_pool_di = self.get_node_pool(node_pool_name)
+        self.get_node_pool(node_pool_name)
         if process_group is None:
             process_group = process
 
-        np_labels = node_pool_di["node_config"]["labels"]
+        np_labels = self._labels[node_pool_name]
         cpu = np_labels["cpu"]
         memory_m = np_labels["memory_m"]
 
@@ -152,8 +296,8 @@ class GKEDispatcher:
             process_group (default None): symphony.process_group,
                 None implies that symphony.process is itself a pod
         """
-        node_pool_di = self.get_node_pool(node_pool_name)
-        np_labels = node_pool_di["node_config"]["labels"]
+        self.get_node_pool(node_pool_name)
+        np_labels = self._labels[node_pool_name]
 
         if 'gpu_count' not in np_labels:
             raise ValueError('Assigning by GPU on node_pool {} '
@@ -205,31 +349,46 @@ class GKEDispatcher:
                              cpu=None,
                              gpu_type=None,
                              gpu_count=None):
-        for node_pool_name, node_pool_di in self.node_pools.items():
-            np_labels = node_pool_di["node_config"]["labels"]
-            # TODO: add some margin to memory and cpu checks
-            if memory_m is not None:
-                memory_m_total = np_labels["memory_m"]
-                if memory_m_total <= memory_m:
-                    continue
+        """
+        Returns the smallest node pool (by cpu, then memory) with more
+        than memory_m and cpu, and with gpu_count GPUs of gpu_type if given
+        """
+        key = (memory_m, cpu, gpu_type, gpu_count)
+        if key not in self._inferred:
+            self._inferred[key] = self._infer_node_pool_name(*key)
+        return self._inferred[key]
+
+    def _matching_gpu_types(self, gpu_type, gpu_count):
+        if gpu_count is None:
+            return [None]
+        if gpu_type is None:
+            return [t for t in self._pools_by_gpu_type if t is not None]
+        if gpu_type not in self._gpu_type_matches:
+            self._gpu_type_matches[gpu_type] = [
+                t for t in self._pools_by_gpu_type
+                if t is not None and gpu_type.lower() in t]
+        return self._gpu_type_matches[gpu_type]
+
+    def _infer_node_pool_name(self, memory_m, cpu, gpu_type, gpu_count):
+        best = None
+        for t in self._matching_gpu_types(gpu_type, gpu_count):
+            pools = self._pools_by_gpu_type[t]
+            start = 0
             if cpu is not None:
-                cpu_total = np_labels["cpu"]
-                if cpu_total <= cpu:
-                    continue
-            if gpu_type is not None:
-                if 'gpu_type' not in np_labels:
+                # TODO: add some margin to memory and cpu checks
+                start = bisect.bisect_right(pools, (cpu, float('inf')))
+            for pool in pools[start:]:
+                name = pool[2]
+                if memory_m is not None and pool[1] <= memory_m:
                     continue
-                if gpu_type.lower() not in np_labels['gpu_type']:
-                    continue
-            if gpu_count is not None:
-                if 'gpu_count' not in np_labels:
-                    continue
-                if gpu_count > np_labels['gpu_count']:
-                    continue
-            else:
-                if 'gpu_count' in np_labels:
+                if gpu_count is not None and \
+                   gpu_count > self._labels[name]['gpu_count']:
                     continue
-            return node_pool_name
+                if best is None or pool < best:
+                    best = pool
+                break
+        if best is not None:
+            return best[2]
         raise ValueError('Cannot find nodepool to satisfy: ' +
                          'cpu={}, memory_m={}, '.format(cpu, memory_m) +
                          'gpu_type={}, and gpu_count={}'
@@ -258,6 +417,184 @@ class GKEDispatcher:
             raise ValueError('assign_to_{} not supported. '.format(assign_to)
                              + 'Use node_pool, machine, gpu, or resource')
 
+    def _pool_capacity(self, node_pool_name):
+        labels = self._labels[node_pool_name]
+        return {
+            'name': node_pool_name,
+            'cpu': labels['cpu'] - _RESERVED_CPU,
+            'memory_m': labels['memory_m'] * (1 - _RESERVED_MEMORY_FRACTION),
+            'gpu_count': labels.get('gpu_count', 0),
+            'gpu_type': labels.get('gpu_type'),
+        }
+
+    def _compatible_pools(self, pod, pools):
+        if pod.node_pool_name is not None:
+            names = [pod.node_pool_name]
+        else:
+            names = []
+            for name, pool in pools.items():
+                # same rules as infer_node_pool_name
+                if pod.gpu_count:
+                    if not pool['gpu_count']:
+                        continue
+                    if pod.gpu_type is not None and \
+                       (pool['gpu_type'] is None or
+                        pod.gpu_type.lower() not in pool['gpu_type']):
+                        continue
+                elif pool['gpu_count']:
+                    continue
+                names.append(name)
+        names = [name for name in names if _Node(pools[name]).fits(pod)]
+        if not names:
+            raise ValueError('Cannot find nodepool to satisfy {}: '.format(pod.name) +
+                             'cpu={}, memory_m={}, '.format(pod.cpu, pod.memory_m) +
+                             'gpu_type={}, and gpu_count={}'
+                             .format(pod.gpu_type, pod.gpu_count))
+        return names
+
+    def dispatch(self,
+                 experiment,
+                 requests,
+                 *,
+                 objective='nodes',
+                 pool_costs=None,
+                 dry_run=False):
+        """
+        Places all the pods of an experiment at once, choosing their node
+        pools and the number of nodes of each pool. A process group is one
+        pod with the sum of the requests of its processes.
+
+        Pods are packed biggest first: each goes on the open node it fills
+        best, else on a new node of the pool with the lowest cost per pod.
+        Nodes are then emptied into the other nodes where possible.
+
+        Args:
+            experiment: KubeExperimentSpec
+            requests: {process name: dict(cpu=, memory_m=, gpu_count=,
+                gpu_type=, node_pool_name=)}, all optional. Processes
+                without a request are left untouched
+            objective: 'nodes' to minimize the number of nodes, 'cost' to
+                minimize the cost of the nodes, given by pool_costs
+            pool_costs: {node pool name: cost of one node}
+            dry_run: only compute the plan, do not assign the processes
+
+        Returns:
+            DispatchPlan
+        """
+        if objective == 'nodes':
+            pool_costs = {name: 1 for name in self.node_pools}
+        elif objective == 'cost':
+            if pool_costs is None:
+                raise ValueError('objective=cost requires pool_costs')
+            missing = set(self.node_pools) - set(pool_costs)
+            if missing:
+                raise ValueError('Missing pool_costs for {}'.format(sorted(missing)))
+        else:
+            raise ValueError('Unknown objective "{}", use nodes or cost'
+                             .format(objective))
+        pools = {name: self._pool_capacity(name) for name in self.node_pools}
+
+        pods = []
+        for process_group in experiment.list_process_groups():
+            pod = _Pod(process_group.name, process_group)
+            for process in process_group.list_processes():
+                if process.name in requests:
+                    pod.add(process, requests[process.name])
+            if pod.processes:
+                pods.append(pod)
+        for process in experiment.list_processes():
+            if process.name in requests:
+                pod = _Pod(process.name, None)
+                pod.add(process, requests[process.name])
+                pods.append(pod)
+        unknown = set(requests) - {process.name for pod in pods
+                                   for process, _ in pod.processes}
+        if unknown:
+            raise ValueError('Requests for unknown processes {}'
+                             .format(sorted(unknown)))
+
+        compatible = {pod.name: self._compatible_pools(pod, pools)
+                      for pod in pods}
+        max_cpu = max(pool['cpu'] for pool in pools.values())
+        max_memory_m = max(pool['memory_m'] for pool in pools.values())
+        max_gpu = max([pool['gpu_count'] for pool in pools.values()] + [1])
+        pods.sort(key=lambda pod: -max(pod.cpu / max_cpu,
+                                       pod.memory_m / max_memory_m,
+                                       pod.gpu_count / max_gpu))
+
+        def cost_per_pod(name, pod):
+            pool = pools[name]
+            per_node = min([pool['cpu'] / pod.cpu if pod.cpu else float('inf'),
+                            pool['memory_m'] / pod.memory_m if pod.memory_m else float('inf'),
+                            pool['gpu_count'] / pod.gpu_count if pod.gpu_count else float('inf'),
+                            # one resourceless pod does not need a node
+                            1000.])
+            return pool_costs[name] / int(per_node), pool_costs[name], name
+
+        def best_node(pod, nodes, exclude=None):
+            best, best_slack = None, None
+            for node in nodes:
+                if node is exclude or node.pool['name'] not in compatible[pod.name]:
+                    continue
+                if node.fits(pod):
+                    slack = node.slack(pod)
+                    if best is None or slack < best_slack:
+                        best, best_slack = node, slack
+            return best
+
+        nodes = []
+        for pod in pods:
+            node = best_node(pod, nodes)
+            if node is None:
+                name = min(compatible[pod.name],
+                           key=lambda name: cost_per_pod(name, pod))
+                node = _Node(pools[name])
+                nodes.append(node)
+            node.add(pod)
+
+        # Empties the emptiest nodes into the others
+        for node in sorted(nodes, key=lambda node: len(node.pods)):
+            moves = []
+            for pod in sorted(node.pods, key=lambda pod: -pod.cpu):
+                target = best_node(pod, nodes, exclude=node)
+                if target is None:
+                    break
+                target.add(pod)
+                moves.append((pod, target))
+            if len(moves) == len(node.pods):
+                nodes.remove(node)
+            else:
+                for pod, target in moves:
+                    target.remove(pod)
+
+        # Moves the pods of a node to a cheaper pool that fits them all
+        for i, node in enumerate(nodes):
+            names = set.intersection(*[set(compatible[pod.name]) for pod in node.pods])
+            for name in sorted(names, key=lambda name: pool_costs[name]):
+                if pool_costs[name] >= pool_costs[node.pool['name']]:
+                    break
+                cheaper = _Node(pools[name])
+                for pod in node.pods:
+                    if not cheaper.fits(pod):
+                        break
+                    cheaper.add(pod)
+                else:
+                    nodes[i] = cheaper
+                    break
+
+        plan = DispatchPlan(nodes, pools, objective, pool_costs)
+        if not dry_run:
+            for node in nodes:
+                for pod in node.pods:
+                    for process, request in pod.processes:
+                        self.assign_to_node_pool(process,
+                                                 node_pool_name=node.pool['name'],
+                                                 process_group=pod.spec,
+                                                 memory_m=request.get('memory_m'),
+                                                 cpu=request.get('cpu'),
+                                                 gpu_count=request.get('gpu_count'))
+        return plan
+
     def _check_required_labels(self, name, di):
         if "node_config" not in di:
             msg = "Missing field 'node_config' in declaration of node pool {}. ".format(name)\
@@ -0,0 +1,92 @@
+"""
+Diffs a newly compiled experiment against the manifest of its last launch,
+so that a relaunch only touches the objects that changed. The manifest is
+remembered as an index of <kind>/<name> -> hash of the rendered document,
+next to the kube.yml of the experiment.
+"""
+import hashlib
+import json
+import os
+
+INDEX_NAME = 'kube.index.json'
+# The spec of these is mostly immutable: they are deleted and created
+# again when changed instead of being patched
+_REPLACED_KINDS = {'Pod', 'Job'}
+
+
+def document_hash(document):
+    return hashlib.sha1(document.encode('utf-8')).hexdigest()
+
+
+def load_index(folder):
+    """
+    Returns:
+        the index saved in folder, None if there is none
+    """
+    path = os.path.join(str(folder), INDEX_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_index(folder, index):
+    path = os.path.join(str(folder), INDEX_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f, indent=0, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+class ManifestDiff:
+    def __init__(self):
+        # [(<kind>/<name>, document)] to create or update
+        self.changed = []
+        # <kind>/<name> to delete before their changed version is created
+        self.replaced = []
+        # <kind>/<name> that are no longer in the experiment
+        self.deleted = []
+        self.unchanged = 0
+        # index of the new manifest
+        self.index = {}
+
+    def summary(self):
+        return '{} changed ({} replaced), {} deleted, {} unchanged'.format(
+            len(self.changed), len(self.replaced), len(self.deleted),
+            self.unchanged)
+
+
+def diff_manifest(old_index, objects, f=None, existing=False):
+    """
+    Args:
+        old_index: index of the last launch, None to treat every object
+            as changed
+        objects: (<kind>/<name>, yaml document), see
+            KubeExperimentSpec.iter_objects
+        f: text file the whole new manifest is also written to
+        existing: without old_index, whether the objects may already exist,
+            e.g. launched before indices were kept. Every pod and job is
+            then replaced
+
+    Returns:
+        ManifestDiff. Only the documents of changed objects are kept
+    """
+    diff = ManifestDiff()
+    for name, document in objects:
+        if f is not None:
+            f.write('---\n')
+            f.write(document)
+        doc_hash = document_hash(document)
+        diff.index[name] = doc_hash
+        if old_index is None:
+            diff.changed.append((name, document))
+            if existing and name.split('/')[0] in _REPLACED_KINDS:
+                diff.replaced.append(name)
+        elif old_index.get(name) == doc_hash:
+            diff.unchanged += 1
+        else:
+            diff.changed.append((name, document))
+            if name in old_index and name.split('/')[0] in _REPLACED_KINDS:
+                diff.replaced.append(name)
+    if old_index is not None:
+        diff.deleted = sorted(set(old_index) - set(diff.index))
+    return diff
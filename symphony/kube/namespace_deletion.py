@@ -0,0 +1,136 @@
+"""
+Tracks the termination of namespaces whose deletion was requested without
+waiting, see KubeCluster.delete_batch. Lists the namespaces once, then
+follows a watch from the resourceVersion of the list for DELETED events,
+and relists whenever the watch ends or is lost.
+"""
+import math
+import time
+import threading
+from symphony.utils.common import print_err
+
+_WATCH_TIMEOUT = 300
+
+
+class NamespaceDeletion:
+    def __init__(self, names, list_func, watch_func, resync_backoff=1.):
+        """
+        Args:
+            names: namespaces being deleted
+            list_func: list_func() returns a NamespaceList dict, including
+                metadata.resourceVersion
+            watch_func: watch_func(resource_version, timeout_seconds) returns
+                an iterable of watch event dicts {'type': ..., 'object': ...}
+            resync_backoff: seconds to wait before relisting after an error
+        """
+        self._names = set(names)
+        self.names = sorted(self._names)
+        self._list_func = list_func
+        self._watch_func = watch_func
+        self._resync_backoff = resync_backoff
+        self._gone = set()
+        self._lock = threading.Lock()
+
+    def pending(self):
+        """
+        Returns:
+            sorted names of the namespaces that still exist, as of the last
+            list or watch event
+        """
+        with self._lock:
+            return [name for name in self.names if name not in self._gone]
+
+    def done(self):
+        with self._lock:
+            return len(self._gone) == len(self.names)
+
+    def wait(self, timeout=None, progress=None):
+        """
+        Block until every namespace is gone
+
+        Args:
+            timeout: seconds, None to wait forever
+            progress: progress(num_deleted, total) is called whenever
+                more namespaces are found to be gone
+
+        Returns:
+            True if all namespaces are gone, False if timed out
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        reported = [None]
+
+        def _report():
+            with self._lock:
+                num_gone = len(self._gone)
+            if progress is not None and num_gone != reported[0]:
+                reported[0] = num_gone
+                progress(num_gone, len(self.names))
+
+        while True:
+            try:
+                resource_version = self._list()
+                _report()
+                if self.done():
+                    return True
+                remaining = _remaining(deadline)
+                if remaining is not None and remaining <= 0:
+                    return False
+                start_time = time.time()
+                if self._watch(resource_version, remaining, _report):
+                    return True
+                if time.time() - start_time < self._resync_backoff:
+                    # the server keeps closing the stream right away, don't spin
+                    time.sleep(_clip(self._resync_backoff, deadline))
+            except Exception as e:
+                print_err('[Warning] Lost namespace watch: {!r}, '
+                          'resyncing'.format(e))
+                time.sleep(_clip(self._resync_backoff, deadline))
+            remaining = _remaining(deadline)
+            if remaining is not None and remaining <= 0:
+                return self.done()
+
+    def _list(self):
+        ns_list = self._list_func()
+        existing = {ns['metadata']['name'] for ns in ns_list.get('items') or []}
+        with self._lock:
+            self._gone.update(self._names - existing)
+        return ns_list['metadata']['resourceVersion']
+
+    def _watch(self, resource_version, remaining, report):
+        """
+        Returns:
+            True once all namespaces are gone, False when the watch ends
+        """
+        timeout_seconds = _WATCH_TIMEOUT
+        if remaining is not None:
+            timeout_seconds = max(1, min(timeout_seconds, math.ceil(remaining)))
+        events = self._watch_func(resource_version, timeout_seconds)
+        try:
+            for event in events:
+                if event['type'] == 'ERROR':
+                    # e.g. 410 Gone, the resourceVersion is too old
+                    return False
+                name = event['object']['metadata']['name']
+                if event['type'] == 'DELETED' and name in self._names:
+                    with self._lock:
+                        self._gone.add(name)
+                    report()
+                    if self.done():
+                        return True
+        finally:
+            if hasattr(events, 'close'):
+                events.close()
+        return False
+
+
+def _remaining(deadline):
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def _clip(seconds, deadline):
+    remaining = _remaining(deadline)
+    if remaining is None:
+        return seconds
+    return max(0, min(seconds, remaining))
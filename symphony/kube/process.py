@@ -1,6 +1,8 @@
 from symphony.spec import ProcessSpec
+from symphony.spec.base import marks_dirty
 from symphony.utils.common import sanitize_name_kubernetes, print_err
-from .builder import KubeContainerYML, KubePodYML
+from benedict import benedict_to_dict
+from .builder import KubeContainerYML, KubePodYML, render_data
 
 
 class KubeProcessSpec(ProcessSpec):
@@ -28,6 +30,12 @@ class KubeProcessSpec(ProcessSpec):
         super()._set_process_group(process_group)
         process_group.pod_yml.add_container(self.container_yml)
 
+    @classmethod
+    def load_dict(cls, di):
+        if cls is KubeProcessSpec and 'num_replicas' in di:
+            return KubeReplicatedProcessSpec.load_dict(di)
+        return super().load_dict(di)
+
     def _load_dict(self, di):
         super()._load_dict(di)
         self.container_image = di['container_image']
@@ -54,12 +62,14 @@ class KubeProcessSpec(ProcessSpec):
 
     ### Container level
 
+    @marks_dirty
     def set_command(self, command):
         if not isinstance(command, list):
             print_err('[Warning] command {} for KubernetesProcess {} must be a list'.format(command, self.name))
             command = [command]
         self.container_yml.set_command(command)
 
+    @marks_dirty
     def set_args(self, args):
         if not isinstance(args, list):
             print_err('[Warning] args {} for KubernetesProcess {} should be a list'.format(args, self.name))
@@ -67,62 +77,207 @@ class KubeProcessSpec(ProcessSpec):
         args = list(map(str, args))
         self.container_yml.set_args(args)
 
+    @marks_dirty
     def set_env(self, name, value):
         self.container_yml.set_env(name, value)
 
+    @marks_dirty
     def set_envs(self, di):
         self.container_yml.set_envs(di)
 
+    @marks_dirty
+    def add_env_from(self, config_map_name):
+        self.container_yml.add_env_from(config_map_name)
+
+    @marks_dirty
     def mount_volume(self, volume, mount_path):
         self.container_yml.mount_volume(volume, mount_path)
 
+    @marks_dirty
     def mount_nfs(self, server, path, mount_path, name=None):
         self.container_yml.mount_nfs(server, path, mount_path, name)
 
+    @marks_dirty
     def mount_secret(self, secret_name, mount_path, defaultMode=None, name=None):
         self.container_yml.mount_secret(secret_name, mount_path, defaultMode=defaultMode, name=name)
 
+    @marks_dirty
     def mount_git_repo(self, repository, revision, mount_path, name=None):
         self.container_yml.mount_git_repo(repository, revision, mount_path, name)
 
+    @marks_dirty
     def mount_host_path(self, path, mount_path, hostpath_type='', name=None):
         self.container_yml.mount_host_path(path, mount_path, hostpath_type, name)
 
+    @marks_dirty
     def mount_empty_dir(self, name, use_memory, mount_path):
         self.container_yml.mount_empty_dir(mount_path, use_memory, name)
 
+    @marks_dirty
     def mount_shared_memory(self, name='devshm'):
         """
         https://stackoverflow.com/questions/46085748/define-size-for-dev-shm-on-container-engine/46434614#46434614
         """
         self.container_yml.mount_shared_memory(name=name)
 
+    @marks_dirty
     def resource_request(self, cpu=None, memory=None):
         self.container_yml.resource_request(cpu, memory)
 
+    @marks_dirty
     def resource_limit(self, cpu=None, memory=None, gpu=None):
         self.container_yml.resource_limit(cpu, memory, gpu)
 
+    @marks_dirty
     def image_pull_policy(self, policy):
         self.container_yml.image_pull_policy(policy)
 
     ### Pod level
+    @marks_dirty
     def restart_policy(self, policy):
         assert self.standalone, 'Restart policy for process {} should be configured at process group level'.format(self.name)
         self.pod_yml.restart_policy(policy)
 
+    @marks_dirty
     def add_labels(self, **kwargs):
         assert self.standalone, 'Labels for process {} should be configured at process group level'.format(self.name)
         self.pod_yml.add_labels(**kwargs)
 
+    @marks_dirty
     def add_label(self, key, val):
         assert self.standalone, 'Labels for process {} should be configured at process group level'.format(self.name)
         self.pod_yml.add_label(key, val)
 
+    @marks_dirty
     def add_toleration(self, **kwargs):
         assert self.standalone, 'Tolerations for process {} should be configured at process group level'.format(self.name)
         self.pod_yml.add_toleration(**kwargs)
 
+    @marks_dirty
     def node_selector(self, key, value):
         assert self.standalone, 'Node selector for process {} should be configured at process group level'.format(self.name)
         self.pod_yml.node_selector(key, value)
+
+
+class KubeReplicatedProcessSpec(KubeProcessSpec):
+    """
+    num_replicas identical pods built from one spec. Only the spec is kept,
+    the replicas are derived from it when rendered:
+        overlay: one pod per replica named <name>-<i>, a shallow copy of the
+            rendered spec with its own name, labels and env
+        indexed-job: one Job with an indexed completion per replica,
+            a single document whatever the number of replicas
+    Every replica gets its index in SYMPHONY_REPLICA_INDEX.
+    """
+    _MODES = ['overlay', 'indexed-job']
+
+    def __init__(self, name, num_replicas=1, *, mode='overlay',
+                 replica_envs=None, **kwargs):
+        """
+        Args:
+            num_replicas: number of pods
+            mode: 'overlay' or 'indexed-job'
+            replica_envs: {env name: [value of each replica]}, overlay only
+            kwargs: see KubeProcessSpec
+        """
+        kwargs['standalone'] = True
+        super().__init__(name, **kwargs)
+        if mode not in self._MODES:
+            raise ValueError('Unknown replica mode "{}", use {}'.format(
+                mode, ' or '.join(self._MODES)))
+        self.num_replicas = num_replicas
+        self.mode = mode
+        self.replica_envs = {}
+        if replica_envs is not None:
+            self.set_replica_envs(replica_envs)
+
+    @marks_dirty
+    def set_replica_envs(self, replica_envs):
+        if self.mode != 'overlay':
+            raise ValueError('Per-replica env of {} requires mode overlay'.format(self.name))
+        for name, values in replica_envs.items():
+            if len(values) != self.num_replicas:
+                raise ValueError('Env {} of {} has {} values for {} replicas'.format(
+                    name, self.name, len(values), self.num_replicas))
+            self.replica_envs[str(name)] = [str(v) for v in values]
+
+    def replica_names(self):
+        return ['{}-{}'.format(self.name, i) for i in range(self.num_replicas)]
+
+    def binds(self, spec):
+        raise ValueError('Replicas of {} cannot bind a service, '
+                         'every replica would need its own'.format(self.name))
+
+    def exposes(self, spec):
+        raise ValueError('Replicas of {} cannot expose a service, '
+                         'every replica would need its own'.format(self.name))
+
+    def _load_dict(self, di):
+        super()._load_dict(di)
+        self.num_replicas = di['num_replicas']
+        self.mode = di['mode']
+        self.replica_envs = di['replica_envs']
+
+    def dump_dict(self):
+        di = super().dump_dict()
+        di['num_replicas'] = self.num_replicas
+        di['mode'] = self.mode
+        di['replica_envs'] = self.replica_envs
+        return di
+
+    def _indexed_job(self, pod):
+        index_env = {
+            'name': 'SYMPHONY_REPLICA_INDEX',
+            'valueFrom': {'fieldRef': {'fieldPath':
+                "metadata.annotations['batch.kubernetes.io/job-completion-index']"}}
+        }
+        spec = dict(pod['spec'])
+        spec['containers'] = [dict(c, env=c.get('env', []) + [index_env])
+                              for c in spec['containers']]
+        if spec.get('restartPolicy', 'Always') == 'Always':
+            spec['restartPolicy'] = 'OnFailure'
+        return {
+            'apiVersion': 'batch/v1',
+            'kind': 'Job',
+            'metadata': pod['metadata'],
+            'spec': {
+                'completionMode': 'Indexed',
+                'completions': self.num_replicas,
+                'parallelism': self.num_replicas,
+                'template': {
+                    'metadata': {'labels': pod['metadata']['labels']},
+                    'spec': spec,
+                },
+            },
+        }
+
+    def _overlay(self, pod, i):
+        name = '{}-{}'.format(self.name, i)
+        labels = dict(pod['metadata']['labels'],
+                      symphony_pg=name, symphony_replica_of=self.name)
+        env = [{'name': 'SYMPHONY_REPLICA_INDEX', 'value': str(i)}]
+        env += [{'name': k, 'value': v[i]} for k, v in self.replica_envs.items()]
+        spec = dict(pod['spec'])
+        # the container is named after the pod, like any standalone process,
+        # so that `symphony log agent-0` finds it
+        spec['containers'] = [dict(c, env=c.get('env', []) + env,
+                                   name=name if c['name'] == self.name else c['name'])
+                              for c in spec['containers']]
+        return dict(pod, metadata=dict(pod['metadata'], name=name, labels=labels),
+                    spec=spec)
+
+    def iter_objects(self, format='yaml', fast=False):
+        """
+        Yields (<kind>/<name>, document) for the rendered replicas,
+        see KubeConfigYML.render for the args
+        """
+        pod = benedict_to_dict(self.pod_yml.data)
+        if self.mode == 'indexed-job':
+            yield 'Job/' + self.name, render_data(self._indexed_job(pod), format, fast)
+            return
+        for i in range(self.num_replicas):
+            overlay = self._overlay(pod, i)
+            yield 'Pod/' + overlay['metadata']['name'], render_data(overlay, format, fast)
+
+    def yml(self):
+        return '---\n'.join(document for _, document in self.iter_objects())
@@ -1,4 +1,5 @@
 from symphony.spec import ProcessGroupSpec
+from symphony.spec.base import marks_dirty
 from symphony.utils.common import sanitize_name_kubernetes, strip_repository_name
 from .process import KubeProcessSpec
 from .builder import (
@@ -41,22 +42,28 @@ class KubeProcessGroupSpec(ProcessGroupSpec):
 
     ### Pod level 
 
+    @marks_dirty
     def add_labels(self, **kwargs):
         self.pod_yml.add_labels(**kwargs)
 
+    @marks_dirty
     def add_label(self, key, val):
         self.pod_yml.add_label(key, val)
 
+    @marks_dirty
     def restart_policy(self, policy):
         self.pod_yml.restart_policy(policy)
 
+    @marks_dirty
     def add_toleration(self, **kwargs):
         self.pod_yml.add_toleration(**kwargs)
 
+    @marks_dirty
     def node_selector(self, key, value):
         self.pod_yml.node_selector(key, value)
 
     ### Batch methods
+    @marks_dirty
     def mount_volume(self, volume, path):
         self.pod_yml.mount_volume(volume, path)
 
@@ -1,9 +1,23 @@
 """
 All experiments, processes, and process_groups extend from this base class
 """
+import functools
 import benedict.data_format as df
 
 
+def marks_dirty(method):
+    """
+    Decorates a mutator of a process or process group spec, so that the
+    next ExperimentSpec.compile re-derives the spec
+    """
+    @functools.wraps(method)
+    def wrapped(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self.mark_dirty()
+        return result
+    return wrapped
+
+
 class BaseSpec:
     def __init__(self, name):
         self.name = name
@@ -18,6 +18,13 @@ class ExperimentSpec(BaseSpec):
         self.lone_processes = {}
         self.all_processes = {}
         self.process_groups = {}
+        # names of the processes / process groups changed since last compile
+        self._dirty_processes = set()
+        self._dirty_process_groups = set()
+        self._services_changed = False
+        # environment variables last pushed to the processes
+        self._pushed_env = {}
+        self._env_processes = set()
 
     def add_process_group(self, process_group):
         assert isinstance(process_group, ProcessGroupSpec)
@@ -28,6 +35,7 @@ class ExperimentSpec(BaseSpec):
                 .format(process_group_name, self.name))
         self.process_groups[process_group_name] = process_group
         process_group._set_experiment(self)
+        self._mark_process_group_dirty(process_group)
 
     def add_process_groups(self, process_groups):
         for process_group in process_groups:
@@ -62,6 +70,7 @@ class ExperimentSpec(BaseSpec):
             self.lone_processes[process_name] = process
         self.all_processes[process_name] = process
         process._set_experiment(self)
+        self._mark_dirty(process, services=True)
 
     def add_processes(self, processes):
         for process in processes:
@@ -85,6 +94,70 @@ class ExperimentSpec(BaseSpec):
     def list_all_processes(self):
         return self.all_processes.values()
 
+    # ---------------- incremental compile -----------------
+    def _mark_dirty(self, process, services=False):
+        self._dirty_processes.add(process.name)
+        if services:
+            self._services_changed = True
+
+    def _mark_process_group_dirty(self, process_group):
+        self._dirty_process_groups.add(process_group.name)
+
+    def _list_dirty_processes(self):
+        return [self.all_processes[name] for name in self._dirty_processes]
+
+    def _list_dirty_process_groups(self):
+        """
+        Returns:
+            process groups changed since last compile, including the ones
+            with a changed process
+        """
+        names = set(self._dirty_process_groups)
+        for process in self._list_dirty_processes():
+            if process.parent_process_group is not None:
+                names.add(process.parent_process_group.name)
+        return [self.process_groups[name] for name in names]
+
+    def _clear_dirty(self):
+        """
+        Called at the end of compile
+        """
+        self._dirty_processes = set()
+        self._dirty_process_groups = set()
+        self._services_changed = False
+
+    def _push_envs(self, env_dict):
+        """
+        Sets all of env_dict on processes that have never received it,
+        and only the entries changed since the last push on the others
+        """
+        changed = {k: v for k, v in env_dict.items()
+                   if k not in self._pushed_env or self._pushed_env[k] != v}
+        if changed:
+            processes = self.list_all_processes()
+        else:
+            processes = self._list_dirty_processes()
+        for process in processes:
+            if process.name in self._env_processes:
+                if changed:
+                    process.set_envs(changed)
+            else:
+                process.set_envs(env_dict)
+                self._env_processes.add(process.name)
+        self._pushed_env = dict(env_dict)
+
+    def _publish_env_file(self, env_file):
+        """
+        Writes the address book to env_file and points the processes that
+        do not have it yet to the file, instead of copying the address book
+        into the env of every process
+        """
+        self.address_book.dump_env_file(env_file)
+        for process in self._list_dirty_processes():
+            if process.name not in self._env_processes:
+                process.env_file = env_file
+                self._env_processes.add(process.name)
+
     @classmethod
     def load_dict(cls, di):
         name = di['name']
@@ -64,6 +64,7 @@ class ProcessSpec(BaseSpec):
         spec(str/list(str)/dict(str: int)): specify the services to provide
         """
     self.binded_services.update(parse_service_spec(spec))
+    self.mark_dirty(services=True)
 
   def connects(self, spec):
     """ Declare that this process connects to an address / an service
@@ -76,6 +77,7 @@ class ProcessSpec(BaseSpec):
             '[Error] When connecting to {}, a port is specified. Port must be None when connecting'
             .format(k))
     self.connected_services.update(spec)
+    self.mark_dirty(services=True)
 
   def exposes(self, spec):
     """ Declare that this process binds to an address / provides a service
@@ -83,6 +85,15 @@ class ProcessSpec(BaseSpec):
             Args:
         """
     self.exposed_services.update(parse_service_spec(spec))
+    self.mark_dirty(services=True)
+
+  def mark_dirty(self, services=False):
+    """ Tells the experiment to re-derive this process on the next compile
+        Args:
+        services(bool): the declared services changed as well
+        """
+    if self.parent_experiment is not None:
+      self.parent_experiment._mark_dirty(self, services=services)
 
   @classmethod
   def load_dict(cls, di):
@@ -34,6 +34,13 @@ class ProcessGroupSpec(BaseSpec):
         for process in self.processes.values():
             experiment.add_process(process, lone=False)
 
+    def mark_dirty(self):
+        """
+        Tells the experiment to re-derive this process group on the next compile
+        """
+        if self.parent_experiment is not None:
+            self.parent_experiment._mark_process_group_dirty(self)
+
     def get_process(self, name):
         return self.processes[name]
 
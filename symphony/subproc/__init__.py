@@ -1,4 +1,4 @@
-from .manager import SubprocManager
+from .manager import SubprocManager, RestartPolicy
 from .cluster import SubprocCluster
 from .process_group import SubprocProcessGroupSpec
 from .process import SubprocProcessSpec
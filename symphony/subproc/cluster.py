@@ -3,8 +3,10 @@ import time
 import shlex
 from .experiment import SubprocExperimentSpec
 from .manager import SubprocManager
+from . import supervisor
 from symphony.engine import Cluster
 from symphony.errors import *
+from symphony.utils.common import print_err, parse_duration
 
 
 def _logger(verbose):
@@ -15,10 +17,20 @@ def _logger(verbose):
 
 
 class SubprocCluster(Cluster):
+    # launch() blocks until all processes of the experiment exit,
+    # unless the cluster is detached
+    launch_concurrency = 1
+
     def __init__(self,
                  stdout_mode='print',
                  stderr_mode='print',
                  log_dir=None,
+                 detach=False,
+                 run_dir='~/.symphony/subproc',
+                 max_log_bytes=None,
+                 max_log_age=None,
+                 log_backups=5,
+                 compress_logs=False,
                  ):
         """
         Args:
@@ -26,24 +38,95 @@ class SubprocCluster(Cluster):
             stderr_mode: ['print', 'file', 'none', 'stdout']
             log_dir: where stdout is saved as <name>.out and stderr as <name>.err
               if either stdout or stderr mode is file, log_dir cannot be None
+            detach: launch() hands the processes over to a supervisor daemon
+              and returns immediately. 'print' modes are saved to files
+              instead, under <log_dir or run_dir>/<experiment_name>
+            run_dir: where supervisors keep their sockets and plans. All
+              query methods (list_experiments, describe_*, get_log, delete)
+              talk to the supervisors found in run_dir
+            max_log_bytes, max_log_age, log_backups, compress_logs:
+              log rotation in file mode, see SubprocManager
         """
         super().__init__()  # just for linter's happiness
-        self._manager = SubprocManager(
-            stdout_mode=stdout_mode,
-            stderr_mode=stderr_mode,
-            log_dir=log_dir
-        )
+        self.stdout_mode = stdout_mode
+        self.stderr_mode = stderr_mode
+        self.log_dir = log_dir
+        self.detach = detach
+        self.run_dir = os.path.expanduser(run_dir)
+        self.log_rotation = {
+            'max_log_bytes': max_log_bytes,
+            'max_log_age': max_log_age,
+            'log_backups': log_backups,
+            'compress_logs': compress_logs,
+        }
+        if detach:
+            self.launch_concurrency = None
+            self._manager = None
+        else:
+            self._manager = SubprocManager(
+                stdout_mode=stdout_mode,
+                stderr_mode=stderr_mode,
+                log_dir=log_dir,
+                **self.log_rotation
+            )
 
     # =================== Private helpers ====================
     def _launch_process(self, name, p, dry_run):
         if dry_run:
-            print(p.cmd, '; ENV=', p.env)
+            print(p.get_cmd(), '; ENV=', p.env)
         else:
-            self._manager.launch(name, p.cmd, p.env)
+            self._manager.launch(name, p.get_cmd(), p.env,
+                                 restart_policy=p.restart_policy)
 
     def _join(self):
         self._manager.join(kill_on_error=True)
 
+    def restart_counts(self, experiment_name=None):
+        """
+        Args:
+            experiment_name: query a detached experiment, None for the
+                experiment launched in the foreground by this cluster
+
+        Returns:
+            {process_name: number of times the process has been restarted}
+            Processes in a process group are named "<group>:<process>"
+        """
+        if experiment_name is None and self._manager is not None:
+            return dict(self._manager.restart_counts)
+        processes = self._supervisor(experiment_name).request('describe')
+        return {name: info['restarts'] for name, info in processes.items()}
+
+    def _supervisor(self, experiment_name):
+        if experiment_name is None:
+            experiment_name = self.current_experiment()
+        return supervisor.SupervisorClient(
+            supervisor.socket_path(self.run_dir, experiment_name))
+
+    def _detached_plan(self, spec, processes):
+        manager_kwargs = {
+            'stdout_mode': self.stdout_mode,
+            'stderr_mode': self.stderr_mode,
+            'log_dir': os.path.join(os.path.expanduser(self.log_dir or self.run_dir),
+                                    spec.name),
+        }
+        manager_kwargs.update(self.log_rotation)
+        # nobody is watching the terminal of a supervisor
+        if manager_kwargs['stdout_mode'] == 'print':
+            manager_kwargs['stdout_mode'] = 'file'
+        if manager_kwargs['stderr_mode'] == 'print':
+            manager_kwargs['stderr_mode'] = 'file'
+        return {
+            'processes': [{
+                'name': name,
+                'cmd': p.get_cmd(),
+                'env': {k: str(v) for k, v in p.env.items()},
+                'restart_policy': p.restart_policy.dump_dict()
+                                  if p.restart_policy is not None else None,
+            } for name, p in processes],
+            'manager_kwargs': manager_kwargs,
+            'kill_on_error': True,
+        }
+
     # ===================== Launch API =======================
     def new_experiment(self, *args, **kwargs):
         return SubprocExperimentSpec(*args, **kwargs)
@@ -56,15 +139,138 @@ class SubprocCluster(Cluster):
 
         _log('Creating new Experiment "{}"'.format(spec.name))
 
+        processes = []
         for pg in spec.list_process_groups():
-            _log(' --> Creating process group', pg.name)
             for p in pg.list_processes():
-                name = pg.name + ':' + p.name
-                self._launch_process(name, p, dry_run=dry_run)
-                _log(' --> --> Created process', name)
+                processes.append((pg.name + ':' + p.name, p))
+        processes.extend((p.name, p) for p in spec.list_processes())
 
-        for p in spec.list_processes():
-            self._launch_process(p.name, p, dry_run=dry_run)
-            _log(' --> Created process', p.name)
+        if self.detach and not dry_run:
+            if spec.name in self.list_experiments():
+                raise ResourceExistsError(
+                    'Experiment "{}" is already running'.format(spec.name))
+            pid = supervisor.spawn_supervisor(
+                spec.name, self.run_dir, self._detached_plan(spec, processes))
+            for name, _ in processes:
+                _log(' --> Created process', name)
+            _log('Experiment "{}" is supervised by pid {}'.format(spec.name, pid))
+            return
+
+        for name, p in processes:
+            self._launch_process(name, p, dry_run=dry_run)
+            _log(' --> Created process', name)
 
         self._join()
+
+    def delete(self, experiment_name):
+        self._supervisor(experiment_name).request('delete')
+
+    def delete_batch(self, experiment_names):
+        for name in experiment_names:
+            self.delete(name)
+
+    # ===================== Query API ========================
+    def list_experiments(self):
+        """
+        Returns:
+            names of the experiments with a live supervisor in run_dir.
+            Stale sockets of dead supervisors are removed
+        """
+        experiments = []
+        for name, path in supervisor.list_socket_paths(self.run_dir).items():
+            if supervisor.SupervisorClient(path).is_alive():
+                experiments.append(name)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:  # supervisor cleaned up meanwhile
+                    pass
+        return experiments
+
+    def set_experiment(self, experiment_name):
+        print('Subproc cluster does not persist current experiments.')
+        exit(0)
+
+    def current_experiment(self):
+        experiments = self.list_experiments()
+        if len(experiments) == 1:
+            return experiments[0]
+        if len(experiments) == 0:
+            print('No active experiments')
+        else:
+            print('More than one experiments are active, please specify '
+                  'the experiment that you are querying for')
+            print('Active experiments:')
+            for experiment in experiments:
+                print('\t{}'.format(experiment))
+        exit(0)
+
+    def describe_experiment(self, experiment_name):
+        """
+        Returns:
+        {
+            'pgroup1': {
+                'p1': {'status': 'running', 'pid': 123, 'exit_code': None,
+                       'restarts': 0},
+            },
+            None: {  # processes without a group
+                'p3_lone': {'status': 'error', 'pid': 125, 'exit_code': 1,
+                            'restarts': 3}
+            }
+        }
+        """
+        processes = self._supervisor(experiment_name).request('describe')
+        result = {}
+        for name, info in processes.items():
+            tokens = name.split(':')
+            if len(tokens) == 1:
+                group, process = None, tokens[0]
+            else:
+                group, process = tokens[0], tokens[1]
+            result.setdefault(group, {})[process] = info
+        return result
+
+    def describe_process_group(self, experiment_name, process_group_name):
+        return self.describe_experiment(experiment_name)[process_group_name]
+
+    def describe_process(self,
+                         experiment_name,
+                         process_name,
+                         process_group_name=None):
+        return self.describe_experiment(experiment_name)\
+            [process_group_name][process_name]
+
+    def get_log(self, experiment_name, process_name, process_group=None,
+                follow=False, since=0, tail=100, print_logs=False):
+        """
+        Reads the stdout log file of a detached process, through its
+        supervisor
+
+        Args:
+            since: relative duration like 5s, 2m, 3h, only get logs written
+                since then. 0 for all logs
+            tail(int): only get the last tail lines, None or -1 for all
+        """
+        if tail is not None and tail < 0:
+            tail = None
+        client = self._supervisor(experiment_name)
+        name = process_name
+        if process_group is not None:
+            name = process_group + ':' + process_name
+        if follow:
+            path = client.request('log_paths', name=name)['out']
+            if path is None:
+                print_err('[Warning] stdout of {} is not saved to a file'
+                          .format(name))
+                return ''
+            # -F keeps following across log rotations
+            cmd = 'tail -n {} -F {}'.format(tail if tail else '+1',
+                                            shlex.quote(path))
+            os.system(cmd)
+            return ''
+        seconds = parse_duration(since)
+        since_time = time.time() - seconds if seconds > 0 else None
+        logs = client.request('log', name=name, tail=tail, since=since_time)
+        if print_logs:
+            print(logs, end='')
+        return logs
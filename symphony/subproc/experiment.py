@@ -1,9 +1,8 @@
 import os
-import copy
 from symphony.spec import ExperimentSpec
 from symphony.utils.common import compact_range_dumps, compact_range_loads
 from symphony.utils.common import print_err
-from symphony.engine import AddressBook
+from symphony.engine import PortAllocator
 from .process import SubprocProcessSpec
 from .process_group import SubprocProcessGroupSpec
 
@@ -12,27 +11,36 @@ class SubprocExperimentSpec(ExperimentSpec):
     _ProcessClass = SubprocProcessSpec
     _ProcessGroupClass = SubprocProcessGroupSpec
 
-    def __init__(self, name, port_range=None):
+    def __init__(self, name, port_range=None, env_file=None):
         """
         Args:
             name: name of the Experiment
+            env_file: write the address book to this file, which every
+                process sources before its command, instead of copying
+                the address book into the env of every process
         """
         assert ':' not in name
         super().__init__(name)
         if port_range is None:
             port_range = list(range(7000, 9000))
         self.port_range = list(port_range)
+        self._ports = PortAllocator(self.port_range)
+        if env_file is not None:
+            env_file = os.path.abspath(os.path.expanduser(env_file))
+        self.env_file = env_file
         self.exposed_services = {}
         self.binded_services = {}
 
     def compile(self):
         """
-        Compile necessary information before launch
+        Compile necessary information before launch. Only the processes
+        changed since the last compile are looked at again, services
+        keep the ports they were given
         """
-        self.address_book = AddressBook()
-
-        self.declare_services()
+        if self._services_changed:
+            self.declare_services(self._list_dirty_processes())
         self.assign_addresses()
+        self._clear_dirty()
 
     def assign_addresses(self):
         for exposed_service_name in self.exposed_services:
@@ -41,55 +49,113 @@ class SubprocExperimentSpec(ExperimentSpec):
         for binded_service_name in self.binded_services:
             port = self.binded_services[binded_service_name]
             self.address_book.add_entry(binded_service_name, '127.0.0.1', port)
-        env_dict = self.address_book.dump()
-        for process in self.list_all_processes():
-            process.set_envs(env_dict)
+        if self.env_file is None:
+            self._push_envs(self.address_book.dump())
+        else:
+            self._publish_env_file(self.env_file)
 
-    def declare_services(self):
+    def declare_services(self, processes=None):
         """
-            Loop through all processes and assign addresses for all declared ports
+            Loop through processes and assign addresses for all newly declared ports
+
+            Args:
+                processes: defaults to all processes
         """
+        if processes is None:
+            processes = self.list_all_processes()
         exposed = {}
         binded = {}
-        port_range = copy.deepcopy(self.port_range)
-        for process in self.list_all_processes():
+        # (services, name, port) of the ports that were already taken
+        conflicts = []
+        for process in processes:
             for exposed_service_name in process.exposed_services:
                 port = process.exposed_services[exposed_service_name]
+                if exposed_service_name in self.exposed_services:
+                    if port is None:
+                        continue
+                    self._ports.release(self.exposed_services[exposed_service_name])
                 exposed[exposed_service_name] = port
-                if port in self.port_range:
-                    port_range.remove(port)
+                if port is not None and not self._ports.reserve(port):
+                    conflicts.append((exposed, exposed_service_name, port))
 
             for binded_service_name in process.binded_services:
                 port = process.binded_services[binded_service_name]
+                if binded_service_name in self.binded_services:
+                    if port is None:
+                        continue
+                    self._ports.release(self.binded_services[binded_service_name])
                 binded[binded_service_name] = port
-                if port in self.port_range:
-                    port_range.remove(port)
+                if port is not None and not self._ports.reserve(port):
+                    conflicts.append((binded, binded_service_name, port))
+
+        for services, name, port in conflicts:
+            self._resolve_port_conflict(services, name, port, exposed, binded)
 
         for exposed_service_name, port in exposed.items():
             if port is None:
-                port = self.get_port(port_range)
+                port = self.get_port()
             self.exposed_services[exposed_service_name] = port
         for binded_service_name, port in binded.items():
             if port is None:
-                port = self.get_port(port_range)
+                port = self.get_port()
             self.binded_services[binded_service_name] = port
-        self.validate_connect()
+        self.validate_connect(processes)
+
+    def _resolve_port_conflict(self, services, name, port, exposed, binded):
+        """
+        Called when the port pinned by a service is already taken. A
+        service declared before that did not ask for the port gets a new
+        one and its processes are marked dirty
+
+        Args:
+            services: exposed or binded, the one name belongs to
+            exposed, binded: ports declared in this compile, by service name
+
+        Raises:
+            ValueError if another service asks for the port as well
+        """
+        if port not in self._ports or self._ports.reserve(port):
+            # outside of the range, or given back later in the loop
+            return
+        for new, existing, attr in [(exposed, self.exposed_services, 'exposed_services'),
+                                    (binded, self.binded_services, 'binded_services')]:
+            for other_name, other_port in new.items():
+                if other_port == port and (new is not services or other_name != name):
+                    raise ValueError('Services {} and {} both ask for port {}'
+                                     .format(other_name, name, port))
+            for other_name, other_port in existing.items():
+                if other_port != port or other_name in new:
+                    continue
+                holders = [process for process in self.list_all_processes()
+                           if other_name in getattr(process, attr)]
+                if any(getattr(process, attr)[other_name] is not None
+                       for process in holders):
+                    raise ValueError('Services {} and {} both ask for port {}'
+                                     .format(other_name, name, port))
+                # gets a new port below
+                new[other_name] = None
+                for process in holders:
+                    process.mark_dirty()
+                return
 
-    def validate_connect(self):
+    def validate_connect(self, processes=None):
         """
         Check if all connected services are correctly provided
         """
-        for process in self.list_all_processes():
+        if processes is None:
+            processes = self.list_all_processes()
+        for process in processes:
             for connected_service_name in process.connected_services:
                 if connected_service_name not in self.binded_services:
                     raise ValueError('Service {} is connected by process {} but not binded' \
                                      .format(connected_service_name, process.name))
 
-    def get_port(self, port_range):
-        if len(port_range) == 0:
+    def get_port(self):
+        port = self._ports.allocate()
+        if port is None:
             raise ValueError('[Error] Experiment {} ran out of ports on Tmux.' \
                              .format(self.name))
-        return port_range.pop(0)
+        return port
 
     # def _load_dict(self, di):
     #     super()._load_dict(di)
@@ -0,0 +1,322 @@
+"""
+Size/time bounded log files for SubprocManager file mode.
+
+The active segment is <path>. On rotation it becomes <path>.1 (<path>.1.gz
+if compressed), older segments shift to <path>.2 ... and the oldest beyond
+backup_count are deleted.
+Every segment has a sidecar index <segment>.idx of "offset lineno time"
+lines, one at least every index_bytes bytes or index_interval seconds,
+always at the start of a line. read_log(since=T) bisects the index and
+seeks instead of scanning the logs from the start.
+"""
+import os
+import io
+import gzip
+import time
+import bisect
+import shutil
+import threading
+
+
+_INDEX_SUFFIX = '.idx'
+
+
+def _segment_path(path, k, compressed=False):
+    if k == 0:
+        return path
+    return '{}.{}{}'.format(path, k, '.gz' if compressed else '')
+
+
+def _existing_segment(path, k):
+    """
+    Returns:
+        the data file of the k-th segment, None if it does not exist
+    """
+    for compressed in [False, True]:
+        segment = _segment_path(path, k, compressed)
+        if os.path.exists(segment):
+            return segment
+    return None
+
+
+def _index_path(path, k):
+    return _segment_path(path, k) + _INDEX_SUFFIX
+
+
+def _remove_segment(path, k):
+    for f in [_existing_segment(path, k), _index_path(path, k)]:
+        if f is not None and os.path.exists(f):
+            os.remove(f)
+
+
+class RotatingLogWriter:
+    def __init__(self,
+                 path,
+                 max_bytes=None,
+                 max_age=None,
+                 backup_count=5,
+                 compress=False,
+                 index_bytes=64 * 1024,
+                 index_interval=1.,
+                 mode='w'):
+        """
+        Args:
+            path: the active log file
+            max_bytes: rotate once the active segment grows beyond this size,
+                None for no limit
+            max_age: rotate once the active segment is older than this many
+                seconds, None for no limit
+            backup_count: number of rotated segments to keep
+            compress: gzip rotated segments
+            index_bytes, index_interval: how often to add an index entry
+            mode: 'w' to start over, 'a' to continue existing logs
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        self.compress = compress
+        self.index_bytes = index_bytes
+        self.index_interval = index_interval
+        self._lock = threading.Lock()
+        if mode == 'w':
+            for k in range(1, backup_count + 2):
+                _remove_segment(path, k)
+        self._open(mode)
+
+    def _open(self, mode):
+        self._file = open(self.path, mode + 'b')
+        self._index = open(self.path + _INDEX_SUFFIX, mode)
+        self._offset = self._file.seek(0, io.SEEK_END)
+        self._lineno = 0
+        self._last_index_offset = None
+        self._last_index_time = 0.
+        self._segment_start = time.time()
+        self._last_write_time = self._segment_start
+        if self._offset > 0:  # continue the line count of the segment
+            self._lineno = _count_lines(self.path)
+        self._at_line_start = True
+
+    def write(self, data):
+        """
+        Args:
+            data (bytes): raw process output, not necessarily whole lines
+        """
+        if not data:
+            return
+        with self._lock:
+            while data:
+                now = time.time()
+                chunk = self._fit(data)
+                if self._at_line_start and \
+                        self._needs_rotation(len(chunk), now):
+                    self._rotate()
+                    chunk = self._fit(data)
+                self._write_chunk(chunk, now)
+                data = data[len(chunk):]
+
+    def _fit(self, data):
+        """
+        Returns:
+            the longest prefix of whole lines of data that fits in the active
+            segment, or its first line if none does
+        """
+        if self.max_bytes is None or \
+                self._offset + len(data) <= self.max_bytes:
+            return data
+        room = max(0, self.max_bytes - self._offset)
+        cut = data.rfind(b'\n', 0, room)
+        if cut < 0:
+            cut = data.find(b'\n')
+        return data if cut < 0 else data[:cut + 1]
+
+    def _write_chunk(self, data, now):
+        if self._at_line_start and self._needs_index(now):
+            self._add_index(self._offset, self._lineno, now)
+        self._file.write(data)
+        self._file.flush()
+        last_newline = data.rfind(b'\n')
+        self._lineno += data.count(b'\n')
+        self._offset += len(data)
+        self._last_write_time = now
+        self._at_line_start = last_newline == len(data) - 1
+        if last_newline >= 0 and not self._at_line_start:
+            # index the start of the trailing partial line
+            line_start = self._offset - len(data) + last_newline + 1
+            if self._needs_index(now):
+                self._add_index(line_start, self._lineno, now)
+
+    def _needs_index(self, now):
+        return (self._last_index_offset is None
+                or self._offset - self._last_index_offset >= self.index_bytes
+                or now - self._last_index_time >= self.index_interval)
+
+    def _add_index(self, offset, lineno, now):
+        self._index.write('{} {} {:.3f}\n'.format(offset, lineno, now))
+        self._index.flush()
+        self._last_index_offset = offset
+        self._last_index_time = now
+
+    def _needs_rotation(self, size, now):
+        """
+        Rotates before a write at a line start, so that a segment only
+        exceeds max_bytes if a single line does
+        """
+        if self._offset == 0:
+            return False
+        if self.max_bytes is not None and self._offset + size > self.max_bytes:
+            return True
+        if self.max_age is not None and now - self._segment_start >= self.max_age:
+            return True
+        return False
+
+    def _rotate(self):
+        # mark the end of the segment, so that since queries can skip it
+        self._add_index(self._offset, self._lineno, self._last_write_time)
+        self._file.close()
+        self._index.close()
+        for k in range(self.backup_count, 0, -1):
+            segment = _existing_segment(self.path, k)
+            if segment is None:
+                continue
+            if k == self.backup_count:
+                _remove_segment(self.path, k)
+            else:
+                os.rename(segment, _segment_path(self.path, k + 1,
+                                                 segment.endswith('.gz')))
+                os.rename(_index_path(self.path, k),
+                          _index_path(self.path, k + 1))
+        if self.backup_count > 0:
+            os.rename(self.path + _INDEX_SUFFIX, _index_path(self.path, 1))
+            if self.compress:
+                with open(self.path, 'rb') as fin, \
+                        gzip.open(_segment_path(self.path, 1, True), 'wb') as fout:
+                    shutil.copyfileobj(fin, fout)
+                os.remove(self.path)
+            else:
+                os.rename(self.path, _segment_path(self.path, 1))
+        self._open('w')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._index.close()
+
+
+def _count_lines(path, block_size=1024 * 1024):
+    count = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            count += block.count(b'\n')
+    return count
+
+
+def _open_segment(segment):
+    if segment.endswith('.gz'):
+        return gzip.open(segment, 'rb')
+    return open(segment, 'rb')
+
+
+def _load_index(path, k):
+    """
+    Returns:
+        (offsets, times) of the index entries of the k-th segment
+    """
+    offsets, times = [], []
+    try:
+        with open(_index_path(path, k)) as f:
+            for line in f:
+                tokens = line.split()
+                if len(tokens) == 3:  # skip a half-written last entry
+                    offsets.append(int(tokens[0]))
+                    times.append(float(tokens[2]))
+    except FileNotFoundError:
+        pass
+    return offsets, times
+
+
+def _tail_segment(segment, n, block_size=8192):
+    """
+    Returns:
+        the last n lines of a segment, as a list of bytes
+    """
+    if n <= 0:
+        return []
+    if segment.endswith('.gz'):  # rotated segments are bounded in size
+        with _open_segment(segment) as f:
+            return f.read().splitlines(keepends=True)[-n:]
+    with open(segment, 'rb') as f:
+        f.seek(0, io.SEEK_END)
+        position = f.tell()
+        data = b''
+        # n + 1 newlines guarantee n complete lines
+        while position > 0 and data.count(b'\n') <= n:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+    return data.splitlines(keepends=True)[-n:]
+
+
+def _read_since(segment, offsets, times, since):
+    with _open_segment(segment) as f:
+        # the first indexed line written after since
+        i = bisect.bisect_right(times, since)
+        if i == len(offsets):
+            return b''
+        f.seek(offsets[i])
+        return f.read()
+
+
+def read_log(path, tail=None, since=None, index_interval=1.):
+    """
+    Args:
+        path: the active log file of a RotatingLogWriter
+        tail: only return the last tail lines, None or negative for all
+        since: unix time, only return lines written after it. None for all
+        index_interval: of the writer. Lines written up to index_interval
+            before since may be returned as well
+
+    Returns:
+        str
+    """
+    if tail is not None and tail < 0:
+        tail = None
+    segments = []  # newest first
+    k = 0
+    while True:
+        segment = _existing_segment(path, k)
+        if segment is None:
+            break
+        segments.append((k, segment))
+        k += 1
+
+    if since is None:
+        if tail is None:
+            chunks = []
+            for _, segment in reversed(segments):
+                with _open_segment(segment) as f:
+                    chunks.append(f.read())
+            return b''.join(chunks).decode('utf-8', errors='replace')
+        lines = []
+        for _, segment in segments:
+            lines = _tail_segment(segment, tail - len(lines)) + lines
+            if len(lines) >= tail:
+                break
+        return b''.join(lines).decode('utf-8', errors='replace')
+
+    # every indexed line is followed by index_interval worth of output at most
+    since -= index_interval
+    chunks = []
+    for k, segment in segments:
+        offsets, times = _load_index(path, k)
+        if not times or times[0] > since:  # all of it is new
+            with _open_segment(segment) as f:
+                chunks.append(f.read())
+            continue
+        chunks.append(_read_since(segment, offsets, times, since))
+        break
+    data = b''.join(reversed(chunks))
+    if tail is not None:
+        data = b''.join(data.splitlines(keepends=True)[-tail:]) if tail > 0 else b''
+    return data.decode('utf-8', errors='replace')
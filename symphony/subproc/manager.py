@@ -5,26 +5,231 @@ import os
 import subprocess
 import time
 import signal
+import selectors
 import sys
+import threading
+from collections import OrderedDict
+from .log_writer import RotatingLogWriter, read_log
+
+
+class _ChildExitSelector:
+    """
+    Blocks until child processes exit, without polling.
+    Uses one pidfd per child where available (Linux >= 5.3), otherwise a
+    SIGCHLD handler that wakes up a selector through set_wakeup_fd().
+    SIGCHLD mode must be created from the main thread.
+    """
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._fds = {}  # {"name": pidfd or None}
+        self._ready = set()
+        self._wakeup_pipe = None
+        self._old_sigchld_handler = None
+        self._old_wakeup_fd = None
+        self.use_pidfd = self._pidfd_supported()
+        if not self.use_pidfd:
+            self._install_sigchld()
+
+    def _pidfd_supported(self):
+        if not hasattr(os, 'pidfd_open'):
+            return False
+        try:  # the syscall may be missing even if python exposes it
+            os.close(os.pidfd_open(os.getpid()))
+        except OSError:
+            return False
+        return True
+
+    def _install_sigchld(self):
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+        self._wakeup_pipe = (read_fd, write_fd)
+        self._old_sigchld_handler = signal.signal(signal.SIGCHLD,
+                                                  lambda sig, frame: None)
+        self._old_wakeup_fd = signal.set_wakeup_fd(write_fd)
+        self._selector.register(read_fd, selectors.EVENT_READ, None)
+
+    def register(self, name, proc):
+        fd = None
+        if self.use_pidfd:
+            try:
+                fd = os.pidfd_open(proc.pid)
+            except ProcessLookupError:  # already reaped
+                pass
+        self._fds[name] = fd
+        if fd is None:
+            # check once, the child may have exited before we started
+            # listening for it
+            self._ready.add(name)
+        else:
+            self._selector.register(fd, selectors.EVENT_READ, name)
+
+    def unregister(self, name):
+        fd = self._fds.pop(name)
+        self._ready.discard(name)
+        if fd is not None:
+            self._selector.unregister(fd)
+            os.close(fd)
+
+    def wait(self, timeout=None):
+        """
+        Args:
+            timeout: seconds to wait at most, None to wait forever
+
+        Returns:
+            names of the registered processes that may have exited,
+            empty if timed out
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while not self._ready:
+            if deadline is not None:
+                timeout = max(0., deadline - time.time())
+            events = self._selector.select(timeout)
+            if not events:
+                break
+            for key, _ in events:
+                if key.data is None:  # SIGCHLD wakeup pipe
+                    self._drain_wakeup_pipe()
+                    self._ready.update(self._fds)
+                else:
+                    self._ready.add(key.data)
+        ready = self._ready
+        self._ready = set()
+        return ready
+
+    def _drain_wakeup_pipe(self):
+        try:
+            while os.read(self._wakeup_pipe[0], 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        for name in list(self._fds):
+            self.unregister(name)
+        if self._wakeup_pipe is not None:
+            signal.set_wakeup_fd(self._old_wakeup_fd)
+            signal.signal(signal.SIGCHLD, self._old_sigchld_handler)
+            self._selector.unregister(self._wakeup_pipe[0])
+            for fd in self._wakeup_pipe:
+                os.close(fd)
+            self._wakeup_pipe = None
+        self._selector.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RestartPolicy:
+    """
+    When and how fast a process managed by SubprocManager is restarted
+    after it exits
+    """
+    NEVER = 'never'
+    ON_FAILURE = 'on-failure'
+    ALWAYS = 'always'
+    POLICIES = [NEVER, ON_FAILURE, ALWAYS]
+
+    def __init__(self,
+                 policy=NEVER,
+                 max_restarts=None,
+                 backoff=1.,
+                 max_backoff=60.,
+                 reset_after=600.):
+        """
+        Args:
+            policy: ['never', 'on-failure', 'always']
+            max_restarts: give up after this many restarts, None for no limit
+            backoff: seconds to wait before the first restart, doubled after
+                every consecutive restart
+            max_backoff: cap of the restart delay
+            reset_after: a process that stayed up for this many seconds is
+                considered healthy again and restarts at the initial backoff
+        """
+        policy = policy.lower()
+        assert policy in self.POLICIES, \
+            'restart policy must be one of {}'.format(self.POLICIES)
+        self.policy = policy
+        self.max_restarts = max_restarts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.reset_after = reset_after
+
+    def should_restart(self, retcode, restarts):
+        if self.max_restarts is not None and restarts >= self.max_restarts:
+            return False
+        if self.policy == self.ALWAYS:
+            return True
+        if self.policy == self.ON_FAILURE:
+            return retcode != 0
+        return False
+
+    def delay(self, consecutive_restarts):
+        """
+        Returns:
+            seconds to wait before the next restart
+        """
+        return min(self.backoff * 2 ** consecutive_restarts, self.max_backoff)
+
+    @classmethod
+    def load_dict(cls, di):
+        return cls(**di)
+
+    def dump_dict(self):
+        return {
+            'policy': self.policy,
+            'max_restarts': self.max_restarts,
+            'backoff': self.backoff,
+            'max_backoff': self.max_backoff,
+            'reset_after': self.reset_after,
+        }
 
 
 class SubprocManager:
     def __init__(self,
                  stdout_mode='print',
                  stderr_mode='print',
-                 log_dir=None):
+                 log_dir=None,
+                 max_log_bytes=None,
+                 max_log_age=None,
+                 log_backups=5,
+                 compress_logs=False):
         """
         Args:
             stdout_mode: ['print', 'file', 'none']
             stderr_mode: ['print', 'file', 'none', 'stdout']
             log_dir: where stdout is saved as <name>.out and stderr as <name>.err
               if either stdout or stderr mode is file, log_dir cannot be None
+            max_log_bytes: rotate a log file once it grows beyond this size,
+              None for no limit
+            max_log_age: rotate a log file once it is older than this many
+              seconds, None for no limit
+            log_backups: number of rotated log files to keep per stream
+            compress_logs: gzip rotated log files
         """
         self.stdout_mode = stdout_mode.lower()
         self.stderr_mode = stderr_mode.lower()
         assert self.stdout_mode in ['print', 'file', 'none']
         assert self.stderr_mode in ['print', 'file', 'none', 'stdout']
         self.processes = {}  # {"name": Popen}
+        self.restart_policies = {}  # {"name": RestartPolicy}
+        self.restart_counts = {}  # {"name": number of restarts so far}
+        self._launch_args = {}  # {"name": (cmd, env)} for restarts
+        self._start_times = {}
+        self._consecutive_restarts = {}
+        self._pending_restarts = {}  # {"name": time to restart}
+        self._killed = False  # no restarts once kill_all() is called
+        self._log_writer_kwargs = {
+            'max_bytes': max_log_bytes,
+            'max_age': max_log_age,
+            'backup_count': log_backups,
+            'compress': compress_logs,
+        }
+        self._log_writers = {}  # {"name": {"out"/"err": RotatingLogWriter}}
+        self._log_pumps = {}  # {"name": [threads copying output to logs]}
         if stdout_mode == 'file' or stderr_mode == 'file':
             assert log_dir is not None
             self.log_dir = os.path.expanduser(log_dir)
@@ -32,26 +237,45 @@ class SubprocManager:
         else:
             self.log_dir = None
 
-    def launch(self, name, cmd, env):
+    def launch(self, name, cmd, env, restart_policy=None):
         """
         Args:
             name: process name
             cmd: shell command
             env (dict): environment variables
+            restart_policy (RestartPolicy): restart the process when it
+                exits, during join(). None to never restart
 
         Returns:
             Popen
         """
         assert name not in self.processes, 'process "{}" already exists'.format(name)
+        # environment will inherit from parent process
+        assert isinstance(env, dict)
+        for key, value in env.items():
+            if not isinstance(value, str):
+                env[key] = str(value)
+        env.update(os.environ)
+
+        self._launch_args[name] = (cmd, env)
+        if restart_policy is not None:
+            self.restart_policies[name] = restart_policy
+        self.restart_counts[name] = 0
+        self._consecutive_restarts[name] = 0
+        return self._spawn(name, log_file_mode='w')
+
+    def _spawn(self, name, log_file_mode):
+        cmd, env = self._launch_args[name]
+        pipes = []  # [(read_fd, RotatingLogWriter)]
         if self.stdout_mode == 'file':
-            stdout = open(os.path.join(self.log_dir, name+'.out'), 'w')
+            stdout = self._log_pipe(name, 'out', log_file_mode, pipes)
         elif self.stdout_mode == 'print':
             stdout = None
         else:
             stdout = subprocess.DEVNULL
 
         if self.stderr_mode == 'file':
-            stderr = open(os.path.join(self.log_dir, name+'.err'), 'w')
+            stderr = self._log_pipe(name, 'err', log_file_mode, pipes)
         elif self.stderr_mode == 'print':
             stderr = None
         elif self.stderr_mode == 'stdout':
@@ -59,13 +283,6 @@ class SubprocManager:
         else:
             stderr = subprocess.DEVNULL
 
-        # environment will inherit from parent process
-        assert isinstance(env, dict)
-        for key, value in env.items():
-            if not isinstance(value, str):
-                env[key] = str(value)
-        env.update(os.environ)
-
         proc = subprocess.Popen(
             cmd,
             executable='/bin/bash',
@@ -77,9 +294,52 @@ class SubprocManager:
             env=env,
             preexec_fn=os.setsid # put the subprocess in its own process group
         )
+        pumps = self._log_pumps.setdefault(name, [])
+        for read_fd, write_fd, writer in pipes:
+            # the child has its own copy of the write end
+            os.close(write_fd)
+            pump = threading.Thread(target=self._pump_log,
+                                    args=(read_fd, writer), daemon=True)
+            pump.start()
+            pumps.append(pump)
         self.processes[name] = proc
+        self._start_times[name] = time.time()
         return proc
 
+    def _log_pipe(self, name, stream, log_file_mode, pipes):
+        """
+        Returns:
+            write end of a pipe whose output goes to the <name>.<stream> log
+        """
+        writers = self._log_writers.setdefault(name, {})
+        if stream not in writers:
+            writers[stream] = RotatingLogWriter(
+                os.path.join(self.log_dir, name + '.' + stream),
+                mode=log_file_mode, **self._log_writer_kwargs)
+        read_fd, write_fd = os.pipe()
+        pipes.append((read_fd, write_fd, writers[stream]))
+        return write_fd
+
+    @staticmethod
+    def _pump_log(read_fd, writer):
+        # unbuffered: read() returns as soon as any output is available
+        with open(read_fd, 'rb', buffering=0) as pipe:
+            for data in iter(lambda: pipe.read(65536), b''):
+                writer.write(data)
+
+    def _drain_logs(self, timeout=1.):
+        """
+        Waits for the output of exited processes to reach the log files.
+        Grandchildren may keep a pipe open, so wait no longer than timeout
+        """
+        deadline = time.time() + timeout
+        for name, pumps in self._log_pumps.items():
+            for pump in pumps:
+                pump.join(max(0., deadline - time.time()))
+            if not any(pump.is_alive() for pump in pumps):
+                for writer in self._log_writers.pop(name, {}).values():
+                    writer.close()
+
     def poll(self, name):
         """
         Returns:
@@ -93,6 +353,57 @@ class SubprocManager:
     def poll_all(self):
         return {name: self.poll(name) for name in self.processes}
 
+    def describe(self, name):
+        """
+        Returns:
+            {'status', 'pid', 'exit_code', 'restarts'}, status is one of
+            'running', 'restarting', 'done', 'error'
+        """
+        retcode = self.poll(name)
+        if name in self._pending_restarts:
+            status = 'restarting'
+        elif retcode is None:
+            status = 'running'
+        elif retcode == 0:
+            status = 'done'
+        else:
+            status = 'error'
+        return OrderedDict([
+            ('status', status),
+            ('pid', self.processes[name].pid),
+            ('exit_code', retcode),
+            ('restarts', self.restart_counts[name]),
+        ])
+
+    def log_paths(self, name):
+        """
+        Returns:
+            {'out': path or None, 'err': path or None}, None if the stream
+            is not saved to a file
+        """
+        assert name in self.processes, 'process "{}" does not exist'.format(name)
+        paths = {'out': None, 'err': None}
+        if self.stdout_mode == 'file':
+            paths['out'] = os.path.join(self.log_dir, name+'.out')
+        if self.stderr_mode == 'file':
+            paths['err'] = os.path.join(self.log_dir, name+'.err')
+        return paths
+
+    def read_log(self, name, stream='out', tail=None, since=None):
+        """
+        Args:
+            stream: 'out' or 'err'
+            tail: only return the last tail lines, None or negative for all
+            since: unix time, only return lines logged after it. None for all
+
+        Returns:
+            str, empty if the stream is not saved to a file
+        """
+        path = self.log_paths(name)[stream]
+        if path is None:
+            return ''
+        return read_log(path, tail=tail, since=since)
+
     def kill(self, name, signal=signal.SIGTERM, verbose=False):
         if self.poll(name) is None:
             proc = self.processes[name]
@@ -104,6 +415,8 @@ class SubprocManager:
                 print('Sent', self.SIG_DICT[signal], 'to group', group)
 
     def kill_all(self, verbose=False):
+        self._killed = True
+        self._pending_restarts = {}
         for name in self.processes:
             self.kill(name, verbose=verbose)
         if verbose:
@@ -129,34 +442,110 @@ class SubprocManager:
         self.kill_all(verbose=True)
         sys.exit(0)
 
-    def join(self, kill_on_error=True, poll_interval=1.0):
+    def join(self, kill_on_error=True, poll_interval=1.0, event_driven=True):
         """
         Wait for all processes to finish.
         
         Args:
             kill_on_error: True to kill all processes if any of them returns
                 non-zero code.
-            poll_interval: seconds between polling
+            poll_interval: seconds between polling, only used when
+                event_driven is False
+            event_driven: react to child exit notifications (pidfd or
+                SIGCHLD) as soon as they arrive instead of polling every
+                process each poll_interval
         """
         for sig in self.SIG_DICT:
             signal.signal(sig, self._signal_handler)
         remaining_procs = list(self.processes.keys())
-        while remaining_procs:
-            for name in remaining_procs[:]:
+        if event_driven:
+            self._join_event_driven(remaining_procs, kill_on_error)
+        else:
+            self._join_polling(remaining_procs, kill_on_error, poll_interval)
+        self._drain_logs()
+
+    def _join_polling(self, remaining_procs, kill_on_error, poll_interval):
+        running = set(remaining_procs)
+        while running or self._pending_restarts:
+            for name in list(running):
                 proc = self.processes[name]
                 retcode = proc.poll()
                 if retcode is None:  # process still running normally
                     continue
                 else:
-                    remaining_procs.remove(name)
-                    if retcode == 0:
-                        print('PROCESS "{}" DONE'.format(name))
-                    else:
-                        print('PROCESS "{}" TERMINATED WITH ERROR CODE {}'
-                              .format(name, retcode))
-                        if kill_on_error:
-                            print('KILLING ALL REMAINING PROCEESES ...')
-                            self.kill_all(verbose=True)
-                            remaining_procs = []
-                            break
+                    running.discard(name)
+                    if self._on_exit(name, retcode, kill_on_error):
+                        return
+            running.update(self._start_due_restarts())
             time.sleep(poll_interval)
+
+    def _join_event_driven(self, remaining_procs, kill_on_error):
+        running = set(remaining_procs)
+        with _ChildExitSelector() as selector:
+            for name in running:
+                selector.register(name, self.processes[name])
+            while running or self._pending_restarts:
+                for name in selector.wait(timeout=self._next_restart_delay()):
+                    retcode = self.processes[name].poll()
+                    if retcode is None:  # woken up by another child
+                        continue
+                    running.discard(name)
+                    selector.unregister(name)
+                    if self._on_exit(name, retcode, kill_on_error):
+                        return
+                for name in self._start_due_restarts():
+                    running.add(name)
+                    selector.register(name, self.processes[name])
+
+    def _on_exit(self, name, retcode, kill_on_error):
+        """
+        Reports the exit of a process and schedules its restart if its
+        restart policy asks for it
+
+        Returns:
+            True if all remaining processes have been killed
+        """
+        policy = self.restart_policies.get(name)
+        if policy is not None and not self._killed and \
+                policy.should_restart(retcode, self.restart_counts[name]):
+            if time.time() - self._start_times[name] >= policy.reset_after:
+                self._consecutive_restarts[name] = 0
+            delay = policy.delay(self._consecutive_restarts[name])
+            self._pending_restarts[name] = time.time() + delay
+            print('PROCESS "{}" EXITED WITH CODE {}, RESTARTING IN {:.1f}s '
+                  '(RESTART {}/{})'.format(
+                      name, retcode, delay, self.restart_counts[name] + 1,
+                      policy.max_restarts if policy.max_restarts is not None
+                      else 'unlimited'))
+            return False
+        if retcode == 0:
+            print('PROCESS "{}" DONE'.format(name))
+            return False
+        print('PROCESS "{}" TERMINATED WITH ERROR CODE {}'
+              .format(name, retcode))
+        if kill_on_error:
+            print('KILLING ALL REMAINING PROCEESES ...')
+            self.kill_all(verbose=True)
+            return True
+        return False
+
+    def _next_restart_delay(self):
+        if not self._pending_restarts:
+            return None
+        return max(0., min(self._pending_restarts.values()) - time.time())
+
+    def _start_due_restarts(self):
+        """
+        Returns:
+            names of the processes restarted
+        """
+        now = time.time()
+        due = [name for name, due_time in self._pending_restarts.items()
+               if due_time <= now]
+        for name in due:
+            del self._pending_restarts[name]
+            self.restart_counts[name] += 1
+            self._consecutive_restarts[name] += 1
+            self._spawn(name, log_file_mode='a')
+            print('PROCESS "{}" RESTARTED'.format(name))
+        return due
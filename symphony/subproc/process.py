@@ -1,17 +1,27 @@
 import os
+import shlex
 from symphony.spec import ProcessSpec
+from .manager import RestartPolicy
 
 
 class SubprocProcessSpec(ProcessSpec):
-    def __init__(self, name, cmd):
+    def __init__(self, name, cmd, restart_policy=None, **restart_kwargs):
         """
         Args:
             name: name of the process
             cmd: string command
+            restart_policy: ['never', 'on-failure', 'always'],
+                see set_restart_policy
+            restart_kwargs: max_restarts, backoff, max_backoff, reset_after
         """
         super().__init__(name)
         self.cmd = cmd
         self.env = {}
+        # address book file set by the experiment, sourced before cmd
+        self.env_file = None
+        self.restart_policy = None
+        if restart_policy is not None:
+            self.set_restart_policy(restart_policy, **restart_kwargs)
 
     def set_envs(self, env):
         """
@@ -21,11 +31,43 @@ class SubprocProcessSpec(ProcessSpec):
         """
         self.env.update(env)
 
+    def get_cmd(self):
+        """
+        Returns:
+            cmd, preceded by sourcing env_file if there is one
+        """
+        if self.env_file is None:
+            return self.cmd
+        return 'set -a; . {}; set +a; {}'.format(shlex.quote(self.env_file),
+                                                 self.cmd)
+
+    def set_restart_policy(self, policy, max_restarts=None, backoff=1.,
+                           max_backoff=60., reset_after=600.):
+        """
+        Restart the process when it exits
+        Args:
+            policy: ['never', 'on-failure', 'always']
+            max_restarts: give up after this many restarts, None for no limit
+            backoff: seconds before the first restart, doubled for every
+                consecutive restart up to max_backoff
+            max_backoff: cap of the restart delay in seconds
+            reset_after: seconds of uptime after which backoff starts over
+        """
+        self.restart_policy = RestartPolicy(policy,
+                                            max_restarts=max_restarts,
+                                            backoff=backoff,
+                                            max_backoff=max_backoff,
+                                            reset_after=reset_after)
+
     def _load_dict(self, di):
         super()._load_dict(di)
         self.cmd = di['cmd']
+        if di.get('restart_policy') is not None:
+            self.restart_policy = RestartPolicy.load_dict(di['restart_policy'])
 
     def dump_dict(self):
         di = super().dump_dict()
         di['cmd'] = self.cmd
+        if self.restart_policy is not None:
+            di['restart_policy'] = self.restart_policy.dump_dict()
         return di
@@ -0,0 +1,236 @@
+"""
+Detached supervisor for SubprocCluster experiments.
+One supervisor daemon per experiment owns the child processes and answers
+status and log queries over a Unix socket, so that launch() returns right
+away and the commandline can inspect running experiments cheaply.
+
+Protocol: the client sends one JSON request per connection, terminated by a
+newline, e.g. {"cmd": "describe"}, and reads one JSON response until EOF.
+"""
+import os
+import sys
+import json
+import select
+import socket
+import atexit
+import threading
+import subprocess
+import socketserver
+from collections import OrderedDict
+from .manager import SubprocManager, RestartPolicy
+
+
+_SOCKET_SUFFIX = '.sock'
+# sun_path is limited to 108 bytes on Linux, 104 on macOS
+_MAX_SOCKET_PATH = 100
+
+
+def socket_path(run_dir, experiment_name):
+    path = os.path.join(run_dir, experiment_name + _SOCKET_SUFFIX)
+    if len(path) > _MAX_SOCKET_PATH:
+        raise ValueError('Supervisor socket path {} is too long, please use '
+                         'a shorter run_dir'.format(path))
+    return path
+
+
+def list_socket_paths(run_dir):
+    """
+    Returns:
+        {experiment_name: socket_path} for every supervisor socket in run_dir
+    """
+    if not os.path.isdir(run_dir):
+        return {}
+    out = {}
+    for fname in sorted(os.listdir(run_dir)):
+        if fname.endswith(_SOCKET_SUFFIX):
+            out[fname[:-len(_SOCKET_SUFFIX)]] = os.path.join(run_dir, fname)
+    return out
+
+
+class SupervisorClient:
+    def __init__(self, path, timeout=10.):
+        self.path = path
+        self.timeout = timeout
+
+    def request(self, cmd, **kwargs):
+        """
+        Raises:
+            ConnectionError: if no supervisor listens on the socket
+            RuntimeError: if the supervisor reports an error
+        """
+        kwargs['cmd'] = cmd
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            try:
+                sock.connect(self.path)
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                raise ConnectionError('No supervisor at {}'.format(self.path)) from e
+            sock.sendall((json.dumps(kwargs) + '\n').encode('utf-8'))
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        finally:
+            sock.close()
+        response = json.loads(b''.join(chunks).decode('utf-8'))
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    def is_alive(self):
+        try:
+            self.request('ping')
+            return True
+        except (ConnectionError, OSError, ValueError):
+            return False
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            cmd = request.pop('cmd')
+            method = getattr(self.server.supervisor, 'handle_' + cmd, None)
+            if method is None:
+                raise ValueError('Unknown supervisor command {}'.format(cmd))
+            response = {'result': method(**request)}
+        except Exception as e:
+            response = {'error': '{}: {}'.format(type(e).__name__, e)}
+        self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+
+class _SupervisorServer(socketserver.ThreadingMixIn,
+                        socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class SubprocSupervisor:
+    def __init__(self, experiment_name, socket_path, manager_kwargs):
+        self.experiment_name = experiment_name
+        self.socket_path = socket_path
+        self.manager = SubprocManager(**manager_kwargs)
+        self._server = None
+        self._deleted = threading.Event()
+
+    # ==================== lifecycle ====================
+    def start(self, processes):
+        """
+        Args:
+            processes: list of {'name', 'cmd', 'env', 'restart_policy'}
+        """
+        if os.path.exists(self.socket_path):
+            if SupervisorClient(self.socket_path).is_alive():
+                raise RuntimeError('Experiment "{}" is already running'
+                                   .format(self.experiment_name))
+            os.remove(self.socket_path)
+        self._server = _SupervisorServer(self.socket_path, _RequestHandler)
+        self._server.supervisor = self
+        atexit.register(self._remove_socket)
+        for p in processes:
+            restart_policy = p.get('restart_policy')
+            if restart_policy is not None:
+                restart_policy = RestartPolicy.load_dict(restart_policy)
+            self.manager.launch(p['name'], p['cmd'], p['env'],
+                                restart_policy=restart_policy)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def run(self, kill_on_error=True):
+        """
+        Supervises the processes until they all exit, then keeps answering
+        queries until the experiment is deleted. Must run in the main thread.
+        """
+        self.manager.join(kill_on_error=kill_on_error)
+        self._deleted.wait()
+        self._server.shutdown()
+        self._server.server_close()
+        self._remove_socket()
+
+    def _remove_socket(self):
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+
+    # ==================== request handlers ====================
+    def handle_ping(self):
+        return os.getpid()
+
+    def handle_describe(self):
+        return OrderedDict((name, self.manager.describe(name))
+                           for name in self.manager.processes)
+
+    def handle_log_paths(self, name):
+        return self.manager.log_paths(name)
+
+    def handle_log(self, name, tail=None, since=None, stream='out'):
+        return self.manager.read_log(name, stream=stream, tail=tail,
+                                     since=since)
+
+    def handle_delete(self):
+        self.manager.kill_all()
+        self._deleted.set()
+        return True
+
+
+def spawn_supervisor(experiment_name, run_dir, plan, timeout=30.):
+    """
+    Starts a detached supervisor process for the experiment and waits until
+    it has launched every process.
+
+    Args:
+        plan: {'processes': [...], 'manager_kwargs': {...},
+               'kill_on_error': bool}, see SubprocSupervisor
+
+    Returns:
+        pid of the supervisor
+    """
+    experiment_dir = os.path.join(run_dir, experiment_name)
+    os.makedirs(experiment_dir, exist_ok=True)
+    plan_file = os.path.join(experiment_dir, 'plan.json')
+    with open(plan_file, 'w') as f:
+        json.dump(plan, f)
+    read_fd, write_fd = os.pipe()
+    with open(os.path.join(experiment_dir, 'supervisor.log'), 'a') as log:
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'symphony.subproc.supervisor',
+             experiment_name, socket_path(run_dir, experiment_name),
+             plan_file, str(write_fd)],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            pass_fds=(write_fd,),
+            start_new_session=True,  # survive the launching terminal
+        )
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as ready_pipe:
+        readable, _, _ = select.select([ready_pipe], [], [], timeout)
+        message = ready_pipe.read().decode('utf-8') if readable else ''
+    if message != 'ok':
+        if proc.poll() is None and not readable:
+            proc.kill()
+        raise RuntimeError('Supervisor for experiment "{}" failed to start: {}'
+                           .format(experiment_name, message or 'timed out'))
+    return proc.pid
+
+
+def main():
+    experiment_name, path, plan_file, ready_fd = sys.argv[1:5]
+    with open(plan_file) as f:
+        plan = json.load(f)
+    with os.fdopen(int(ready_fd), 'w') as ready_pipe:
+        try:
+            supervisor = SubprocSupervisor(experiment_name, path,
+                                           plan['manager_kwargs'])
+            supervisor.start(plan['processes'])
+        except Exception as e:
+            ready_pipe.write('{}: {}'.format(type(e).__name__, e))
+            raise
+        ready_pipe.write('ok')
+    supervisor.run(kill_on_error=plan['kill_on_error'])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,17 @@
 import os
 import shlex
 import time
-from threading import Thread
+import uuid
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 import libtmux
 from libtmux.exc import LibTmuxException
 from symphony.engine import Cluster
 from symphony.errors import *
 from symphony.tmux.experiment import TmuxExperimentSpec
+from symphony.tmux.control import TmuxControlClient, TmuxCommandError
+from symphony.tmux.control import TmuxTimeoutError
 
 _DEFAULT_WINDOW = '__main__'
 
@@ -22,18 +26,43 @@ def _logger(verbose):
 
 
 class TmuxCluster(Cluster):
-
-  def __init__(self, server_name='default'):
+  # libtmux server objects are shared between launches and are not
+  # thread-safe.
+  launch_concurrency = 1
+
+  def __init__(self,
+               server_name='default',
+               control_mode=None,
+               shell_timeout=60,
+               launch_workers=16):
     """
         Args:
             server_name: name of the new Tmux server (i.e. socket_name)
+            control_mode: launch experiments through one tmux control mode
+                connection that sends all commands in bulk, instead of
+                one tmux client per libtmux call. Requires tmux >= 3.0,
+                None to use it only if the installed tmux supports it
+            shell_timeout: seconds to wait for the shells of new panes to
+                start before launch() fails
+            launch_workers: threads that wait for the shells of new panes,
+                without control_mode
         """
     super().__init__()  # just for linter's happiness
     self._socket_name = server_name
+    self._config_file = '/home/ubuntu/.tmux.conf'
+    self._control_mode = control_mode
+    self._shell_timeout = shell_timeout
+    self._launch_workers = launch_workers
     self._tmux = libtmux.Server(socket_name=self._socket_name,
-                                config_file='/home/ubuntu/.tmux.conf')
+                                config_file=self._config_file)
 
   # =================== Private helpers ====================
+  def _use_control_mode(self):
+    if self._control_mode is None:
+      # older tmux lacks the control mode features that launch relies on
+      self._control_mode = libtmux.common.has_gte_version('3.0')
+    return self._control_mode
+
   def _get_session(self, session_name):
     try:
       sess = self._tmux.find_where({'session_name': session_name})
@@ -67,26 +96,44 @@ class TmuxCluster(Cluster):
       pass
     return self._tmux.new_session(session_name)
 
-  def _create_process(self, sess, process, pane, preamble_cmds, timeout=4):
-    # Retry loop to make sure we run process commands after
-    # shell starts (heuristically checked by ensuring pane has
-    # some output in the buffer).
+  def _get_process_cmds(self, process, preamble_cmds):
     env_cmds = [
         'export {}={}'.format(k, shlex.quote(v))
         for k, v in process.env.items()
     ]
-    cmds = process.get_tmux_cmd(env_cmds + preamble_cmds)
+    if process.env_file is not None:
+      env_cmds.insert(0, 'set -a; . {}; set +a'.format(
+          shlex.quote(process.env_file)))
+    return process.get_tmux_cmd(env_cmds + preamble_cmds)
+
+  def _ready_channel(self):
+    """
+        Returns:
+            a unique tmux wait-for channel, and the command that signals it
+            once the shell of a pane reads its first line of input
+        """
+    channel = 'symphony_ready_{}'.format(uuid.uuid4().hex)
+    return channel, 'tmux wait-for -S {}'.format(channel)
+
+  def _shell_timeout_error(self, process_name):
+    return TimeoutError('Shell of process "{}" did not start within {}s'
+                        .format(process_name, self._shell_timeout))
+
+  def _create_process(self, sess, process, pane, preamble_cmds):
+    # Run process commands only after the shell starts: it signals a
+    # wait-for channel as soon as it runs its first command.
+    cmds = self._get_process_cmds(process, preamble_cmds)
     if cmds:
-      start_time = time.time()
-      # while time.time() < start_time + timeout:
-      while True:
-        stdout = pane.cmd('capture-pane', '-p').stdout
-        if stdout:
-          for i, cmd in enumerate(cmds):
-            pane.send_keys(cmd, suppress_history=False)
-          break
-        else:
-          time.sleep(.5)
+      channel, sentinel = self._ready_channel()
+      pane.send_keys(sentinel, suppress_history=True)
+      try:
+        subprocess.run(['tmux', '-L', self._socket_name, 'wait-for', channel],
+                       timeout=self._shell_timeout,
+                       check=True)
+      except subprocess.TimeoutExpired:
+        raise self._shell_timeout_error(process.name)
+      for cmd in cmds:
+        pane.send_keys(cmd, suppress_history=False)
 
   def _new_window(self, sess, window_name):
     win = sess.new_window(window_name)
@@ -100,6 +147,93 @@ class TmuxCluster(Cluster):
     win.set_window_option('aggressive-resize', 'on')
     return win
 
+  def _launch_control_mode(self, spec, _log):
+    """
+        Creates the session, windows and panes and types the commands of all
+        processes in three batches over a single control mode connection.
+        """
+    windows = []  # [(window_name, is_group, [(process, preamble_cmds)])]
+    for pg in spec.list_process_groups():
+      preamble_cmds = spec.preamble_cmds + pg.preamble_cmds
+      windows.append((pg.name, True, [(p, preamble_cmds)
+                                      for p in pg.list_processes()]))
+    for p in spec.list_processes():
+      windows.append((p.name, False, [(p, spec.preamble_cmds)]))
+
+    try:
+      client = TmuxControlClient(
+          self._socket_name,
+          ['new-session', '-s', spec.name, '-n', _DEFAULT_WINDOW,
+           '-P', '-F', '#{session_id}'],
+          config_file=self._config_file)
+    except TmuxCommandError as e:
+      if 'duplicate session' in e.message:
+        raise ResourceExistsError(
+            'Experiment "{}" already exists'.format(spec.name))
+      raise
+    _log('Creating new Experiment "{}"'.format(spec.name))
+
+    with client:
+      session_id = client.initial_output[0]
+      replies = client.run(*[
+          ['new-window', '-d', '-t', session_id + ':', '-n', window_name,
+           '-P', '-F', '#{window_id} #{pane_id}']
+          for window_name, _, _ in windows
+      ])
+      panes = []  # [(pane_id, process, preamble_cmds)]
+      commands = []
+      split_indices = []
+      for (_, _, processes), [reply] in zip(windows, replies):
+        window_id, pane_id = reply.split(' ')
+        for i, (p, preamble_cmds) in enumerate(processes):
+          if i == 0:
+            panes.append((pane_id, p, preamble_cmds))
+            continue
+          split_indices.append((len(commands), p, preamble_cmds))
+          commands.append(['split-window', '-t', window_id,
+                           '-P', '-F', '#{pane_id}'])
+          # keep room for the next split
+          commands.append(['select-layout', '-t', window_id, 'tiled'])
+        commands.append(['select-layout', '-t', window_id, 'tiled'])
+        commands.append(['set-window-option', '-t', window_id,
+                         'aggressive-resize', 'on'])
+      replies = client.run(*commands)
+      for i, p, preamble_cmds in split_indices:
+        panes.append((replies[i][0], p, preamble_cmds))
+
+      # Each shell signals its channel once it runs its first command.
+      # tmux runs the commands of a client in order, so the commands of
+      # a process are only typed after the shell of its pane has started.
+      commands = []
+      waits = []
+      channels = {}  # {channel: process name}
+      for pane_id, p, preamble_cmds in panes:
+        channel, sentinel = self._ready_channel()
+        channels[channel] = p.name
+        commands.append(['send-keys', '-t', pane_id, '-l', ' ' + sentinel])
+        commands.append(['send-keys', '-t', pane_id, 'Enter'])
+        waits.append(['wait-for', channel])
+        for cmd in self._get_process_cmds(p, preamble_cmds):
+          waits.append(['send-keys', '-t', pane_id, '-l', cmd])
+          waits.append(['send-keys', '-t', pane_id, 'Enter'])
+      commands += waits
+      try:
+        client.run(*commands, timeout=self._shell_timeout)
+      except TmuxTimeoutError as e:
+        # wait-for replies at once, but blocks the commands after it
+        for command in reversed(commands[:e.index + 1]):
+          if command[0] == 'wait-for':
+            raise self._shell_timeout_error(channels[command[1]])
+        raise
+
+    for window_name, is_group, processes in windows:
+      if is_group:
+        _log(' --> Creating process group', window_name)
+        for p, _ in processes:
+          _log(' --> --> Created process', ':'.join((window_name, p.name)))
+      else:
+        _log(' --> Created process', window_name)
+
   # ===================== Launch API =======================
   def new_experiment(self, *args, **kwargs):
     return TmuxExperimentSpec(*args, **kwargs)
@@ -110,6 +244,9 @@ class TmuxCluster(Cluster):
 
     spec.compile()
 
+    if not dry_run and self._use_control_mode():
+      return self._launch_control_mode(spec, _log)
+
     # Create a new session for the given Experiment.
     if not dry_run:
       sess = self._new_session(spec.name)
@@ -117,7 +254,8 @@ class TmuxCluster(Cluster):
       sess.windows[0].rename_window(_DEFAULT_WINDOW)
     _log('Creating new Experiment "{}"'.format(spec.name))
 
-    threads = []
+    pool = ThreadPoolExecutor(max_workers=self._launch_workers)
+    futures = []
     # Create a window for each process group and lone process.
     for pg in spec.list_process_groups():
       preamble_cmds = spec.preamble_cmds + pg.preamble_cmds
@@ -129,11 +267,8 @@ class TmuxCluster(Cluster):
       for i, p in enumerate(pg.list_processes()):
         is_last = (i == len(pg.list_processes()) - 1)
         if not dry_run:
-          # self._create_process(self, p, pg_win.attached_pane, preamble_cmds)
-          t = Thread(target=self._create_process,
-                     args=(sess, p, pg_win.attached_pane, preamble_cmds))
-          t.start()
-          threads.append(t)
+          futures.append(pool.submit(self._create_process, sess, p,
+                                     pg_win.attached_pane, preamble_cmds))
           if is_last:
             pass
           else:
@@ -145,19 +280,13 @@ class TmuxCluster(Cluster):
       if not dry_run:
         # Create new window.
         pane = self._new_window(sess, window_name=p.name).attached_pane
-        # self._create_process(self, p, pane, spec.preamble_cmds)
-        t = Thread(target=self._create_process,
-                   args=(sess, p, pane, spec.preamble_cmds))
-        t.start()
-        threads.append(t)
+        futures.append(pool.submit(self._create_process, sess, p, pane,
+                                   spec.preamble_cmds))
       _log(' --> Created process', p.name)
 
-    for thread in threads:
-      thread.join()
-
-  def launch_batch(self, experiment_specs):
-    for exp in experiment_specs:
-      self.launch(exp)
+    pool.shutdown(wait=True)
+    for future in futures:
+      future.result()
 
   # ===================== Action API =======================
   def delete(self, experiment_name):
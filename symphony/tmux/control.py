@@ -0,0 +1,157 @@
+"""
+Drives a tmux server through one control mode client (tmux -C), instead of
+forking a new tmux client for every command.
+Requires tmux >= 3.0 for sh-like quoting of command arguments.
+"""
+import os
+import time
+import shlex
+import select
+import subprocess
+
+
+class TmuxCommandError(RuntimeError):
+
+  def __init__(self, command, message):
+    super().__init__('tmux command "{}" failed: {}'.format(command, message))
+    self.command = command
+    self.message = message
+
+
+class TmuxTimeoutError(TmuxCommandError):
+
+  def __init__(self, command, message, index=None):
+    super().__init__(command, message)
+    # position of the command in its batch
+    self.index = index
+
+
+class TmuxControlClient:
+  """
+  Commands are written to the stdin of the control client and their replies,
+  framed by %begin and %end/%error lines, are read back in order.
+  Everything else the client prints is an asynchronous notification and
+  is ignored.
+  """
+
+  def __init__(self, socket_name, initial_command, config_file=None):
+    """
+        Args:
+            socket_name: tmux server socket, as in tmux -L
+            initial_command(list): command that starts the client, usually
+                new-session or attach-session. Raises TmuxCommandError if
+                it fails
+            config_file: passed to tmux -f if it exists
+        """
+    args = ['tmux', '-L', socket_name]
+    if config_file and os.path.exists(config_file):
+      args.extend(['-f', config_file])
+    args.append('-C')
+    args.extend(initial_command)
+    self._proc = subprocess.Popen(args,
+                                  stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.DEVNULL)
+    self._buffer = b''
+    try:
+      self.initial_output = self._read_reply(' '.join(initial_command))
+    except Exception:
+      self.close()
+      raise
+
+  def run(self, *commands, timeout=None):
+    """
+        Sends all commands at once, then collects their replies.
+
+        Args:
+            commands: each a list of arguments, e.g. ['send-keys', '-t', ...]
+            timeout: seconds to wait for all replies, None for no limit.
+                Commands still queued after a timeout never run, because the
+                client has to be closed
+
+        Returns:
+            list of output lines for each command
+
+        Raises:
+            TmuxCommandError of the first failed command, after all replies
+            have been read
+            TmuxTimeoutError of the first command without a reply
+        """
+    lines = [' '.join(shlex.quote(str(arg)) for arg in command)
+             for command in commands]
+    if not lines:
+      return []
+    self._proc.stdin.write(''.join(line + '\n' for line in lines).encode())
+    self._proc.stdin.flush()
+    deadline = None if timeout is None else time.time() + timeout
+    replies, error = [], None
+    for i, line in enumerate(lines):
+      try:
+        replies.append(self._read_reply(line, deadline))
+      except TmuxTimeoutError as e:
+        # the client is blocked on the late command, drop the queued ones
+        self._proc.kill()
+        self.close()
+        e.index = i
+        raise
+      except TmuxCommandError as e:
+        replies.append(None)
+        error = error or e
+    if error is not None:
+      raise error
+    return replies
+
+  def _readline(self, command, deadline):
+    fd = self._proc.stdout.fileno()
+    while b'\n' not in self._buffer:
+      if deadline is not None:
+        ready, _, _ = select.select([fd], [], [],
+                                    max(0., deadline - time.time()))
+        if not ready:
+          raise TmuxTimeoutError(command, 'no reply before the timeout')
+      chunk = os.read(fd, 65536)
+      if not chunk:
+        raise TmuxCommandError(command, 'control client exited')
+      self._buffer += chunk
+    line, self._buffer = self._buffer.split(b'\n', 1)
+    return line.decode('utf-8', errors='replace')
+
+  def _read_reply(self, command, deadline=None):
+    output, number = None, None
+    while True:
+      line = self._readline(command, deadline)
+      tokens = line.split(' ')
+      if output is None:
+        # notifications are only sent between replies
+        if tokens[0] == '%begin':
+          output, number = [], tokens[2]
+        continue
+      if tokens[0] in ('%end', '%error') and len(tokens) >= 3 \
+          and tokens[2] == number:
+        if tokens[0] == '%error':
+          raise TmuxCommandError(command, '\n'.join(output))
+        return output
+      output.append(line)
+
+  def close(self):
+    """
+        Detaches the control client, the tmux server keeps running.
+        """
+    if self._proc.poll() is None:
+      try:
+        self._proc.stdin.close()
+      except BrokenPipeError:
+        pass
+      try:
+        self._proc.wait(timeout=5)
+      except subprocess.TimeoutExpired:
+        # blocked on a command, e.g. wait-for
+        self._proc.kill()
+        self._proc.wait()
+    self._proc.stdout.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
@@ -3,7 +3,6 @@ import copy
 from symphony.spec import ExperimentSpec
 from symphony.utils.common import compact_range_dumps, compact_range_loads
 from symphony.utils.common import print_err
-from symphony.engine import AddressBook
 from .common import tmux_name_check
 from .process import TmuxProcessSpec
 from .process_group import TmuxProcessGroupSpec
@@ -13,13 +12,17 @@ class TmuxExperimentSpec(ExperimentSpec):
   _ProcessClass = TmuxProcessSpec
   _ProcessGroupClass = TmuxProcessGroupSpec
 
-  def __init__(self, name, start_dir=None, env_name=None, preamble_cmds=None):
+  def __init__(self, name, start_dir=None, env_name=None, preamble_cmds=None,
+               env_file=None):
     """
         Args:
             name: name of the Experiment
             start_dir: directory where new processes start for this Experiment
             preamble_cmds: str or list of str containing commands to run in each
                 process before the actual command (e.g. `source activate py3`)
+            env_file: write the address book to this file, which every process
+                sources, instead of exporting the whole address book in every
+                pane. Must be on a file system shared with the nodes
         """
     # Valid session name is not empty and doesn't contain colon or period.
     # (reference: https://github.com/tmux/tmux/blob/master/session.c)
@@ -31,6 +34,9 @@ class TmuxExperimentSpec(ExperimentSpec):
     self.start_dir = os.path.expanduser(start_dir or '.')
     self.env_name = env_name
     self.set_preamble_cmds(preamble_cmds)
+    if env_file is not None:
+      env_file = os.path.abspath(os.path.expanduser(env_file))
+    self.env_file = env_file
 
     self.exposed_services = {}
     self.binded_services = {}
@@ -57,12 +63,14 @@ class TmuxExperimentSpec(ExperimentSpec):
 
   def compile(self):
     """
-        Compile necessary information before launch
+        Compile necessary information before launch. Only the processes
+        changed since the last compile are looked at again, services
+        keep the ports they were given
         """
-    self.address_book = AddressBook()
-
-    self.declare_services()
+    if self._services_changed:
+      self.declare_services(self._list_dirty_processes())
     self.assign_addresses()
+    self._clear_dirty()
 
   def assign_addresses(self):
     for exposed_service_name in self.exposed_services:
@@ -71,34 +79,68 @@ class TmuxExperimentSpec(ExperimentSpec):
     for binded_service_name in self.binded_services:
       ip, port = self.binded_services[binded_service_name]
       self.address_book.add_entry(binded_service_name, ip, port)
-    env_dict = self.address_book.dump()
-    for process in self.list_all_processes():
-      process.set_envs(env_dict)
+    if self.env_file is None:
+      self._push_envs(self.address_book.dump())
+    else:
+      self._publish_env_file(self.env_file)
 
-  def declare_services(self):
+  def declare_services(self, processes=None):
     """
-        Loop through all processes and assign addresses for all declared ports
+        Loop through processes and assign addresses for all newly declared ports
+        Args:
+            processes: defaults to all processes
     """
+    if processes is None:
+      processes = self.list_all_processes()
+    # one probe of the unavailable ports per node and allocation
+    unavailable_ports = {}
     # sort them in their order of preferred ports
     # Must be executed sequentially to allow for port reservations.
-    for process in sorted(self.list_all_processes(),
+    for process in sorted(processes,
                           key=lambda proc: proc.preferred_ports
                           if proc.preferred_ports else [65536]):
+      # a moved process gives its ports back and gets new ones
+      moved = process.release_stale_ports()
       ip = process.ip_addr
+      key = (id(process.node), id(process.allocation))
+      if key not in unavailable_ports and (process.exposed_services or
+                                           process.binded_services):
+        unavailable_ports[key] = set(
+            process.node.get_unavailable_ports(process.allocation))
       for exposed_service_name in process.exposed_services:
-        port = process.get_port(process.exposed_services[exposed_service_name])
+        requested = process.exposed_services[exposed_service_name]
+        if not moved and self._is_declared(self.exposed_services,
+                                           exposed_service_name, ip, requested):
+          continue
+        port = process.get_port(requested, unavailable_ports[key])
         self.exposed_services[exposed_service_name] = (ip, port)
 
       for binded_service_name in process.binded_services:
-        port = process.get_port(process.binded_services[binded_service_name])
+        requested = process.binded_services[binded_service_name]
+        if not moved and self._is_declared(self.binded_services,
+                                           binded_service_name, ip, requested):
+          continue
+        port = process.get_port(requested, unavailable_ports[key])
         self.binded_services[binded_service_name] = (ip, port)
-    self.validate_connect()
+    self.validate_connect(processes)
+
+  def _is_declared(self, services, name, ip, requested_port):
+    """
+        Whether the service already has an address that satisfies the request,
+        in which case its reserved port is kept
+        """
+    if name not in services:
+      return False
+    declared_ip, declared_port = services[name]
+    return declared_ip == ip and requested_port in (None, declared_port)
 
-  def validate_connect(self):
+  def validate_connect(self, processes=None):
     """
         Check if all connected services are correctly provided
         """
-    for process in self.list_all_processes():
+    if processes is None:
+      processes = self.list_all_processes()
+    for process in processes:
       for connected_service_name in process.connected_services:
         if connected_service_name not in self.binded_services:
           raise ValueError('Service {} is connected by process {} but not binded' \
@@ -109,10 +151,12 @@ class TmuxExperimentSpec(ExperimentSpec):
     self.start_dir = di['start_dir']
     self.preamble_cmds = di['preamble_cmds']
     self.env_name = data['env_name']
+    self.env_file = di.get('env_file')
 
   def dump_dict(self):
     data = super().dump_dict()
     data['start_dir'] = self.start_dir
     data['env_name'] = self.env_name
     data['preamble_cmds'] = self.preamble_cmds
+    data['env_file'] = self.env_file
     return data
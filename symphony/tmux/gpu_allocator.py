@@ -0,0 +1,171 @@
+"""
+Picks the GPUs of the processes on a node. Processes that need a fraction
+of a GPU are packed on the GPUs other fractional users already share,
+processes that need whole GPUs get idle GPUs as far as possible from the
+other whole-GPU users: on another group (e.g. PCIe switch or NUMA node)
+if there is one, else on a distant index.
+"""
+from .placement import PlacementError
+from .spy_stats import model_scales
+
+_EPS = 1e-6
+
+
+class GPUAllocator:
+  """
+    Per-GPU compute and memory headroom of one node, and the GPUs taken
+    by each process
+  """
+
+  def __init__(self, capacity, free_compute, free_mem, groups=None):
+    """
+        Args:
+            capacity: total compute of each GPU (see Node.avail_gpu_compute
+                for units). A process takes a GPU exclusively when it needs
+                all of it
+            free_compute, free_mem: headroom of each GPU
+            groups: topology group of each GPU, None for a single group
+    """
+    assert len(capacity) == len(free_compute) == len(free_mem)
+    self.capacity = [float(x) for x in capacity]
+    self.free_compute = [float(x) for x in free_compute]
+    self.free_mem = [float(x) for x in free_mem]
+    self.groups = list(groups) if groups is not None else [0] * len(capacity)
+    assert len(self.groups) == len(capacity)
+    # process name -> [(gpu, compute, mem)]
+    self.assignments = {}
+    # gpu -> set of process names
+    self._users = [set() for _ in capacity]
+    # gpu -> name of the process that has it exclusively
+    self._owner = [None] * len(capacity)
+
+  @classmethod
+  def from_node(cls, node, gpu_model_to_scale, groups=None):
+    """
+        Args:
+            node: Node with collected spy stats
+    """
+    node._check_spy_stats_available()
+    scale = model_scales(node._capacity.gpu_model, gpu_model_to_scale,
+                         node.name)
+    return cls(scale, node.avail_gpu_compute(gpu_model_to_scale),
+               node.avail_gpu_mem(), groups)
+
+  @classmethod
+  def from_fleet(cls, fleet, gpu_model_to_scale):
+    """
+        Args:
+            fleet: spy_stats.FleetStats
+
+        Returns:
+            {node name: GPUAllocator}
+    """
+    scale = fleet.gpu_scale(gpu_model_to_scale)
+    compute = fleet.avail_gpu_compute(gpu_model_to_scale)
+    mem = fleet.avail_gpu_mem()
+    allocators = {}
+    for i, name in enumerate(fleet.names):
+      n = fleet.num_gpus[i]
+      allocators[name] = cls(scale[i, :n], compute[i, :n], mem[i, :n])
+    return allocators
+
+  def __len__(self):
+    return len(self.capacity)
+
+  def _distance(self, a, b):
+    if self.groups[a] != self.groups[b]:
+      return len(self)
+    return abs(a - b)
+
+  def _min_distance(self, gpu, others):
+    return min([self._distance(gpu, o) for o in others] + [2 * len(self)])
+
+  def _pick(self, compute, mem, own):
+    exclusive_gpus = [g for g in range(len(self))
+                      if self._owner[g] is not None and g not in own]
+    shared_gpus = [g for g in range(len(self))
+                   if self._users[g] and self._owner[g] is None]
+    best, best_key = None, None
+    for g in range(len(self)):
+      if (g in own or self._owner[g] is not None or
+          self.free_compute[g] < compute - _EPS or
+          self.free_mem[g] < mem - _EPS):
+        continue
+      if compute >= self.capacity[g] - _EPS:
+        if self._users[g]:
+          continue
+        # far from the other exclusive users, close to the own GPUs
+        key = (2, -self._min_distance(g, exclusive_gpus),
+               self._min_distance(g, own), g)
+      elif self._users[g]:
+        key = (0, self.free_compute[g] - compute, g)
+      else:
+        # next to the shared GPUs, away from the exclusive ones
+        key = (1, self._min_distance(g, shared_gpus),
+               -self._min_distance(g, exclusive_gpus), g)
+      if best_key is None or key < best_key:
+        best, best_key = g, key
+    return best
+
+  def allocate(self, name, compute_costs, mem_costs):
+    """
+        Takes GPUs for the process, replacing its previous ones.
+
+        Args:
+            name: process name
+            compute_costs, mem_costs: per-GPU costs,
+                see TmuxProcessSpec.set_costs
+
+        Returns:
+            list of GPU indices, in the order of the costs
+
+        Raises:
+            PlacementError if the costs do not fit, the process then
+            keeps its previous GPUs
+    """
+    assert len(compute_costs) == len(mem_costs)
+    previous = self.assignments.get(name, [])
+    self.release(name)
+    chosen = [None] * len(compute_costs)
+    taken = []
+    order = sorted(range(len(compute_costs)), key=lambda j: -compute_costs[j])
+    for j in order:
+      g = self._pick(compute_costs[j], mem_costs[j],
+                     [gpu for gpu, _, _ in taken])
+      if g is None:
+        for gpu, compute, mem in taken:
+          self._free(name, gpu, compute, mem)
+        for gpu, compute, mem in previous:
+          self._take(name, gpu, compute, mem)
+        if previous:
+          self.assignments[name] = previous
+        raise PlacementError('GPUs of {} do not fit: compute {}, memory {}, '
+                             'free compute {}, free memory {}'.format(
+                                 name, compute_costs, mem_costs,
+                                 self.free_compute, self.free_mem))
+      chosen[j] = g
+      taken.append((g, compute_costs[j], mem_costs[j]))
+      self._take(name, g, compute_costs[j], mem_costs[j])
+    self.assignments[name] = taken
+    return chosen
+
+  def _take(self, name, gpu, compute, mem):
+    self.free_compute[gpu] -= compute
+    self.free_mem[gpu] -= mem
+    self._users[gpu].add(name)
+    if compute >= self.capacity[gpu] - _EPS:
+      self._owner[gpu] = name
+
+  def _free(self, name, gpu, compute, mem):
+    self.free_compute[gpu] += compute
+    self.free_mem[gpu] += mem
+    self._users[gpu].discard(name)
+    if self._owner[gpu] == name:
+      self._owner[gpu] = None
+
+  def release(self, name):
+    """
+        Gives back the GPUs of the process, if any
+    """
+    for gpu, compute, mem in self.assignments.pop(name, []):
+      self._free(name, gpu, compute, mem)
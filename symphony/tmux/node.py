@@ -6,6 +6,8 @@ import paramiko
 from caraml.zmq import ZmqTimeoutError, get_remote_client
 from spy import Server as SpyServer
 from symphony.utils import ConfigDict
+from . import ssh
+from .spy_stats import parse_spy_util
 
 
 class Node:
@@ -29,7 +31,6 @@ class Node:
     self._ip_addr = ip_addr
     self.ssh_key_file = ssh_key_file
     self.ssh_port = ssh_port
-    self._ssh_client = None
     self._sftp_client = None
     self.ssh_username = ssh_username
     self._base_dir = base_dir
@@ -60,23 +61,20 @@ class Node:
     self._util = None
     self.collected_spy_stats = False
 
+  @property
+  def _connection(self):
+    return ssh.default_pool.get(self._ip_addr,
+                                port=self.ssh_port,
+                                username=self.ssh_username,
+                                key_filename=self.ssh_key_file)
+
   def _get_ssh_client(self):
-    if self._ssh_client:
-      return self._ssh_client
-
-    client = paramiko.SSHClient()
-    client.load_system_host_keys()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    client.connect(self._ip_addr,
-                   username=self.ssh_username,
-                   port=self.ssh_port,
-                   key_filename=self.ssh_key_file)
-    client.get_transport().window_size = 2147483647
-    self._ssh_client = client
-    return self._ssh_client
+    # shared with every other node on the same host
+    return self._connection.client
 
   def _get_sftp_client(self):
-    if self._sftp_client: return self._sftp_client
+    if self._sftp_client and not self._sftp_client.sock.closed:
+      return self._sftp_client
     self._sftp_client = self._get_ssh_client().open_sftp()
     return self._sftp_client
 
@@ -147,7 +145,7 @@ class Node:
   def get_shell_setup_cmds(self):
     return self.shell_setup_commands
 
-  def get_unavailable_ports(self):
+  def get_unavailable_ports(self, allocation=None):
     # https://superuser.com/questions/529830/get-a-list-of-open-ports-in-linux
     out = self._run_cmd('ss -lnt')
     ports = list(self.reserved_ports)
@@ -160,7 +158,9 @@ class Node:
 
   def get_ssh_cmd(self):
     if self.use_ssh:
-      cmd = 'ssh -o StrictHostKeyChecking=no'
+      # panes to the same node share one connection
+      cmd = 'ssh -o StrictHostKeyChecking=no ' + ' '.join(
+          ssh.control_master_options())
       if self.ssh_port:
         cmd += ' -p %d' % self.ssh_port
       if self.ssh_key_file:
@@ -170,7 +170,7 @@ class Node:
       cmd = ''
     return cmd
 
-  def reserve_port(self, port):
+  def reserve_port(self, port, allocation=None):
     # no double commitment
     assert port not in self.reserved_ports
     self.reserved_ports.append(port)
@@ -198,21 +198,8 @@ class Node:
                              port=self.spy_port,
                              timeout=measurement_time + 5)
       self._capacity = ConfigDict(rc.get_capacity())
-      self._util = ConfigDict(rc.get_instantaneous_profile(measurement_time))
-      self._util.gpu_compute = []
-      self._util.gpu_mem = []
-      while True:
-        i = 0
-        broken = False
-        for k in self._util:
-          if 'gpu/%d' % i in k:
-            self._util['gpu_compute'].append(self._util['gpu/%d/compute' % i])
-            self._util['gpu_mem'].append(self._util['gpu/%d/memory' % i])
-            broken = True
-            break
-        if not broken:
-          break
-        i += 1
+      self._util = parse_spy_util(
+          rc.get_instantaneous_profile(measurement_time))
       self.collected_spy_stats = True
     except ZmqTimeoutError as e:
       print('Unable to connect to SPY Server: %s:%d' %
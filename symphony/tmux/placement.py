@@ -0,0 +1,236 @@
+"""
+Places the processes of a tmux experiment on nodes and GPUs, by
+first-fit / best-fit decreasing bin packing over the free resources of the
+nodes. Feasibility and fit of a process are computed for all nodes at once.
+"""
+import numpy as np
+
+
+class PlacementError(ValueError):
+  pass
+
+
+class NodeResources:
+  """
+    Free resources of a node, from its spy stats or given by hand
+    (e.g. for a dry run)
+  """
+
+  def __init__(self, name, cpu, mem, gpu_compute=(), gpu_mem=(), node=None):
+    """
+        Args:
+            name: node name, matched by TmuxProcessSpec.hard_placement
+            cpu, mem: free cpu and memory
+            gpu_compute, gpu_mem: free compute and memory of each GPU
+            node: what TmuxProcessSpec.set_placement gets, defaults to self
+        """
+    assert len(gpu_compute) == len(gpu_mem)
+    self.name = name
+    self.cpu = float(cpu)
+    self.mem = float(mem)
+    self.gpu_compute = [float(x) for x in gpu_compute]
+    self.gpu_mem = [float(x) for x in gpu_mem]
+    self.node = self if node is None else node
+
+  @classmethod
+  def from_node(cls, node, gpu_model_to_scale):
+    """
+        Args:
+            node: Node with collected spy stats
+            gpu_model_to_scale: see Node.avail_gpu_compute
+        """
+    return cls(node.name,
+               node.avail_cpu(),
+               node.avail_mem(),
+               node.avail_gpu_compute(gpu_model_to_scale),
+               node.avail_gpu_mem(),
+               node=node)
+
+
+class Placement:
+  """
+    Result of place(). assignments maps process name to (node name, GPUs)
+  """
+
+  def __init__(self, nodes, assignments, used):
+    self.nodes = nodes
+    self.assignments = assignments
+    # [cpu, mem, gpu_compute(per GPU), gpu_mem(per GPU)] used on each node
+    self._used = used
+
+  def utilization(self):
+    """
+        Returns:
+            {node name: {'cpu': fraction, 'mem': fraction,
+                         'gpu_compute': [fraction per GPU],
+                         'gpu_mem': [fraction per GPU]}}
+            of the free resources taken by the placed processes
+        """
+    def fraction(used, free):
+      return float(used / free) if free > 0 else 0.
+
+    result = {}
+    for i, node in enumerate(self.nodes):
+      cpu, mem, gpu_compute, gpu_mem = self._used[i]
+      result[node.name] = {
+          'cpu': fraction(cpu, node.cpu),
+          'mem': fraction(mem, node.mem),
+          'gpu_compute': [fraction(u, f) for u, f in
+                          zip(gpu_compute, node.gpu_compute)],
+          'gpu_mem': [fraction(u, f) for u, f in zip(gpu_mem, node.gpu_mem)],
+      }
+    return result
+
+  def report(self):
+    """
+        Returns:
+            human readable table of the processes and utilization per node
+        """
+    by_node = {node.name: [] for node in self.nodes}
+    for process_name, (node_name, gpus) in sorted(self.assignments.items()):
+      by_node[node_name].append(process_name +
+                                (' (GPU {})'.format(','.join(map(str, gpus)))
+                                 if gpus else ''))
+    lines = []
+    for name, util in self.utilization().items():
+      line = '{}: cpu {:.0%}, mem {:.0%}'.format(name, util['cpu'],
+                                                 util['mem'])
+      for i, (c, m) in enumerate(zip(util['gpu_compute'], util['gpu_mem'])):
+        line += ', gpu{} {:.0%}/{:.0%}'.format(i, c, m)
+      lines.append(line)
+      for process in by_node[name]:
+        lines.append('    ' + process)
+    return '\n'.join(lines)
+
+
+def _fit_gpus(gpu_free_compute, gpu_free_mem, compute_costs, mem_costs):
+  """
+    Picks GPUs for one process on every node at once, biggest demand first,
+    each on the free GPU it fits best.
+
+    Returns:
+        (N, k) int array of GPU indices, -1 where the node cannot fit
+  """
+  num_nodes, num_gpus = gpu_free_compute.shape
+  k = len(compute_costs)
+  chosen = np.full((num_nodes, k), -1, dtype=int)
+  if num_gpus == 0:
+    return chosen
+  taken = np.zeros(gpu_free_compute.shape, dtype=bool)
+  failed = np.zeros(num_nodes, dtype=bool)
+  rows = np.arange(num_nodes)
+  for j in np.argsort(compute_costs)[::-1]:
+    fits = (~taken & (gpu_free_compute >= compute_costs[j]) &
+            (gpu_free_mem >= mem_costs[j]))
+    leftover = np.where(fits, gpu_free_compute - compute_costs[j], np.inf)
+    best = np.argmin(leftover, axis=1)
+    ok = fits[rows, best] & ~failed
+    chosen[ok, j] = best[ok]
+    taken[rows[ok], best[ok]] = True
+    failed |= ~ok
+  chosen[failed] = -1
+  return chosen
+
+
+def place(experiment, nodes, strategy='best-fit', gpu_model_to_scale=None,
+          dry_run=False):
+  """
+    Assigns every process with costs (see TmuxProcessSpec.set_costs) to a
+    node and GPUs. Processes are placed in decreasing order of size,
+    processes with a hard placement first. Processes without costs keep
+    their node.
+
+    Args:
+        experiment: TmuxExperimentSpec
+        nodes: list of NodeResources, or of Node with collected spy stats,
+            or spy_stats.FleetStats
+        strategy: 'best-fit' puts a process on the node it leaves the least
+            room on, 'first-fit' on the first node it fits on
+        gpu_model_to_scale: for Nodes and FleetStats, see
+            Node.avail_gpu_compute
+        dry_run: only compute the placement, do not call set_placement and
+            set_gpus on the processes
+
+    Returns:
+        Placement
+
+    Raises:
+        PlacementError if a process fits on no node
+  """
+  if strategy not in ('best-fit', 'first-fit'):
+    raise ValueError('Unknown placement strategy "{}"'.format(strategy))
+  if hasattr(nodes, 'node_resources'):
+    nodes = nodes.node_resources(gpu_model_to_scale)
+  nodes = [n if isinstance(n, NodeResources) else
+           NodeResources.from_node(n, gpu_model_to_scale) for n in nodes]
+  names = [node.name for node in nodes]
+  if len(set(names)) != len(names):
+    raise ValueError('Node names must be unique')
+  num_gpus = max([len(node.gpu_compute) for node in nodes] + [0])
+
+  free = np.array([[node.cpu, node.mem] for node in nodes], dtype=float)
+  free = free.reshape(len(nodes), 2)
+  # nodes with fewer GPUs are padded with GPUs that fit nothing
+  gpu_compute = np.full((len(nodes), num_gpus), -np.inf)
+  gpu_mem = np.full((len(nodes), num_gpus), -np.inf)
+  for i, node in enumerate(nodes):
+    gpu_compute[i, :len(node.gpu_compute)] = node.gpu_compute
+    gpu_mem[i, :len(node.gpu_mem)] = node.gpu_mem
+  total = np.maximum(free.sum(axis=0), 1e-9)
+  total_gpu = max(float(np.sum(gpu_compute[np.isfinite(gpu_compute)])), 1e-9)
+  initial = (free.copy(), gpu_compute.copy(), gpu_mem.copy())
+
+  processes = [p for p in experiment.list_all_processes()
+               if p.cpu_cost is not None]
+
+  def size(p):
+    return (p.cpu_cost / total[0] + p.mem_cost / total[1] +
+            sum(p.gpu_compute_cost) / total_gpu)
+
+  processes.sort(key=lambda p: (p.hard_placement is None, -size(p)))
+
+  assignments = {}
+  for p in processes:
+    cost = np.array([p.cpu_cost, p.mem_cost])
+    feasible = np.all(free >= cost, axis=1)
+    if p.hard_placement is not None:
+      if p.hard_placement not in names:
+        raise PlacementError('Process {} is placed on unknown node {}'.format(
+            p.name, p.hard_placement))
+      feasible &= np.array([name == p.hard_placement for name in names])
+    gpus = np.zeros((len(nodes), 0), dtype=int)
+    if p.gpu_compute_cost:
+      gpus = _fit_gpus(gpu_compute, gpu_mem, np.array(p.gpu_compute_cost),
+                       np.array(p.gpu_mem_cost))
+      feasible &= np.all(gpus >= 0, axis=1)
+    if not feasible.any():
+      raise PlacementError('Process {} does not fit on any node'.format(p.name))
+
+    if strategy == 'first-fit':
+      i = int(np.argmax(feasible))
+    else:
+      slack = np.sum((free - cost) / total, axis=1)
+      i = int(np.argmin(np.where(feasible, slack, np.inf)))
+    free[i] -= cost
+    chosen = [int(g) for g in gpus[i]]
+    for g, c, m in zip(chosen, p.gpu_compute_cost, p.gpu_mem_cost):
+      gpu_compute[i, g] -= c
+      gpu_mem[i, g] -= m
+    assignments[p.name] = (names[i], chosen)
+
+  used = []
+  for i, node in enumerate(nodes):
+    n = len(node.gpu_compute)
+    used.append((initial[0][i, 0] - free[i, 0], initial[0][i, 1] - free[i, 1],
+                 initial[1][i, :n] - gpu_compute[i, :n],
+                 initial[2][i, :n] - gpu_mem[i, :n]))
+  placement = Placement(nodes, assignments, used)
+
+  if not dry_run:
+    node_by_name = {node.name: node.node for node in nodes}
+    for p in processes:
+      node_name, chosen = assignments[p.name]
+      p.set_placement(node_by_name[node_name])
+      if p.gpu_compute_cost:
+        p.set_gpus(chosen)
+  return placement
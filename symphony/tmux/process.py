@@ -1,10 +1,12 @@
 import os
 
 from ccc.src import LSFNode
+from symphony.engine import PortAllocator
 from symphony.spec import ProcessSpec
 from symphony.utils.common import print_err
 
 from .common import tmux_name_check
+from . import ssh
 
 
 class TmuxProcessSpec(ProcessSpec):
@@ -32,6 +34,10 @@ class TmuxProcessSpec(ProcessSpec):
     self.allocation = allocation
     self.preferred_ports = preferred_ports
     self.port_range = list(preferred_ports) + list(port_range)
+    self._ports = PortAllocator(self.port_range)
+    # ports reserved on the node, and the (node, allocation) they are on
+    self._node_ports = []
+    self._node_ports_owner = None
     self.node = node
     if cmds is None:
       cmds = []
@@ -43,6 +49,8 @@ class TmuxProcessSpec(ProcessSpec):
       self.cmds = list(cmds)
     # overwrite CUDA_VISIBLE_DEVICES with set_gpus
     self.env = dict(CUDA_VISIBLE_DEVICES='')
+    # address book file set by the experiment, sourced before cmds
+    self.env_file = None
     self.cpu_cost = None
     self.mem_cost = None
     self.gpu_compute_cost = None
@@ -54,32 +62,100 @@ class TmuxProcessSpec(ProcessSpec):
 
   def set_placement(self, node):
     self.node = node
+    # ports are reserved on the node
+    self.mark_dirty(services=True)
 
   def set_allocation(self, allocation):
     self.allocation = allocation
+    self.mark_dirty(services=True)
 
   def set_gpus(self, gpus):
     self.env['CUDA_VISIBLE_DEVICES'] = ','.join(map(str, gpus))
 
-  def get_port(self, port=None):
+  def allocate_gpus(self, allocator):
+    """
+      Sets the GPUs picked by allocator for the GPU costs of set_costs
+
+      Args:
+          allocator: gpu_allocator.GPUAllocator of the node of the process
+
+      Returns:
+          list of GPU indices
+    """
+    if self.gpu_compute_cost is None:
+      raise ValueError('Process {} has no costs, call set_costs first'.format(
+          self.name))
+    gpus = allocator.allocate(self.name, self.gpu_compute_cost,
+                              self.gpu_mem_cost)
+    self.set_gpus(gpus)
+    return gpus
+
+  def get_port(self, port=None, unavailable_ports=None):
+    """
+      Args:
+          port: requested port, None for any free port
+          unavailable_ports(set): snapshot of the node's unavailable ports,
+              shared by the processes on the node during a compile. Updated
+              with the returned port. None to query the node
+    """
     allocation = self.allocation
-    exclude_ports = set(self.node.get_unavailable_ports(allocation))
+    if unavailable_ports is None:
+      exclude_ports = set(self.node.get_unavailable_ports(allocation))
+    else:
+      exclude_ports = unavailable_ports
 
     if port:  # requesting port
+      if port in exclude_ports and unavailable_ports is not None:
+        # the snapshot may be stale
+        exclude_ports.clear()
+        exclude_ports.update(self.node.get_unavailable_ports(allocation))
       if port in exclude_ports:
         raise Exception('Requesting %d port which is already taken!' % port)
-      if port in self.port_range:
-        self.port_range.remove(port)
-        self.node.reserve_port(port, allocation)
+      if self._ports.reserve(port):
+        self._reserve_on_node(port)
+        exclude_ports.add(port)
       return port
     else:
-      for port in self.port_range[:]:
-        if port not in exclude_ports:
-          self.port_range.remove(port)
-          self.node.reserve_port(port, allocation)
+      # preferred ports first, then the lowest free port of the range
+      for port in self.preferred_ports:
+        if port not in exclude_ports and self._ports.reserve(port):
+          self._reserve_on_node(port)
+          exclude_ports.add(port)
           return port
+      port = self._ports.allocate(exclude=exclude_ports)
+      if port is None:
+        raise Exception('Run out of ports to allocate')
+      self._reserve_on_node(port)
+      exclude_ports.add(port)
+      return port
 
-      raise Exception('Run out of ports to allocate')
+  def _reserve_on_node(self, port):
+    self.node.reserve_port(port, self.allocation)
+    self._node_ports.append(port)
+    self._node_ports_owner = (self.node, self.allocation)
+
+  def release_stale_ports(self):
+    """
+      Releases the ports reserved on a node or allocation that the process
+      was moved away from with set_placement or set_allocation
+      Returns:
+          True if ports were released, the services of the process must
+          then be declared again
+    """
+    if not self._node_ports:
+      return False
+    node, allocation = self._node_ports_owner
+    if node is self.node and allocation is self.allocation:
+      return False
+    # not every node type can give a port back
+    release_port = getattr(node, 'release_port', None)
+    for port in self._node_ports:
+      self._ports.release(port)
+      if release_port is not None:
+        release_port(port, allocation)
+    self._node_ports = []
+    self._node_ports_owner = None
+    return True
 
   @property
   def ip_addr(self):
@@ -91,7 +167,9 @@ class TmuxProcessSpec(ProcessSpec):
     if isinstance(self.node, LSFNode):
       self.node.release_allocation_hold(self.allocation)
 
-    login_cmds = self.node.get_login_cmds()
+    # panes to the same host share one ssh connection
+    login_cmds = [ssh.multiplexed_login_cmd(cmd)
+                  for cmd in self.node.get_login_cmds()]
     l = self.node.get_allocation_cleanup_cmds(self.allocation)
     cleanup_cmds = []
     if l:
@@ -0,0 +1,203 @@
+"""
+Collects spy stats of many nodes at once. Every node is measured in its own
+thread, so a fleet takes one measurement window instead of one per node.
+Capacities rarely change and are cached, only utilization is measured
+on every collect.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from symphony.utils import ConfigDict
+from symphony.utils.common import print_err
+from .placement import NodeResources
+
+
+def parse_spy_util(profile):
+  """
+    Args:
+        profile: output of spy's get_instantaneous_profile
+
+    Returns:
+        ConfigDict of the profile, with gpu_compute and gpu_mem lists
+        gathered from its gpu/<i>/compute and gpu/<i>/memory entries
+  """
+  util = ConfigDict(profile)
+  gpu_compute = []
+  gpu_mem = []
+  while 'gpu/%d/compute' % len(gpu_compute) in util:
+    i = len(gpu_compute)
+    gpu_compute.append(util['gpu/%d/compute' % i])
+    gpu_mem.append(util['gpu/%d/memory' % i])
+  util.gpu_compute = gpu_compute
+  util.gpu_mem = gpu_mem
+  return util
+
+
+def model_scales(gpu_models, gpu_model_to_scale, host):
+  """
+    Returns:
+        scale of each GPU model, see Node.avail_gpu_compute
+  """
+  scales = []
+  for model in gpu_models:
+    for k, scale in gpu_model_to_scale.items():
+      if k in model:
+        scales.append(scale)
+        break
+    else:
+      raise Exception('Unknown GPU model %s found on host %s' % (model, host))
+  return scales
+
+
+class FleetStats:
+  """
+    Columnar view of the spy stats of a fleet: one row per node, GPU
+    columns are padded with nan for nodes with fewer GPUs
+  """
+
+  def __init__(self, nodes, capacities, utils, failed=None):
+    """
+        Args:
+            nodes: nodes that were measured
+            capacities, utils: spy capacity and parse_spy_util output of
+                each node
+            failed: {node name: exception} of the nodes that were not
+        """
+    self.nodes = list(nodes)
+    self.names = [node.name for node in self.nodes]
+    self.failed = failed or {}
+    num_gpus = max([len(c.gpu_mem) for c in capacities] + [0])
+
+    def padded(rows):
+      out = np.full((len(rows), num_gpus), np.nan)
+      for i, row in enumerate(rows):
+        out[i, :len(row)] = row
+      return out
+
+    self.cpu_capacity = np.array([c.cpu for c in capacities], dtype=float)
+    self.cpu_util = np.array([u.cpu for u in utils], dtype=float)
+    self.mem_capacity = np.array([c.memory for c in capacities], dtype=float)
+    self.mem_util = np.array([u.memory for u in utils], dtype=float)
+    self.num_gpus = np.array([len(c.gpu_mem) for c in capacities], dtype=int)
+    self.gpu_model = [list(c.gpu_model) for c in capacities]
+    self.gpu_mem_capacity = padded([c.gpu_mem for c in capacities])
+    self.gpu_compute_util = padded([u.gpu_compute for u in utils])
+    self.gpu_mem_util = padded([u.gpu_mem for u in utils])
+
+  def __len__(self):
+    return len(self.nodes)
+
+  # same as the Node.avail_* methods, for all nodes at once
+  def avail_cpu(self):
+    return self.cpu_util - self.cpu_capacity
+
+  def avail_mem(self):
+    return self.mem_util - self.mem_capacity
+
+  def gpu_scale(self, gpu_model_to_scale):
+    """
+        Returns:
+            (N, G) array of the scale of each GPU, nan for padding
+    """
+    scale = np.full(self.gpu_mem_capacity.shape, np.nan)
+    for i, models in enumerate(self.gpu_model):
+      scale[i, :len(models)] = model_scales(models, gpu_model_to_scale,
+                                            self.names[i])
+    return scale
+
+  def avail_gpu_compute(self, gpu_model_to_scale):
+    return self.gpu_scale(gpu_model_to_scale) * (1 - self.gpu_compute_util)
+
+  def avail_gpu_mem(self):
+    return self.gpu_mem_capacity - self.gpu_mem_util
+
+  def node_resources(self, gpu_model_to_scale):
+    """
+        Returns:
+            list of placement.NodeResources, one per node
+    """
+    cpu = self.avail_cpu()
+    mem = self.avail_mem()
+    gpu_compute = self.avail_gpu_compute(gpu_model_to_scale)
+    gpu_mem = self.avail_gpu_mem()
+    return [
+        NodeResources(node.name, cpu[i], mem[i],
+                      gpu_compute[i, :self.num_gpus[i]],
+                      gpu_mem[i, :self.num_gpus[i]],
+                      node=node) for i, node in enumerate(self.nodes)
+    ]
+
+
+class SpyStatsCollector:
+  """
+    Measures the spy stats of a fixed set of nodes concurrently.
+    A node is anything with a name, fetch_spy_capacity(),
+    fetch_spy_util(measurement_time) and set_spy_stats(capacity, util).
+    fetch_spy_util should return the profile through parse_spy_util.
+  """
+
+  def __init__(self, nodes, max_workers=32, capacity_ttl=None):
+    """
+        Args:
+            max_workers: nodes measured at the same time
+            capacity_ttl: seconds a capacity is reused for,
+                None to reuse it until invalidate_capacity
+    """
+    self.nodes = list(nodes)
+    self.max_workers = max_workers
+    self.capacity_ttl = capacity_ttl
+    # node name -> (capacity, time fetched)
+    self._capacities = {}
+
+  def invalidate_capacity(self, node=None):
+    """
+        Drops the cached capacity of node, or of all nodes
+    """
+    if node is None:
+      self._capacities.clear()
+    else:
+      self._capacities.pop(node.name, None)
+
+  def _get_capacity(self, node):
+    cached = self._capacities.get(node.name)
+    if cached is not None:
+      capacity, fetched = cached
+      if self.capacity_ttl is None or time.time() - fetched < self.capacity_ttl:
+        return capacity
+    capacity = node.fetch_spy_capacity()
+    self._capacities[node.name] = (capacity, time.time())
+    return capacity
+
+  def _collect_one(self, node, measurement_time):
+    capacity = self._get_capacity(node)
+    util = node.fetch_spy_util(measurement_time)
+    node.set_spy_stats(capacity, util)
+    return capacity, util
+
+  def collect(self, measurement_time):
+    """
+        Measures all nodes during the same measurement_time window.
+        Nodes that cannot be measured are left out of the result with
+        a warning.
+
+        Returns:
+            FleetStats
+    """
+    with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+      futures = [pool.submit(self._collect_one, node, measurement_time)
+                 for node in self.nodes]
+    nodes, capacities, utils, failed = [], [], [], {}
+    for node, future in zip(self.nodes, futures):
+      try:
+        capacity, util = future.result()
+      except Exception as e:
+        print_err('[Warning] Unable to collect spy stats of {}: {}'.format(
+            node.name, e))
+        failed[node.name] = e
+        continue
+      nodes.append(node)
+      capacities.append(capacity)
+      utils.append(util)
+    return FleetStats(nodes, capacities, utils, failed)
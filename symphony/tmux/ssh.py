@@ -0,0 +1,252 @@
+"""
+Shares SSH connections to the nodes of a tmux cluster.
+Commands and file transfers go through channels multiplexed over one
+authenticated paramiko transport per node, and the ssh login commands of
+the panes (see TmuxProcessSpec.get_tmux_cmd) reuse one OpenSSH
+ControlMaster socket per host.
+"""
+import os
+import contextlib
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+
+
+def control_master_options(control_dir='~/.ssh', persist='10m'):
+  """
+    Options for the ssh command line that make all ssh commands to a host
+    share the first one's connection, so only the first one authenticates.
+    Returns:
+        list of ssh arguments
+  """
+  # %C is a hash of local host, remote host, port and user, it keeps the
+  # socket path short enough for unix sockets
+  control_path = os.path.join(os.path.expanduser(control_dir),
+                              'symphony-%C')
+  return [
+      '-o', 'ControlMaster=auto',
+      '-o', 'ControlPath={}'.format(control_path),
+      '-o', 'ControlPersist={}'.format(persist),
+  ]
+
+
+def multiplexed_login_cmd(cmd, **kwargs):
+  """
+    Adds control_master_options to an ssh login command, e.g. the ones a
+    node gives for its panes. Other commands are returned as they are.
+    Args:
+        kwargs: see control_master_options
+  """
+  tokens = cmd.split(None, 1)
+  if not tokens or tokens[0] != 'ssh' or 'ControlPath' in cmd:
+    return cmd
+  return ' '.join(['ssh'] + control_master_options(**kwargs) + tokens[1:])
+
+
+class SSHCommandError(RuntimeError):
+
+  def __init__(self, host, command, exit_status, stderr):
+    super().__init__('Command "{}" on {} exited with {}: {}'.format(
+        command, host, exit_status, stderr.strip()))
+    self.command = command
+    self.exit_status = exit_status
+    self.stderr = stderr
+
+
+class SSHConnection:
+  """
+    One transport to a host. run/put open a channel per call over it, at most
+    max_channels at a time (sshd allows 10 sessions per connection by default)
+  """
+
+  def __init__(self,
+               host,
+               port=22,
+               username=None,
+               key_filename=None,
+               max_channels=8,
+               **connect_kwargs):
+    """
+        Args:
+            host, port, username, key_filename: see paramiko.SSHClient.connect
+            max_channels: channels open at the same time, also the number of
+                threads of run_many/put_many
+            connect_kwargs: passed to paramiko.SSHClient.connect
+        """
+    self.host = host
+    self.port = port
+    self.username = username
+    self.key_filename = key_filename
+    self.max_channels = max_channels
+    self._connect_kwargs = connect_kwargs
+    self._client = None
+    self._lock = threading.Lock()
+    self._channels = threading.BoundedSemaphore(max_channels)
+    self._sftp_clients = queue.LifoQueue()
+    self._executor = None
+
+  @property
+  def client(self):
+    """
+        paramiko.SSHClient, connected on first use
+        """
+    with self._lock:
+      transport = self._client and self._client.get_transport()
+      if transport is None or not transport.is_active():
+        client = paramiko.SSHClient()
+        client.load_system_host_keys()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(self.host,
+                       port=self.port,
+                       username=self.username,
+                       key_filename=self.key_filename,
+                       **self._connect_kwargs)
+        client.get_transport().window_size = 2147483647
+        self._client = client
+        # sessions of the old transport are gone
+        self._sftp_clients = queue.LifoQueue()
+      return self._client
+
+  def run(self, cmd):
+    """
+        Returns:
+            stdout of cmd
+
+        Raises:
+            SSHCommandError if cmd exits with a non-zero status
+        """
+    client = self.client
+    with self._channels:
+      _, out, err = client.exec_command(cmd)
+      stdout = out.read().decode('utf-8')
+      stderr = err.read().decode('utf-8')
+      exit_status = out.channel.recv_exit_status()
+    if exit_status != 0:
+      raise SSHCommandError(self.host, cmd, exit_status, stderr)
+    return stdout
+
+  @contextlib.contextmanager
+  def open_stdin(self, cmd):
+    """
+        Runs cmd and yields a file that streams to its stdin, e.g.
+        with conn.open_stdin('tar -xzf - -C dst') as f: ...
+
+        Raises:
+            SSHCommandError if cmd exits with a non-zero status, once the
+            stream is closed
+        """
+    client = self.client
+    with self._channels:
+      stdin, out, err = client.exec_command(cmd)
+      try:
+        yield stdin
+      finally:
+        stdin.flush()
+        stdin.channel.shutdown_write()
+        out.read()
+        stderr = err.read().decode('utf-8')
+        exit_status = out.channel.recv_exit_status()
+    if exit_status != 0:
+      raise SSHCommandError(self.host, cmd, exit_status, stderr)
+
+  def _checkout_sftp(self):
+    try:
+      return self._sftp_clients.get_nowait()
+    except queue.Empty:
+      return self.client.open_sftp()
+
+  def put(self, src_fname, dst_fname):
+    """
+        Copies a local file to dst_fname on the host, over a pooled SFTP session
+        """
+    with self._channels:
+      sftp = self._checkout_sftp()
+      try:
+        result = sftp.put(src_fname, dst_fname)
+      except Exception:
+        sftp.close()
+        raise
+      self._sftp_clients.put(sftp)
+    return result
+
+  def _submit(self, fn, *args):
+    with self._lock:
+      if self._executor is None:
+        self._executor = ThreadPoolExecutor(max_workers=self.max_channels)
+    return self._executor.submit(fn, *args)
+
+  def run_many(self, cmds, wait=True):
+    """
+        Runs the commands concurrently, each on its own channel
+
+        Args:
+            cmds: list of commands
+            wait: False to return futures instead of waiting for them
+
+        Returns:
+            list of stdout (or futures), in the order of cmds
+        """
+    futures = [self._submit(self.run, cmd) for cmd in cmds]
+    if not wait:
+      return futures
+    return [future.result() for future in futures]
+
+  def put_many(self, files, wait=True):
+    """
+        Args:
+            files: list of (src_fname, dst_fname)
+            wait: False to return futures instead of waiting for them
+        """
+    futures = [self._submit(self.put, src, dst) for src, dst in files]
+    if not wait:
+      return futures
+    return [future.result() for future in futures]
+
+  def close(self):
+    with self._lock:
+      executor, self._executor = self._executor, None
+    if executor is not None:
+      executor.shutdown(wait=True)
+    while not self._sftp_clients.empty():
+      self._sftp_clients.get_nowait().close()
+    if self._client is not None:
+      self._client.close()
+      self._client = None
+
+
+class SSHConnectionPool:
+  """
+    SSHConnection per (username, host, port), shared by all the nodes
+    that point to the same host
+  """
+
+  def __init__(self):
+    self._connections = {}
+    self._lock = threading.Lock()
+
+  def get(self, host, port=22, username=None, **kwargs):
+    """
+        Args:
+            kwargs: see SSHConnection, only used when a new
+                connection is created
+        """
+    key = (username, host, port)
+    with self._lock:
+      if key not in self._connections:
+        self._connections[key] = SSHConnection(host,
+                                               port=port,
+                                               username=username,
+                                               **kwargs)
+      return self._connections[key]
+
+  def close_all(self):
+    with self._lock:
+      connections, self._connections = self._connections, {}
+    for connection in connections.values():
+      connection.close()
+
+
+# shared by all nodes of the process
+default_pool = SSHConnectionPool()
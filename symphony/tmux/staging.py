@@ -0,0 +1,96 @@
+"""
+Copies a local directory to many hosts at once. Every host gets one tar.gz
+stream of the files whose content hash differs from what it already has,
+piped into tar on the host, instead of one SFTP round trip per file.
+Files removed locally are left on the hosts.
+"""
+import io
+import json
+import os
+import shlex
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from symphony.utils.serialization import binary_hash
+
+# {relative path: binary_hash of the content} of the last staged version,
+# kept at the root of the target directory
+MANIFEST_NAME = '.symphony_manifest.json'
+
+
+def build_manifest(src_path):
+  """
+    Returns:
+        {path relative to src_path: binary_hash of the file}
+  """
+  manifest = {}
+  for root, dirs, files in os.walk(src_path):
+    dirs.sort()
+    for fname in sorted(files):
+      path = os.path.join(root, fname)
+      rel_path = os.path.relpath(path, src_path)
+      if rel_path == MANIFEST_NAME:
+        continue
+      with open(path, 'rb') as f:
+        manifest[rel_path] = binary_hash(f.read())
+  return manifest
+
+
+def write_archive(fileobj, src_path, rel_paths, manifest):
+  """
+    Streams a tar.gz of rel_paths and the manifest to fileobj, without
+    buffering the archive
+  """
+  with tarfile.open(fileobj=fileobj, mode='w|gz') as tar:
+    for rel_path in rel_paths:
+      tar.add(os.path.join(src_path, rel_path), arcname=rel_path,
+              recursive=False)
+    data = json.dumps(manifest, sort_keys=True).encode('utf-8')
+    info = tarfile.TarInfo(MANIFEST_NAME)
+    info.size = len(data)
+    info.mtime = time.time()
+    tar.addfile(info, io.BytesIO(data))
+
+
+def stage_to(connection, src_path, dst_path, manifest):
+  """
+    Args:
+        connection: SSHConnection to the host
+        manifest: build_manifest(src_path)
+
+    Returns:
+        paths relative to src_path that were sent
+  """
+  dst = shlex.quote(dst_path)
+  out = connection.run('cat {}/{} 2>/dev/null || true'.format(
+      dst, MANIFEST_NAME))
+  remote_manifest = json.loads(out) if out.strip() else {}
+  changed = [rel_path for rel_path, file_hash in manifest.items()
+             if remote_manifest.get(rel_path) != file_hash]
+  if not changed and remote_manifest == manifest:
+    return []
+  with connection.open_stdin('mkdir -p {0} && tar -xzf - -C {0}'.format(
+      dst)) as stdin:
+    write_archive(stdin, src_path, changed, manifest)
+  return changed
+
+
+def stage_dir(connections, src_path, dst_path, max_workers=16):
+  """
+    Makes dst_path on every host a copy of the local src_path, concurrently
+
+    Args:
+        connections: list of SSHConnection
+        max_workers: hosts staged at the same time
+
+    Returns:
+        list of the relative paths sent to each host, in the order of
+        connections
+  """
+  src_path = os.path.expanduser(src_path)
+  manifest = build_manifest(src_path)
+  with ThreadPoolExecutor(max_workers=max_workers) as pool:
+    futures = [pool.submit(stage_to, connection, src_path, dst_path, manifest)
+               for connection in connections]
+  return [future.result() for future in futures]
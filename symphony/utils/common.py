@@ -152,6 +152,8 @@ def compact_range_dumps(li):
     [1,2,3,4,6,7] => '1-4,6-7'
     """
     li = sorted(li)
+    if not li:
+        return ''
     low = None
     high = None
     collections = []
@@ -160,18 +162,38 @@ def compact_range_dumps(li):
         if low is None:
             low = number
             high = number
-        elif high + 1 == number:
+        elif high + 1 == number or high == number:
             high = number
         else:
             collections.append('{}-{}'.format(low, high))
-            low = None
-            high = None
+            low = number
+            high = number
     collections.append('{}-{}'.format(low, high))
     return ','.join(collections)
 
 def compact_range_loads(description):
+    if not description:
+        return []
     specs = [x.split('-') for x in description.split(',')]
     li = []
     for low, high in specs:
         li += list(range(int(low), int(high)+1))
     return li
+
+
+_DURATION_RE = re.compile(r'^(\d+)([smhd]?)$')
+_DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(duration):
+    """
+    Converts kubectl-style relative durations to seconds
+    5 -> 5, '5s' -> 5, '2m' -> 120, '3h' -> 10800
+    """
+    if isinstance(duration, (int, float)):
+        return int(duration)
+    match = _DURATION_RE.match(str(duration).strip())
+    if not match:
+        raise ValueError('Invalid duration {}, expected format like 5s, 2m, 3h'
+                         .format(duration))
+    return int(match.group(1)) * _DURATION_UNITS[match.group(2)]
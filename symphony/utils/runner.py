@@ -1,16 +1,43 @@
 import subprocess as pc
+import io
 import os
+import json
+import tempfile
 from symphony.utils.common import print_err
 
 
 def run_process(cmd, stdin=''):
+    """
+    Args:
+        stdin: string, or function that writes the input to the text file
+            it is given, so that it does not have to be held in memory
+    """
     # if isinstance(cmd, str):  # useful for shell=False
     #     cmd = shlex.split(cmd.strip())
+    if callable(stdin):
+        return _run_process_streaming(cmd, stdin)
     proc = pc.Popen(cmd, stdin=pc.PIPE, stdout=pc.PIPE, stderr=pc.PIPE, shell=True)
     out, err = proc.communicate(stdin.encode())
     return out.decode('utf-8'), err.decode('utf-8'), proc.returncode
 
 
+def _run_process_streaming(cmd, write_stdin):
+    # outputs go to files so that the process never blocks on a full pipe
+    # while its input is being written
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        proc = pc.Popen(cmd, stdin=pc.PIPE, stdout=out, stderr=err, shell=True)
+        try:
+            with io.TextIOWrapper(proc.stdin, encoding='utf-8') as f:
+                write_stdin(f)
+        except BrokenPipeError:  # the process exited early, see its stderr
+            pass
+        proc.wait()
+        out.seek(0)
+        err.seek(0)
+        return (out.read().decode('utf-8'), err.read().decode('utf-8'),
+                proc.returncode)
+
+
 def run(cmd, dry_run=False, stdin=''):
     if dry_run:
         print(cmd)
@@ -59,3 +86,40 @@ def run_verbose(cmd, print_out=True, raise_on_error=False, dry_run=False, stdin=
     elif out and print_out:
         print(out)
     return out, err, retcode
+
+
+def stream_json_lines(cmd):
+    """
+    Runs cmd and yields one decoded JSON object per line of its stdout,
+    e.g. for `kubectl get --raw <watch url>`. The process is killed if the
+    generator is closed early.
+    """
+    for line in stream_lines(cmd):
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def stream_lines(cmd):
+    """
+    Runs cmd and yields its stdout line by line, without the line ending,
+    e.g. for `kubectl logs --follow`. The process is killed if the
+    generator is closed early.
+    """
+    # stderr goes to a file, a full stderr pipe would block the process
+    # while stdout is being read
+    with tempfile.TemporaryFile() as err:
+        proc = pc.Popen(cmd, stdout=pc.PIPE, stderr=err, shell=True)
+        try:
+            for line in proc.stdout:
+                yield line.decode('utf-8', errors='replace').rstrip('\r\n')
+            retcode = proc.wait()
+            if retcode != 0:
+                err.seek(0)
+                raise RuntimeError('Command `{}` fails: {}'.format(
+                    cmd, err.read().decode('utf-8', errors='replace').strip()))
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
@@ -6,14 +6,16 @@ import base64
 import hashlib
 import json
 import marshal
-import pyarrow
 
 
 def pa_serialize(obj):
+    # optional dependency, not needed by the rest of the module
+    import pyarrow
     return pyarrow.serialize(obj).to_buffer()
 
 
 def pa_deserialize(binary):
+    import pyarrow
     return pyarrow.deserialize(binary)
 
 
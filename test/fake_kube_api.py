@@ -0,0 +1,107 @@
+"""
+Minimal in-process stand-in for the Kubernetes API server
+"""
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeKubeApiServer:
+    """
+    Serves GET and DELETE requests from self.routes:
+    {path: JSON-able object or str}.
+    GET <path>?watch=1 streams the events put into watch_queue(path), until
+    None is put. Records every request and the client address it came from.
+    """
+    def __init__(self, token='fake-token'):
+        self.token = token
+        self.routes = {}
+        self.watches = {}
+        self.requests = []
+        self.connections = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self, 'GET')
+
+            def do_DELETE(self):
+                server._handle(self, 'DELETE')
+
+        self.httpd = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+
+    def kubeconfig(self, namespace='default'):
+        return {
+            'current-context': 'fake',
+            'contexts': [{'name': 'fake', 'context': {
+                'cluster': 'fake', 'user': 'fake', 'namespace': namespace}}],
+            'clusters': [{'name': 'fake', 'cluster': {'server': self.url}}],
+            'users': [{'name': 'fake', 'user': {'token': self.token}}],
+        }
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handle(self, handler, method):
+        url = urlparse(handler.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.requests.append((method, url.path, query))
+        self.connections.add(handler.client_address)
+        if handler.headers.get('Authorization') != 'Bearer ' + self.token:
+            return self._send(handler, 401, {'message': 'Unauthorized'})
+        if query.get('watch') and url.path in self.watches:
+            return self._stream(handler, self.watches[url.path])
+        if url.path not in self.routes:
+            return self._send(handler, 404, {'message': 'not found'})
+        self._send(handler, 200, self.routes[url.path])
+
+    def watch_queue(self, path):
+        if path not in self.watches:
+            self.watches[path] = queue.Queue()
+        return self.watches[path]
+
+    def _stream(self, handler, events):
+        handler.send_response(200)
+        handler.send_header('Transfer-Encoding', 'chunked')
+        handler.end_headers()
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            line = (json.dumps(event) + '\n').encode('utf-8')
+            handler.wfile.write('{:x}\r\n'.format(len(line)).encode() +
+                                line + b'\r\n')
+            handler.wfile.flush()
+        handler.wfile.write(b'0\r\n\r\n')
+
+    def _send(self, handler, status, body):
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        body = body.encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
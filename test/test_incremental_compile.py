@@ -0,0 +1,114 @@
+import pytest
+from symphony.kube import KubeExperimentSpec
+from symphony.subproc.experiment import SubprocExperimentSpec
+
+
+class TestKubeIncrementalCompile:
+    def prep_env(self):
+        exp = KubeExperimentSpec('exp')
+        group = exp.new_process_group('group')
+        learner = group.new_process('learner')
+        learner.binds('myserver')
+        group.new_process('replay').connects('myserver')
+        for i in range(3):
+            exp.new_process('agent' + str(i)).connects('myserver')
+        return exp
+
+    def _count_renders(self, exp, monkeypatch):
+        rendered = []
+        for component in list(exp.list_processes()) + list(exp.list_process_groups()):
+            def yml(component=component, yml=component.yml):
+                rendered.append(component.name)
+                return yml()
+            monkeypatch.setattr(component, 'yml', yml)
+        return rendered
+
+    def test_only_changed_components_render(self, monkeypatch):
+        exp = self.prep_env()
+        first = exp._compile()
+        rendered = self._count_renders(exp, monkeypatch)
+        assert exp._compile() == first
+        assert rendered == []
+
+        exp.get_process('agent1').resource_request(cpu=2)
+        exp._compile()
+        assert rendered == ['agent1']
+
+        del rendered[:]
+        exp.get_process_group('group').get_process('replay').set_env('FOO', 'bar')
+        exp._compile()
+        assert rendered == ['group']
+
+    def test_new_service_keeps_ports(self):
+        exp = self.prep_env()
+        exp.compile()
+        port = exp.binded_services['myserver'].port
+        tb = exp.new_process('tb')
+        tb.exposes('tensorboard')
+        components = exp._compile()
+        assert exp.binded_services['myserver'].port == port
+        assert exp.exposed_services['tensorboard'].port != port
+        assert 'exposed-service-tensorboard' in components
+        # the new address reaches existing processes as well
+        assert 'SYMPH_TENSORBOARD_PORT' in components['process-agent0']
+        assert 'SYMPH_TENSORBOARD_PORT' in components['process-group-group']
+
+    def test_pinned_port_moves_existing_service(self):
+        exp = KubeExperimentSpec('exp', port_range=range(7000, 7010))
+        server = exp.new_process('server')
+        server.binds('svca')
+        exp.compile()
+        assert exp.binded_services['svca'].port == 7000
+        exp.new_process('other').binds({'svcb': 7000})
+        components = exp._compile()
+        assert exp.binded_services['svcb'].port == 7000
+        assert exp.binded_services['svca'].port == 7001
+        assert 'binded-service-svca' in components
+
+    def test_secret_mounted_once(self, tmpdir):
+        secret = tmpdir.join('key')
+        secret.write('secret')
+        exp = KubeExperimentSpec('exp', secrets=[str(secret)])
+        agent = exp.new_process('agent')
+        exp.compile()
+        exp.new_process('tb').exposes('tensorboard')
+        components = exp._compile()
+        assert len(agent.container_yml.data['volumeMounts']) == 1
+        assert 'symph-default-secret' in components['process-tb']
+
+
+class TestSubprocIncrementalCompile:
+    def test_env_entries_propagate(self):
+        exp = SubprocExperimentSpec('exp')
+        server = exp.new_process('server', 'true')
+        server.binds('a')
+        client = exp.new_process('client', 'true')
+        client.connects('a')
+        exp.compile()
+        port = exp.binded_services['a']
+        assert client.env['SYMPH_A_PORT'] == port
+
+        exp.new_process('other', 'true').binds('c')
+        exp.compile()
+        assert exp.binded_services['a'] == port
+        assert client.env['SYMPH_C_PORT'] == exp.binded_services['c']
+        assert exp.get_process('other').env['SYMPH_A_PORT'] == port
+
+    def test_pinned_port_moves_existing_service(self):
+        exp = SubprocExperimentSpec('exp')
+        server = exp.new_process('server', 'true')
+        server.binds('svca')
+        exp.compile()
+        assert exp.binded_services == {'svca': 7000}
+        exp.new_process('other', 'true').binds({'svcb': 7000})
+        exp.compile()
+        assert exp.binded_services == {'svcb': 7000, 'svca': 7001}
+        assert server.env['SYMPH_SVCA_PORT'] == 7001
+
+    def test_pinned_port_taken_twice(self):
+        exp = SubprocExperimentSpec('exp')
+        exp.new_process('a', 'true').binds({'svca': 7000})
+        exp.compile()
+        exp.new_process('b', 'true').binds({'svcb': 7000})
+        with pytest.raises(ValueError):
+            exp.compile()
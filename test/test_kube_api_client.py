@@ -0,0 +1,84 @@
+import pytest
+from symphony.kube import KubeCluster
+from symphony.kube.api_client import (KubeApiClient, KubeApiError,
+                                      parse_duration)
+from .fake_kube_api import FakeKubeApiServer
+
+
+def _pod(name, containers):
+    return {
+        'metadata': {'name': name},
+        'status': {'containerStatuses': [{
+            'name': c,
+            'ready': True,
+            'restartCount': 0,
+            'state': {'terminated': {'exitCode': 0, 'reason': 'Completed',
+                                     'startedAt': '2018-01-01T00:00:00Z',
+                                     'finishedAt': '2018-01-01T00:01:00Z'}},
+        } for c in containers]},
+    }
+
+
+class TestKubeApiClient:
+    def setup_method(self):
+        self.server = FakeKubeApiServer().start()
+        pods = [_pod('group', ['proc1', 'proc2']), _pod('tb', ['tb'])]
+        self.server.routes = {
+            '/api/v1/namespaces': {'items': [
+                {'metadata': {'name': 'default'}},
+                {'metadata': {'name': 'kube-system'}},
+                {'metadata': {'name': 'exp'}},
+            ]},
+            '/api/v1/namespaces/exp/pods': {'items': pods},
+            '/api/v1/namespaces/exp/pods/group': pods[0],
+            '/api/v1/namespaces/exp/pods/tb/log': 'line1\nline2\n',
+        }
+        self.cluster = KubeCluster(transport='api',
+                                   kubeconfig=self.server.kubeconfig())
+
+    def teardown_method(self):
+        self.cluster.api.close()
+        self.server.stop()
+
+    def test_list_experiments(self):
+        assert self.cluster.list_experiments() == ['exp']
+
+    def test_describe_experiment(self):
+        exp = self.cluster.describe_experiment('exp')
+        assert list(exp['group'].keys()) == ['proc1', 'proc2']
+        assert exp[None]['tb']['State'] == 'terminated (0) after 1m: Completed'
+
+    def test_describe_process_group(self):
+        pg = self.cluster.describe_process_group('exp', 'group')
+        assert pg['proc2']['Ready'] == '1'
+
+    def test_get_log(self):
+        assert self.cluster.get_log('exp', 'tb', since='2m', tail=10) \
+            == 'line1\nline2\n'
+        method, path, query = self.server.requests[-1]
+        assert query == {'container': 'tb', 'sinceSeconds': '120',
+                         'tailLines': '10'}
+
+    def test_connection_reuse(self):
+        for _ in range(5):
+            self.cluster.describe_experiment('exp')
+        assert len(self.server.requests) == 5
+        assert len(self.server.connections) == 1
+
+    def test_errors(self):
+        with pytest.raises(KubeApiError) as e:
+            self.cluster.describe_process_group('exp', 'missing')
+        assert e.value.status == 404
+        client = KubeApiClient(self.server.kubeconfig())
+        client.kubeconfig.user = {'token': 'wrong'}
+        with pytest.raises(KubeApiError) as e:
+            client.get_resources('pod', namespace='exp')
+        assert e.value.status == 401
+
+    def test_parse_duration(self):
+        assert parse_duration(0) == 0
+        assert parse_duration('0') == 0
+        assert parse_duration('5s') == 5
+        assert parse_duration('3h') == 10800
+        with pytest.raises(ValueError):
+            parse_duration('5 minutes')
@@ -0,0 +1,88 @@
+import pytest
+from symphony.kube import KubeCluster
+from symphony.kube.namespace_deletion import NamespaceDeletion
+import symphony.utils.runner as runner
+from .fake_kube_api import FakeKubeApiServer
+
+_NS_PATH = '/api/v1/namespaces'
+
+
+def _ns_list(names, rv=10):
+    return {'metadata': {'resourceVersion': str(rv)},
+            'items': [{'metadata': {'name': name}} for name in names]}
+
+
+def _deleted(name):
+    return {'type': 'DELETED', 'object': {'metadata': {'name': name}}}
+
+
+def test_wait_follows_watch():
+    watches = []
+
+    def watch(rv, timeout_seconds):
+        watches.append(rv)
+        yield {'type': 'MODIFIED', 'object': {'metadata': {'name': 'exp1'}}}
+        yield _deleted('other')
+        yield _deleted('exp1')
+        yield _deleted('exp2')
+
+    progress = []
+    deletion = NamespaceDeletion(
+        ['exp2', 'exp1', 'exp0'],
+        list_func=lambda: _ns_list(['default', 'exp1', 'exp2']),
+        watch_func=watch)
+    assert deletion.wait(progress=lambda *p: progress.append(p))
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+    assert watches == ['10'] and deletion.pending() == []
+
+
+def test_wait_relists_and_times_out():
+    lists = []
+
+    def list_func():
+        lists.append(1)
+        return _ns_list(['exp0'], rv=len(lists))
+
+    def watch(rv, timeout_seconds):
+        assert timeout_seconds == 1
+        yield {'type': 'ERROR', 'object': {'code': 410}}
+
+    deletion = NamespaceDeletion(['exp0'], list_func, watch)
+    assert not deletion.wait(timeout=0.05)
+    assert deletion.pending() == ['exp0'] and not deletion.done()
+    assert len(lists) >= 1
+
+
+def test_delete_batch_kubectl(monkeypatch):
+    commands = []
+    monkeypatch.setattr(runner, 'run_verbose',
+                        lambda cmd, **kwargs: commands.append(cmd) or ('', '', 0))
+    cluster = KubeCluster()
+    deletion = cluster.delete_batch(['exp0', 'exp1'])
+    assert commands == ['kubectl delete namespace --wait=false '
+                        '--ignore-not-found exp0 exp1']
+    assert deletion.names == ['exp0', 'exp1']
+    with pytest.raises(AssertionError):
+        cluster.delete_batch(['exp0', 'kube-system'])
+
+
+def test_delete_batch_api():
+    server = FakeKubeApiServer().start()
+    server.routes = {_NS_PATH + '/exp0': {}, _NS_PATH + '/exp1': {},
+                     _NS_PATH: _ns_list(['exp1'])}
+    events = server.watch_queue(_NS_PATH)
+    try:
+        cluster = KubeCluster(transport='api', kubeconfig=server.kubeconfig())
+        deletion = cluster.delete_batch(['exp0', 'exp1', 'missing'])
+        deletes = sorted(path for method, path, _ in server.requests
+                         if method == 'DELETE')
+        assert deletes == [_NS_PATH + '/exp0', _NS_PATH + '/exp1',
+                           _NS_PATH + '/missing']
+        events.put(_deleted('exp1'))
+        assert deletion.wait(timeout=5)
+        watch = [q for method, path, q in server.requests
+                 if path == _NS_PATH and q.get('watch')]
+        assert watch[0]['resourceVersion'] == '10'
+    finally:
+        events.put(None)
+        server.stop()
@@ -0,0 +1,108 @@
+import pytest
+from symphony.kube import GKEDispatcher, KubeExperimentSpec
+
+
+def _pool(name, cpu, memory_m, gpu_type=None, gpu_count=None, taint=None):
+    labels = {'name': name, 'cpu': cpu, 'memory_m': memory_m}
+    if gpu_count is not None:
+        labels.update(gpu_type=gpu_type, gpu_count=gpu_count)
+    node_config = {'labels': labels}
+    if taint is not None:
+        node_config['taint'] = taint
+    return {'node_config': node_config}
+
+
+TF_JSON = {'resource': {'google_container_node_pool': {
+    'cpu-small': _pool('cpu-small', 4, 16000),
+    'cpu-large': _pool('cpu-large', 16, 64000, taint=[
+        {'key': 'surreal', 'value': 'true', 'effect': 'NO_EXECUTE'}]),
+    'gpu-k80': _pool('gpu-k80', 8, 32000, gpu_type='nvidia-tesla-k80',
+                     gpu_count=4),
+}}}
+
+
+def _experiment():
+    exp = KubeExperimentSpec('exp')
+    group = exp.new_process_group('nonagent')
+    group.new_process('learner', container_image='learner')
+    group.new_process('replay', container_image='replay')
+    for i in range(8):
+        exp.new_process('agent{}'.format(i), container_image='agent')
+    return exp
+
+
+def _requests():
+    requests = {
+        'learner': dict(cpu=2, memory_m=8000, gpu_count=2, gpu_type='k80'),
+        'replay': dict(cpu=2, memory_m=8000),
+    }
+    for i in range(8):
+        requests['agent{}'.format(i)] = dict(cpu=1.5, memory_m=2000)
+    return requests
+
+
+def test_dispatch_minimizes_nodes():
+    exp = _experiment()
+    plan = GKEDispatcher(TF_JSON).dispatch(exp, _requests())
+    # 8 agents of 1.5 cpu fit on one large node (15.4 cpu)
+    assert plan.node_counts == {'gpu-k80': 1, 'cpu-large': 1}
+    assert plan.assignments['nonagent'] == 'gpu-k80'
+    assert 'packing efficiency' in plan.summary()
+    assert plan.efficiency()['cpu'] == pytest.approx(16 / (15.4 + 7.4))
+
+    agent = exp.get_process('agent0').pod_yml.data
+    assert agent['spec']['nodeSelector'] == {'name': 'cpu-large'}
+    assert agent['spec']['tolerations'] == [{'key': 'surreal', 'value': 'true',
+                                             'effect': 'NoExecute',
+                                             'operator': 'Equal'}]
+    pod = exp.get_process_group('nonagent').pod_yml.data
+    assert pod['spec']['nodeSelector'] == {'name': 'gpu-k80'}
+    container = exp.get_process_group('nonagent').get_process('learner').container_yml.data
+    assert container['resources']['limits'] == {'nvidia.com/gpu': 2}
+
+
+def test_dispatch_minimizes_cost():
+    exp = _experiment()
+    plan = GKEDispatcher(TF_JSON).dispatch(
+        exp, _requests(), objective='cost', dry_run=True,
+        pool_costs={'cpu-small': 1, 'cpu-large': 5, 'gpu-k80': 10})
+    # 2 agents per small node cost 4, one large node costs 5
+    assert plan.node_counts == {'gpu-k80': 1, 'cpu-small': 4}
+    assert plan.cost == 14
+    assert 'nodeSelector' not in exp.get_process('agent0').pod_yml.data['spec']
+
+
+def test_dispatch_errors():
+    dispatcher = GKEDispatcher(TF_JSON)
+    with pytest.raises(ValueError):
+        dispatcher.dispatch(_experiment(), {'agent0': dict(cpu=32)})
+    with pytest.raises(ValueError):
+        dispatcher.dispatch(_experiment(), {'missing': dict(cpu=1)})
+    with pytest.raises(ValueError):
+        dispatcher.dispatch(_experiment(), {}, objective='cost')
+
+
+def test_infer_node_pool_name():
+    dispatcher = GKEDispatcher(TF_JSON)
+    assert dispatcher.infer_node_pool_name(cpu=2, memory_m=1000) == 'cpu-small'
+    assert dispatcher.infer_node_pool_name(cpu=4) == 'cpu-large'
+    assert dispatcher.infer_node_pool_name(memory_m=20000) == 'cpu-large'
+    assert dispatcher.infer_node_pool_name(gpu_type='K80', gpu_count=2) == 'gpu-k80'
+    assert dispatcher.infer_node_pool_name(gpu_count=4) == 'gpu-k80'
+    with pytest.raises(ValueError):
+        dispatcher.infer_node_pool_name(gpu_type='v100', gpu_count=1)
+    with pytest.raises(ValueError):
+        dispatcher.infer_node_pool_name(gpu_count=8)
+
+
+def test_assign_to_resource():
+    dispatcher = GKEDispatcher(TF_JSON)
+    exp = KubeExperimentSpec('exp')
+    for i in range(3):
+        process = exp.new_process('p{}'.format(i), container_image='agent')
+        dispatcher.assign_to_resource(process, cpu=5, gpu_count=1)
+    tolerations = exp.get_process('p2').pod_yml.data['spec']['tolerations']
+    assert tolerations == [{'effect': 'NoSchedule', 'key': 'nvidia.com/gpu',
+                            'operator': 'Exists'}]
+    assert TF_JSON['resource']['google_container_node_pool']['cpu-large'][
+        'node_config']['taint'][0]['effect'] == 'NO_EXECUTE'
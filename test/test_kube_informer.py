@@ -0,0 +1,110 @@
+import threading
+import time
+import pytest
+from symphony.kube import KubeCluster
+from .fake_kube_api import FakeKubeApiServer
+
+_PODS_PATH = '/api/v1/namespaces/exp/pods'
+
+
+def _pod(name, rv, ready=False, restarts=0):
+    if ready:
+        state = {'running': {'startedAt': '2018-01-01T00:00:00Z'}}
+    else:
+        state = {'waiting': {'reason': 'ContainerCreating'}}
+    return {
+        'metadata': {'name': name, 'resourceVersion': str(rv)},
+        'status': {'containerStatuses': [{
+            'name': name, 'ready': ready, 'restartCount': restarts,
+            'state': state,
+        }]},
+    }
+
+
+class TestPodInformer:
+    def setup_method(self):
+        self.server = FakeKubeApiServer().start()
+        self.server.routes = {
+            _PODS_PATH: {'metadata': {'resourceVersion': '10'},
+                         'items': [_pod('learner', 9)]},
+            _PODS_PATH + '/learner/log': 'hello\n',
+        }
+        self.events = self.server.watch_queue(_PODS_PATH)
+        self.cluster = KubeCluster(transport='api', pod_cache=True,
+                                   kubeconfig=self.server.kubeconfig())
+
+    def teardown_method(self):
+        self.cluster.stop_pod_informers()
+        self.events.put(None)
+        self.server.stop()
+
+    def _watch_requests(self):
+        return [q for _, path, q in self.server.requests
+                if path == _PODS_PATH and q.get('watch')]
+
+    def test_describe_from_cache(self):
+        exp = self.cluster.describe_experiment('exp')
+        assert exp[None]['learner']['State'] == 'waiting: ContainerCreating'
+        self.events.put({'type': 'ADDED', 'object': _pod('agent', 11)})
+        informer = self.cluster.pod_informer('exp')
+        assert informer.wait_for(lambda pods: 'agent' in pods, timeout=5)
+        exp = self.cluster.describe_experiment('exp')
+        assert list(exp[None].keys()) == ['agent', 'learner']
+        self.events.put({'type': 'DELETED', 'object': _pod('agent', 12)})
+        assert informer.wait_for(lambda pods: 'agent' not in pods, timeout=5)
+        # one list, everything else came through the watch
+        lists = [q for _, path, q in self.server.requests
+                 if path == _PODS_PATH and not q.get('watch')]
+        assert len(lists) == 1
+        assert self._watch_requests()[0]['resourceVersion'] == '10'
+
+    def test_wakes_on_ready(self):
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(
+            self.cluster.get_log_when_alive('exp', 'learner', sleep_interval=5)),
+            daemon=True)
+        waiter.start()
+        self.cluster.pod_informer('exp')
+        start_time = time.time()
+        self.events.put({'type': 'MODIFIED',
+                         'object': _pod('learner', 11, ready=True)})
+        waiter.join(timeout=5)
+        assert result == ['hello\n']
+        assert time.time() - start_time < 1
+
+    def test_resync_on_expired_watch(self):
+        informer = self.cluster.pod_informer('exp')
+        self.server.routes[_PODS_PATH] = {
+            'metadata': {'resourceVersion': '20'},
+            'items': [_pod('learner', 19, ready=True)]}
+        self.events.put({'type': 'ERROR', 'object': {
+            'kind': 'Status', 'code': 410, 'message': 'too old'}})
+        assert informer.wait_for(
+            lambda pods: pods['learner'].status.containerStatuses[0].ready,
+            timeout=5)
+        assert informer.resync_count == 1
+        deadline = time.time() + 5
+        while len(self._watch_requests()) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        assert self._watch_requests()[-1]['resourceVersion'] == '20'
+
+
+def test_polls_without_pod_cache(monkeypatch):
+    cluster = KubeCluster()
+    stats = [{}, {None: {'learner': {'Ready': '1', 'Restarts': '0',
+                                     'State': 'running: 1s'}}}]
+    monkeypatch.setattr(cluster, 'describe_experiment', lambda name: stats.pop(0))
+    monkeypatch.setattr(cluster, 'get_log', lambda **kwargs: 'hello\n')
+    assert cluster.get_log_when_alive('exp', 'learner', sleep_interval=0) == 'hello\n'
+    assert cluster._informers == {}
+
+
+def test_sync_timeout(monkeypatch):
+    cluster = KubeCluster(pod_cache=True)
+
+    def list_pods(namespace):
+        raise RuntimeError('cannot list')
+    monkeypatch.setattr(cluster, '_list_pods', list_pods)
+    with pytest.raises(RuntimeError):
+        cluster.pod_informer('exp', timeout=0.1)
+    assert cluster._informers == {}
@@ -0,0 +1,108 @@
+import sys
+import threading
+from symphony.kube import KubeCluster
+from symphony.kube.log_stream import LogStream, parse_timestamp
+import symphony.utils.runner as runner
+from .fake_kube_api import FakeKubeApiServer
+
+_NS_PATH = '/api/v1/namespaces/exp'
+
+
+def _pod(name, containers):
+    return {
+        'metadata': {'name': name},
+        'status': {'containerStatuses': [{
+            'name': c, 'ready': True, 'restartCount': 0,
+            'state': {'running': {'startedAt': '2018-01-01T00:00:00Z'}},
+        } for c in containers]},
+    }
+
+
+def test_parse_timestamp():
+    # trailing zeros of the fraction are trimmed by kubernetes
+    key1, text = parse_timestamp('2018-01-01T00:00:00.1Z hello world')
+    key2, _ = parse_timestamp('2018-01-01T00:00:00.12Z x')
+    key3, _ = parse_timestamp('2018-01-01T00:00:00Z x')
+    assert text == 'hello world'
+    assert key3 < key1 < key2
+    assert parse_timestamp('no timestamp here') == (None, 'no timestamp here')
+
+
+def test_lines_merged_by_timestamp():
+    logs = {
+        'learner': '2018-01-01T00:00:01Z a\n2018-01-01T00:00:03Z c\n  more\n',
+        'agent': '2018-01-01T00:00:02Z b\n2018-01-01T00:00:04Z d\n',
+    }
+    stream = LogStream([(name, name, name) for name in logs],
+                       fetch_func=lambda pod, container: logs[pod],
+                       stream_func=None, max_workers=1)
+    assert stream.lines() == ['[learner] a', '[agent] b', '[learner] c',
+                              '[learner]   more', '[agent] d']
+
+
+def test_follow_with_back_pressure():
+    produced = []
+
+    def stream_func(pod, container):
+        for i in range(20):
+            produced.append(i)
+            yield '2018-01-01T00:00:{:02d}Z {}{}'.format(i, pod, i)
+
+    stream = LogStream([('a', 'a', 'a')], fetch_func=None,
+                       stream_func=stream_func, buffer_size=2, merge_window=0.01)
+    lines = stream.follow()
+    assert next(lines) == '[a] a0'
+    # the reader blocks on the full buffer until lines are consumed
+    threading.Event().wait(0.2)
+    assert len(produced) <= 5
+    assert list(lines)[-1] == '[a] a19'
+
+
+def test_follow_merges_streams():
+    events = {'a': threading.Event(), 'b': threading.Event()}
+
+    def stream_func(pod, container):
+        if pod == 'a':
+            yield '2018-01-01T00:00:01Z first'
+            events['a'].set()
+            events['b'].wait(5)
+            yield '2018-01-01T00:00:04Z fourth'
+        else:
+            events['a'].wait(5)
+            yield '2018-01-01T00:00:02Z second'
+            yield '2018-01-01T00:00:03Z third'
+            events['b'].set()
+
+    # more containers than max_workers still get one stream each
+    stream = LogStream([('a', 'a', 'a'), ('b', 'b', 'b')], fetch_func=None,
+                       stream_func=stream_func, max_workers=1, merge_window=5)
+    assert list(stream.follow()) == ['[a] first', '[b] second', '[b] third',
+                                     '[a] fourth']
+
+
+def test_get_log_of_process_group():
+    server = FakeKubeApiServer().start()
+    server.routes = {
+        _NS_PATH + '/pods': {'items': [_pod('group', ['learner', 'replay']),
+                                       _pod('agent', ['agent'])]},
+        _NS_PATH + '/pods/group/log': '2018-01-01T00:00:02Z learner\n',
+        _NS_PATH + '/pods/agent/log': '2018-01-01T00:00:01Z agent\n',
+    }
+    try:
+        cluster = KubeCluster(transport='api', kubeconfig=server.kubeconfig())
+        out = cluster.get_log('exp', None)
+        assert out.splitlines() == ['[agent] agent', '[group/learner] learner',
+                                    '[group/replay] learner']
+        assert cluster.get_log('exp', None, 'group').splitlines()[0] == \
+            '[group/learner] learner'
+        queries = [q for _, path, q in server.requests if path.endswith('/log')]
+        assert all(q['timestamps'] == 'true' for q in queries)
+    finally:
+        server.stop()
+
+
+def test_stream_lines_with_large_stderr():
+    # more warnings than a pipe buffer holds must not block the process
+    cmd = '{} -c "import sys; sys.stderr.write(\'w\' * 1000000); print(1)"'.format(
+        sys.executable)
+    assert list(runner.stream_lines(cmd)) == ['1']
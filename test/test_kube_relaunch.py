@@ -0,0 +1,110 @@
+import io
+from pathlib import Path
+import pytest
+import yaml
+from symphony.addons import LocalFileManager
+from symphony.kube import KubeCluster, KubeExperimentSpec
+from symphony.kube.manifest import diff_manifest
+import symphony.utils.runner as runner
+
+
+class _FileManager(LocalFileManager):
+    def __init__(self, root):
+        super().__init__()
+        self.root = root
+
+    @property
+    def data_root(self):
+        return Path(self.root)
+
+
+def _experiment(num_agents=3):
+    exp = KubeExperimentSpec('exp')
+    exp.new_process('learner', container_image='learner').binds('server')
+    for i in range(num_agents):
+        exp.new_process('agent{}'.format(i), container_image='agent').connects('server')
+    return exp
+
+
+def test_diff_manifest():
+    exp = _experiment()
+    first = diff_manifest(None, exp.iter_objects())
+    assert len(first.changed) == 5 and not first.deleted
+    assert 'Pod/agent2' in first.index
+
+    exp.get_process('agent1').set_env('FOO', 'bar')
+    diff = diff_manifest(first.index, exp.iter_objects())
+    assert [name for name, _ in diff.changed] == ['Pod/agent1']
+    assert diff.replaced == ['Pod/agent1'] and diff.unchanged == 4
+
+    diff = diff_manifest(first.index, _experiment(num_agents=2).iter_objects())
+    assert diff.deleted == ['Pod/agent2'] and not diff.changed
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    commands = []
+    namespaces = set()
+
+    def run_verbose(cmd, stdin='', **kwargs):
+        if callable(stdin):
+            f = io.StringIO()
+            stdin(f)
+            stdin = f.getvalue()
+        commands.append((cmd, stdin))
+        args = cmd.split()
+        if args[:3] == ['kubectl', 'get', 'namespace']:
+            return ('namespace/' + args[3]) if args[3] in namespaces else '', '', 0
+        if args[1:3] == ['create', 'namespace']:
+            namespaces.add(args[3])
+        elif args[1:3] == ['delete', 'namespace']:
+            namespaces.discard(args[3])
+        return '', '', 0
+    monkeypatch.setattr(runner, 'run_verbose', run_verbose)
+    monkeypatch.setattr(KubeCluster, 'set_experiment', lambda self, name: None)
+    return commands
+
+
+def test_relaunch_applies_changes_only(commands, tmpdir):
+    cluster = KubeCluster()
+    cluster.fs = _FileManager(str(tmpdir))
+    cluster.launch(_experiment())
+    assert commands[-1][0].startswith('kubectl create -f')
+    with pytest.raises(ValueError):
+        cluster.launch(_experiment())
+
+    del commands[:]
+    exp = _experiment(num_agents=2)
+    exp.get_process('agent0').set_env('FOO', 'bar')
+    cluster.launch(exp, force=True)
+    deletes = [cmd for cmd, _ in commands if cmd.startswith('kubectl delete')]
+    assert deletes == ['kubectl delete --ignore-not-found --namespace exp '
+                       'Pod/agent2 Pod/agent0']
+    applied = [stdin for cmd, stdin in commands if '--server-side' in cmd]
+    assert [d['metadata']['name'] for d in yaml.safe_load_all(applied[0])] == ['agent0']
+    assert 'agent2' not in tmpdir.join('exp', 'kube.yml').read()
+
+
+def test_relaunch_after_delete(commands, tmpdir):
+    cluster = KubeCluster()
+    cluster.fs = _FileManager(str(tmpdir))
+    cluster.launch(_experiment())
+    cluster.delete('exp')
+    del commands[:]
+    cluster.launch(_experiment(), force=True)
+    created = [cmd for cmd, _ in commands if cmd.startswith('kubectl create')]
+    assert created[0] == 'kubectl create namespace exp'
+    assert created[1].startswith('kubectl create -f')
+
+
+def test_relaunch_without_index(commands, tmpdir):
+    cluster = KubeCluster()
+    cluster.fs = _FileManager(str(tmpdir))
+    cluster.launch(_experiment())
+    # launched before indices were kept
+    tmpdir.join('exp', 'kube.index.json').remove()
+    del commands[:]
+    cluster.launch(_experiment(), force=True)
+    deletes = [cmd for cmd, _ in commands if cmd.startswith('kubectl delete')]
+    assert deletes == ['kubectl delete --ignore-not-found --namespace exp '
+                       'Pod/learner Pod/agent0 Pod/agent1 Pod/agent2']
@@ -0,0 +1,46 @@
+import json
+import yaml
+from symphony.kube import KubeExperimentSpec
+import symphony.utils.runner as runner
+
+
+def _experiment():
+    exp = KubeExperimentSpec('exp')
+    group = exp.new_process_group('group')
+    group.new_process('learner', container_image='learner').binds('server')
+    for i in range(5):
+        agent = exp.new_process('agent{}'.format(i), container_image='agent',
+                                args=['--id', str(i)])
+        agent.connects('server')
+    return exp
+
+
+def test_formats_agree():
+    exp = _experiment()
+    documents = list(yaml.safe_load_all(exp.compile()))
+    assert len(documents) == 7
+    assert list(yaml.safe_load_all(exp.compile(fast=True))) == documents
+    manifest = json.loads(exp.compile(format='json'))
+    assert manifest['kind'] == 'List' and manifest['items'] == documents
+
+
+def test_iter_documents_is_lazy():
+    exp = _experiment()
+    documents = exp.iter_documents(fast=True)
+    first = next(documents)
+    assert yaml.safe_load(first)['kind'] == 'Service'
+    assert len(list(documents)) == 6
+
+
+def test_fast_compile_does_not_leave_stale_cache():
+    exp = _experiment()
+    exp.compile()
+    exp.get_process('agent0').set_env('FOO', 'bar')
+    exp.compile(fast=True)
+    assert 'FOO' in exp.compile()
+
+
+def test_stream_to_stdin():
+    exp = _experiment()
+    out, _, retcode = runner.run('cat', stdin=lambda f: exp.write_manifest(f))
+    assert retcode == 0 and out == exp.compile().strip()
@@ -0,0 +1,59 @@
+import json
+import pytest
+import yaml
+from symphony.kube import KubeExperimentSpec, KubeReplicatedProcessSpec
+
+
+def _experiment(**kwargs):
+    exp = KubeExperimentSpec('exp')
+    exp.new_process('learner', container_image='learner').binds('server')
+    agents = exp.new_replicas('agent', 4, container_image='agent', **kwargs)
+    agents.connects('server')
+    return exp, agents
+
+
+def _env(container):
+    return {e['name']: e.get('value', e.get('valueFrom')) for e in container['env']}
+
+
+def test_overlay():
+    exp, agents = _experiment(replica_envs={'SEED': [10, 11, 12, 13]})
+    agents.resource_request(cpu=1)
+    documents = list(yaml.safe_load_all(exp.compile()))
+    pods = [d for d in documents if d['kind'] == 'Pod'][1:]
+    assert [pod['metadata']['name'] for pod in pods] == agents.replica_names()
+    assert pods[2]['metadata']['labels'] == {'symphony_pg': 'agent-2',
+                                            'symphony_replica_of': 'agent'}
+    assert pods[2]['spec']['containers'][0]['name'] == 'agent-2'
+    env = _env(pods[2]['spec']['containers'][0])
+    assert env['SEED'] == '12' and env['SYMPHONY_REPLICA_INDEX'] == '2'
+    assert env['SYMPH_SERVER_HOST'] == 'server'
+    assert pods[2]['spec']['containers'][0]['resources'] == {'requests': {'cpu': 1}}
+    # the template is not changed by the overlays
+    assert 'SEED' not in _env(agents.container_yml.data)
+    assert json.loads(exp.compile(format='json'))['items'][2:] == pods
+
+
+def test_indexed_job():
+    exp, agents = _experiment(mode='indexed-job')
+    documents = list(yaml.safe_load_all(exp.compile(fast=True)))
+    assert len(documents) == 3
+    job = documents[-1]
+    assert job['kind'] == 'Job'
+    assert job['spec']['completions'] == job['spec']['parallelism'] == 4
+    assert job['spec']['template']['spec']['restartPolicy'] == 'OnFailure'
+    assert 'SYMPHONY_REPLICA_INDEX' in _env(job['spec']['template']['spec']['containers'][0])
+    with pytest.raises(ValueError):
+        agents.set_replica_envs({'SEED': [1, 2, 3, 4]})
+    with pytest.raises(ValueError):
+        agents.binds('other')
+
+
+def test_dump_load():
+    exp, _ = _experiment(replica_envs={'SEED': [10, 11, 12, 13]})
+    exp.compile()
+    loaded = KubeExperimentSpec.load_dict(exp.dump_dict())
+    agents = loaded.get_process('agent')
+    assert isinstance(agents, KubeReplicatedProcessSpec)
+    assert agents.num_replicas == 4 and agents.replica_envs['SEED'][3] == '13'
+    assert loaded.compile() == exp.compile()
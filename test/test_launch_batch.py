@@ -0,0 +1,78 @@
+import threading
+import time
+from symphony.engine import Cluster
+
+
+class _Spec:
+    def __init__(self, name):
+        self.name = name
+
+
+class BatchTestCluster(Cluster):
+    def __init__(self, fail=(), delay=0.05):
+        super().__init__()
+        self.fail = set(fail)
+        self.delay = delay
+        self.launched = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def launch(self, experiment_config, force=False, dry_run=False):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+            self.launched.append(experiment_config.name)
+        if experiment_config.name in self.fail:
+            raise RuntimeError('failed ' + experiment_config.name)
+
+
+class SerialBatchTestCluster(BatchTestCluster):
+    launch_concurrency = 1
+
+
+class TestLaunchBatch:
+    def specs(self, n):
+        return [_Spec('exp{}'.format(i)) for i in range(n)]
+
+    def test_serial(self):
+        cluster = BatchTestCluster()
+        results = cluster.launch_batch(self.specs(3))
+        assert [r.name for r in results] == ['exp0', 'exp1', 'exp2']
+        assert all(r.success for r in results)
+        assert cluster.launched == ['exp0', 'exp1', 'exp2']
+
+    def test_parallel(self):
+        cluster = BatchTestCluster(fail=['exp3'])
+        results = cluster.launch_batch(self.specs(8), max_workers=4)
+        assert [r.name for r in results] == ['exp{}'.format(i) for i in range(8)]
+        assert cluster.max_running > 1
+        assert not results[3].success
+        assert isinstance(results[3].error, RuntimeError)
+        assert sum(r.success for r in results) == 7
+        assert all(r.duration > 0 for r in results)
+
+    def test_launch_concurrency(self):
+        cluster = SerialBatchTestCluster()
+        results = cluster.launch_batch(self.specs(4), max_workers=4)
+        assert cluster.max_running == 1
+        assert all(r.success for r in results)
+
+    def test_stop_on_failure(self):
+        cluster = BatchTestCluster(fail=['exp1'])
+        results = cluster.launch_batch(self.specs(4), stop_on_failure=True)
+        assert results[0].success
+        assert not results[1].success and not results[1].cancelled
+        assert results[2].cancelled and results[3].cancelled
+        assert cluster.launched == ['exp0', 'exp1']
+
+    def test_stop_on_failure_parallel(self):
+        cluster = BatchTestCluster(fail=['exp0'], delay=0.1)
+        results = cluster.launch_batch(self.specs(10), max_workers=2,
+                                       stop_on_failure=True)
+        assert not results[0].success
+        assert any(r.cancelled for r in results)
+        assert len(cluster.launched) < 10
@@ -0,0 +1,56 @@
+from symphony.engine import PortAllocator
+from symphony.kube import KubeExperimentSpec
+from symphony.utils.common import compact_range_dumps
+
+
+class TestPortAllocator:
+    def test_allocate_lowest(self):
+        ports = PortAllocator(range(7000, 7005))
+        assert ports.reserve(7001)
+        assert not ports.reserve(7001)
+        assert not ports.reserve(8000)
+        assert [ports.allocate() for _ in range(4)] == [7000, 7002, 7003, 7004]
+        assert ports.allocate() is None
+        ports.release(7002)
+        ports.release(8000)
+        assert len(ports) == 1
+        assert ports.allocate() == 7002
+
+    def test_exclude(self):
+        ports = PortAllocator(range(7000, 7005))
+        assert ports.allocate(exclude={7000, 7001}) == 7002
+        # excluded ports stay free
+        assert ports.allocate() == 7000
+        assert ports.allocate(exclude=range(7000, 7005)) is None
+
+    def test_holes(self):
+        ports = PortAllocator([9000, 7000, 7002])
+        assert 7001 not in ports
+        ports.release(7001)
+        assert ports.free_ports() == [7000, 7002, 9000]
+        assert ports.allocate() == 7000
+
+    def test_serialization(self):
+        ports = PortAllocator(range(7000, 7010))
+        ports.reserve(7003)
+        ports.reserve(7004)
+        assert ports.dumps() == '7000-7002,7005-7009'
+        loaded = PortAllocator.loads(ports.dumps())
+        assert loaded.free_ports() == ports.free_ports()
+        assert PortAllocator.loads('').allocate() is None
+
+
+def test_compact_range_dumps():
+    assert compact_range_dumps([1, 2, 3, 4, 6, 7]) == '1-4,6-7'
+    assert compact_range_dumps([9, 1, 2, 5]) == '1-2,5-5,9-9'
+    assert compact_range_dumps([]) == ''
+
+
+def test_kube_ports():
+    exp = KubeExperimentSpec('exp', port_range=list(range(7000, 7003)))
+    exp.new_process('a').binds({'fixed': 7000})
+    exp.new_process('b').binds(['auto1', 'auto2'])
+    exp.compile()
+    assert exp.binded_services['fixed'].port == 7000
+    assert sorted([exp.binded_services['auto1'].port,
+                   exp.binded_services['auto2'].port]) == [7001, 7002]
@@ -0,0 +1,37 @@
+import subprocess
+from symphony.kube import KubeExperimentSpec
+from symphony.subproc.experiment import SubprocExperimentSpec
+
+
+def test_kube_config_map():
+    exp = KubeExperimentSpec('exp', shared_env=True)
+    exp.new_process('server').binds('myserver')
+    for i in range(3):
+        exp.new_process('agent' + str(i)).connects('myserver')
+    components = exp._compile()
+    assert 'SYMPH_MYSERVER_PORT' in components['address-book']
+    assert 'kind: ConfigMap' in components['address-book']
+    for i in range(3):
+        assert 'SYMPH_MYSERVER' not in components['process-agent' + str(i)]
+        assert 'symph-address-book' in components['process-agent' + str(i)]
+
+    exp.new_process('tb').exposes('tensorboard')
+    components = exp._compile()
+    assert 'SYMPH_TENSORBOARD_PORT' in components['address-book']
+    agent = exp.get_process('agent0')
+    assert len(agent.container_yml.data['envFrom']) == 1
+
+
+def test_subproc_env_file(tmpdir):
+    env_file = tmpdir.join('address_book.env')
+    exp = SubprocExperimentSpec('exp', env_file=str(env_file))
+    exp.new_process('server', 'true').binds('myserver')
+    client = exp.new_process('client', 'echo $SYMPH_MYSERVER_ADDR')
+    client.connects('myserver')
+    exp.compile()
+    port = exp.binded_services['myserver']
+    assert 'SYMPH_MYSERVER_PORT={}\n'.format(port) in env_file.read()
+    assert 'SYMPH_MYSERVER_PORT' not in client.env
+    output = subprocess.check_output(client.get_cmd(), shell=True,
+                                     executable='/bin/bash')
+    assert output.decode() == '127.0.0.1:{}\n'.format(port)
@@ -0,0 +1,85 @@
+import time
+from symphony.subproc import SubprocManager
+from symphony.subproc.log_writer import RotatingLogWriter, read_log
+
+
+def _lines(start, end):
+    return ''.join('line{}\n'.format(i) for i in range(start, end))
+
+
+class TestRotatingLogWriter:
+    def test_rotation(self, tmpdir):
+        path = str(tmpdir.join('p.out'))
+        writer = RotatingLogWriter(path, max_bytes=100, backup_count=2)
+        for i in range(40):
+            writer.write('line{}\n'.format(i).encode())
+        writer.close()
+        assert tmpdir.join('p.out.1').exists()
+        assert tmpdir.join('p.out.2').exists()
+        assert not tmpdir.join('p.out.3').exists()
+        for f in ['p.out', 'p.out.1', 'p.out.2']:
+            assert tmpdir.join(f).size() <= 100
+            assert tmpdir.join(f + '.idx').exists()
+        # the oldest segments are gone, the rest is read in order
+        logs = read_log(path)
+        assert logs.endswith(_lines(30, 40))
+        assert logs == _lines(40 - logs.count('\n'), 40)
+
+    def test_tail_across_compressed_segments(self, tmpdir):
+        path = str(tmpdir.join('p.out'))
+        writer = RotatingLogWriter(path, max_bytes=60, compress=True)
+        for i in range(20):
+            writer.write('line{}\n'.format(i).encode())
+        writer.close()
+        assert tmpdir.join('p.out.1.gz').exists()
+        assert read_log(path, tail=12) == _lines(8, 20)
+        assert read_log(path, tail=0) == ''
+
+    def test_since(self, tmpdir):
+        path = str(tmpdir.join('p.out'))
+        writer = RotatingLogWriter(path, max_bytes=200, index_interval=0.)
+        writer.write(_lines(0, 10).encode())
+        time.sleep(0.05)
+        since = time.time()
+        time.sleep(0.05)
+        writer.write(_lines(10, 40).encode())
+        writer.close()
+        assert read_log(path, since=since, index_interval=0.) == _lines(10, 40)
+        assert read_log(path, since=since, tail=3, index_interval=0.) \
+            == _lines(37, 40)
+        assert read_log(path, since=0) == _lines(0, 40)
+        assert read_log(path, since=time.time() + 60) == ''
+
+    def test_partial_lines(self, tmpdir):
+        path = str(tmpdir.join('p.out'))
+        writer = RotatingLogWriter(path, index_interval=0.)
+        writer.write(b'abc')
+        writer.write(b'def\nghi')
+        writer.write(b'\n')
+        writer.close()
+        offsets = [int(line.split()[0])
+                   for line in tmpdir.join('p.out.idx').readlines()]
+        # index entries always point at the start of a line
+        assert offsets == [0, 7]
+        assert read_log(path, tail=1) == 'ghi\n'
+
+
+def test_read_log_tail(tmpdir):
+    f = tmpdir.join('log')
+    f.write(''.join('{}\n'.format(i) for i in range(5000)))
+    assert read_log(str(f), tail=3) == '4997\n4998\n4999\n'
+    assert read_log(str(f), tail=0) == ''
+    assert read_log(str(f), tail=-1) == f.read()
+    assert read_log(str(f), tail=9000) == f.read()
+
+
+def test_manager_file_mode(tmpdir):
+    manager = SubprocManager(stdout_mode='file', stderr_mode='file',
+                             log_dir=str(tmpdir), max_log_bytes=1000)
+    manager.launch('p', 'for i in $(seq 0 299); do echo line$i; done; '
+                        'echo oops >&2', {})
+    manager.join(kill_on_error=False)
+    assert manager.read_log('p', tail=2) == 'line298\nline299\n'
+    assert manager.read_log('p', stream='err') == 'oops\n'
+    assert tmpdir.join('p.out.1').exists()
+    assert tmpdir.join('p.out').size() <= 1000 + 8
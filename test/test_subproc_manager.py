@@ -0,0 +1,99 @@
+import signal
+import time
+import pytest
+from symphony.subproc import SubprocManager, RestartPolicy, SubprocProcessSpec
+from symphony.subproc import manager as subproc_manager
+
+
+class TestSubprocManagerJoin:
+    def setup_method(self):
+        # join() installs its own handlers for these signals
+        self.handlers = {sig: signal.getsignal(sig)
+                         for sig in SubprocManager.SIG_DICT}
+        self.manager = SubprocManager(stdout_mode='none', stderr_mode='none')
+
+    def teardown_method(self):
+        self.manager.kill_all()
+        for sig, handler in self.handlers.items():
+            signal.signal(sig, handler)
+
+    def test_reacts_immediately(self, capsys):
+        self.manager.launch('fast', 'sleep 0.1', {})
+        self.manager.launch('failed', 'sleep 0.2; exit 3', {})
+        start_time = time.time()
+        self.manager.join(kill_on_error=False)
+        assert time.time() - start_time < 0.9
+        out = capsys.readouterr().out
+        assert 'PROCESS "fast" DONE' in out
+        assert 'PROCESS "failed" TERMINATED WITH ERROR CODE 3' in out
+
+    def test_kill_on_error(self, capsys):
+        self.manager.launch('long', 'sleep 30', {})
+        self.manager.launch('failed', 'exit 1', {})
+        start_time = time.time()
+        self.manager.join(kill_on_error=True)
+        assert time.time() - start_time < 5
+        assert self.manager.poll('long') is not None
+        assert 'KILLING ALL REMAINING' in capsys.readouterr().out
+
+    def test_sigchld_fallback(self, monkeypatch):
+        monkeypatch.setattr(subproc_manager._ChildExitSelector,
+                            '_pidfd_supported', lambda self: False)
+        old_handler = signal.getsignal(signal.SIGCHLD)
+        self.manager.launch('a', 'sleep 0.1', {})
+        self.manager.launch('b', 'exit 0', {})
+        start_time = time.time()
+        self.manager.join(kill_on_error=False)
+        assert time.time() - start_time < 0.9
+        assert self.manager.poll_all() == {'a': 0, 'b': 0}
+        assert signal.getsignal(signal.SIGCHLD) == old_handler
+
+    def test_polling(self):
+        self.manager.launch('a', 'exit 0', {})
+        self.manager.join(event_driven=False, poll_interval=0.1)
+        assert self.manager.poll('a') == 0
+
+    @pytest.mark.parametrize('event_driven', [True, False])
+    def test_restart_on_failure(self, tmpdir, event_driven):
+        counter = tmpdir.join('count')
+        # fails twice, then succeeds
+        cmd = 'echo x >> {0}; [ $(wc -l < {0}) -ge 3 ]'.format(counter)
+        policy = RestartPolicy('on-failure', backoff=0.05)
+        self.manager.launch('actor', cmd, {}, restart_policy=policy)
+        self.manager.join(kill_on_error=True, event_driven=event_driven,
+                          poll_interval=0.01)
+        assert self.manager.poll('actor') == 0
+        assert self.manager.restart_counts['actor'] == 2
+
+    def test_max_restarts_then_kill_on_error(self, capsys):
+        policy = RestartPolicy('on-failure', max_restarts=2, backoff=0.01)
+        self.manager.launch('actor', 'exit 1', {}, restart_policy=policy)
+        self.manager.launch('learner', 'sleep 30', {})
+        self.manager.join(kill_on_error=True)
+        assert self.manager.restart_counts == {'actor': 2, 'learner': 0}
+        assert self.manager.poll('learner') is not None
+        out = capsys.readouterr().out
+        assert 'RESTART 2/2' in out
+        assert 'KILLING ALL REMAINING' in out
+
+
+class TestRestartPolicy:
+    def test_should_restart(self):
+        assert not RestartPolicy('never').should_restart(1, 0)
+        assert RestartPolicy('on-failure').should_restart(1, 0)
+        assert not RestartPolicy('on-failure').should_restart(0, 0)
+        assert RestartPolicy('always').should_restart(0, 0)
+        assert not RestartPolicy('always', max_restarts=2).should_restart(0, 2)
+        with pytest.raises(AssertionError):
+            RestartPolicy('sometimes')
+
+    def test_backoff(self):
+        policy = RestartPolicy('always', backoff=1., max_backoff=5.)
+        assert [policy.delay(i) for i in range(5)] == [1., 2., 4., 5., 5.]
+
+    def test_spec_serialization(self):
+        p = SubprocProcessSpec('actor', 'python actor.py',
+                               restart_policy='on-failure', max_restarts=3)
+        di = p.dump_dict()['restart_policy']
+        assert di['policy'] == 'on-failure' and di['max_restarts'] == 3
+        assert RestartPolicy.load_dict(di).dump_dict() == di
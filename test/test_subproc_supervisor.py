@@ -0,0 +1,85 @@
+import time
+import pytest
+from symphony.subproc import SubprocCluster
+from symphony.errors import ResourceExistsError
+from symphony.commandline import SymphonyParser
+
+
+def _wait_for(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.05)
+
+
+class TestDetachedCluster:
+    def setup_method(self):
+        self.cluster = None
+
+    def teardown_method(self):
+        for name in self.cluster.list_experiments():
+            self.cluster.delete(name)
+
+    def _launch(self, tmpdir, name='exp'):
+        self.cluster = SubprocCluster(detach=True, run_dir=str(tmpdir))
+        exp = self.cluster.new_experiment(name)
+        exp.new_process('server', 'for i in $(seq 5); do echo line$i; done; '
+                                  'sleep 30')
+        group = exp.new_process_group('agents')
+        group.new_process('agent', 'exit 2', restart_policy='on-failure',
+                          max_restarts=1, backoff=0.01)
+        start_time = time.time()
+        self.cluster.launch(exp, verbose=False)
+        assert time.time() - start_time < 10
+        return exp
+
+    def test_launch_returns_immediately(self, tmpdir):
+        self._launch(tmpdir)
+        assert self.cluster.list_experiments() == ['exp']
+        _wait_for(lambda: self.cluster.describe_process(
+            'exp', 'agent', 'agents')['restarts'] == 1)
+        # the agent gave up, kill_on_error took the server down with it
+        _wait_for(lambda: self.cluster.describe_process(
+            'exp', 'server')['status'] != 'running')
+        exp = self.cluster.describe_experiment('exp')
+        assert set(exp.keys()) == {None, 'agents'}
+        assert exp['agents']['agent']['exit_code'] == 2
+        assert self.cluster.restart_counts('exp') == {
+            'server': 0, 'agents:agent': 1}
+
+    def test_get_log(self, tmpdir):
+        self._launch(tmpdir)
+        _wait_for(lambda: 'line5' in self.cluster.get_log('exp', 'server'))
+        assert self.cluster.get_log('exp', 'server', tail=2) == 'line4\nline5\n'
+        logs = self.cluster.get_log('exp', 'server', tail=None, since='1h')
+        assert logs.startswith('line1\n')
+
+    def test_get_log_cli_defaults(self, tmpdir):
+        self._launch(tmpdir)
+        _wait_for(lambda: 'line5' in self.cluster.get_log('exp', 'server'))
+        parser = SymphonyParser().master_parser
+        for argv in [['log', 'server', 'exp'],
+                     ['log', 'server', 'exp', '--tail', '-1'],
+                     ['log', 'server', 'exp', '--since', '5m']]:
+            args = parser.parse_args(argv)
+            logs = self.cluster.get_log('exp', 'server', since=args.since,
+                                        tail=args.tail)
+            assert logs.startswith('line1\n')
+
+    def test_delete(self, tmpdir):
+        self._launch(tmpdir)
+        with pytest.raises(ResourceExistsError):
+            self._launch(tmpdir)
+        self.cluster.delete('exp')
+        _wait_for(lambda: self.cluster.list_experiments() == [])
+        assert not tmpdir.join('exp.sock').exists()
+
+
+
+def test_multi_process_log_selectors_need_kubernetes(tmpdir):
+    parser = SymphonyParser()
+    parser.cluster = SubprocCluster(detach=True, run_dir=str(tmpdir))
+    for selector in ['*', 'agents/*']:
+        args = parser.master_parser.parse_args(['log', selector, 'exp'])
+        with pytest.raises(SystemExit):
+            parser.action_log(args)
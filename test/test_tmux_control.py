@@ -0,0 +1,116 @@
+import shutil
+import subprocess
+import time
+import uuid
+import pytest
+from symphony.errors import ResourceExistsError
+from symphony.tmux import TmuxCluster
+from symphony.tmux.control import TmuxControlClient, TmuxCommandError
+
+pytestmark = pytest.mark.skipif(shutil.which('tmux') is None,
+                                reason='tmux is not installed')
+
+
+class _LocalNode:
+    """
+    Runs the commands of a TmuxProcessSpec as they are
+    """
+    def get_login_cmds(self):
+        return []
+
+    def get_allocation_cleanup_cmds(self, allocation):
+        return []
+
+    def dry_run(self, *cmds, allocation=None):
+        return list(cmds)
+
+    def get_ip_addr(self, allocation=None):
+        return '127.0.0.1'
+
+
+class TestTmuxControl:
+    def setup_method(self):
+        # a fresh server per test, a killed one takes a while to go away
+        self.server = '__symphony_test_{}__'.format(uuid.uuid4().hex[:8])
+
+    def teardown_method(self):
+        subprocess.run(['tmux', '-L', self.server, 'kill-server'],
+                       stderr=subprocess.DEVNULL)
+
+    def _tmux(self, *args):
+        return subprocess.run(['tmux', '-L', self.server] + list(args),
+                              stdout=subprocess.PIPE, universal_newlines=True,
+                              check=True).stdout.splitlines()
+
+    def _wait_for_output(self, target, text, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if text in '\n'.join(self._tmux('capture-pane', '-p', '-t', target)):
+                return True
+            time.sleep(0.1)
+        return False
+
+    def test_replies_in_order(self):
+        with TmuxControlClient(self.server,
+                               ['new-session', '-s', 's', '-P', '-F',
+                                '#{session_name}']) as client:
+            assert client.initial_output == ['s']
+            replies = client.run(
+                ['display-message', '-p', "it's $HOME; #{session_name}"],
+                ['new-window', '-d', '-n', 'w', '-P', '-F', '#{window_name}'],
+                ['list-windows', '-F', '#{window_name}'])
+            assert replies[:2] == [["it's $HOME; s"], ['w']]
+            assert len(replies[2]) == 2 and replies[2][-1] == 'w'
+
+    def test_error(self):
+        with TmuxControlClient(self.server, ['new-session', '-s', 's']) as client:
+            with pytest.raises(TmuxCommandError) as e:
+                client.run(['kill-window', '-t', 'nope'],
+                           ['new-window', '-d', '-n', 'after'])
+            assert e.value.command.startswith('kill-window')
+            # commands after the failed one still ran
+            assert 'after' in self._tmux('list-windows', '-F', '#{window_name}')
+
+    def test_launch(self):
+        # skip the user's shell startup files, they can take seconds
+        self._tmux('new-session', '-d', '-s', 'init', ';', 'set-option', '-g',
+                   'default-command', 'bash --norc --noprofile')
+        cluster = TmuxCluster(server_name=self.server)
+        exp = cluster.new_experiment('exp')
+        group = exp.new_process_group('group')
+        for i in range(3):
+            group.new_process('p{}'.format(i), node=_LocalNode(),
+                              cmds=['echo group{}-$FOO'.format(i)])
+        exp.new_process('alone', node=_LocalNode(), cmds=['echo "I am $FOO"'])
+        for p in exp.list_all_processes():
+            p.env['FOO'] = "it's me"
+        cluster.launch(exp, verbose=False)
+        windows = self._tmux('list-windows', '-t', 'exp', '-F',
+                             '#{window_name} #{window_panes}')
+        assert windows == ['__main__ 1', 'group 3', 'alone 1']
+        assert self._wait_for_output('exp:alone', "I am it's me")
+        for i in range(3):
+            assert self._wait_for_output('exp:group.{}'.format(i),
+                                         "group{}-it's me".format(i))
+        with pytest.raises(ResourceExistsError):
+            cluster.launch(exp, verbose=False)
+
+    def test_shell_timeout(self):
+        # a pane whose shell never reads its input
+        self._tmux('new-session', '-d', '-s', 'init', ';', 'set-option', '-g',
+                   'default-command', 'sleep 30')
+        cluster = TmuxCluster(server_name=self.server, shell_timeout=0.5)
+        exp = cluster.new_experiment('exp')
+        exp.new_process('stuck', node=_LocalNode(), cmds=['echo never'])
+        start_time = time.time()
+        with pytest.raises(TimeoutError) as e:
+            cluster.launch(exp, verbose=False)
+        assert time.time() - start_time < 5
+        assert '"stuck"' in str(e.value)
+
+
+def test_control_mode_needs_tmux_3(monkeypatch):
+    monkeypatch.setattr('libtmux.common.has_gte_version', lambda version: False)
+    assert not TmuxCluster(server_name='__symphony_unused__')._use_control_mode()
+    assert TmuxCluster(server_name='__symphony_unused__',
+                       control_mode=True)._use_control_mode()
@@ -0,0 +1,71 @@
+import pytest
+from symphony.tmux import TmuxExperimentSpec
+from symphony.tmux.gpu_allocator import GPUAllocator
+from symphony.tmux.placement import PlacementError
+
+
+def _allocator(num_gpus=4, groups=None):
+    return GPUAllocator([1.] * num_gpus, [1.] * num_gpus, [16.] * num_gpus,
+                        groups=groups)
+
+
+def test_fractional_users_share_gpus():
+    allocator = _allocator()
+    assert [allocator.allocate('agent{}'.format(i), [0.3], [2])
+            for i in range(4)] == [[0], [0], [0], [1]]
+    assert allocator.free_compute[0] == pytest.approx(0.1)
+    allocator.release('agent0')
+    assert allocator.allocate('agent4', [0.3], [2]) == [0]
+
+
+def test_exclusive_users_spread_apart():
+    allocator = _allocator(groups=[0, 0, 1, 1])
+    assert allocator.allocate('learner0', [1.], [8]) == [0]
+    # another group
+    assert allocator.allocate('learner1', [1.], [8]) == [2]
+    # GPUs of the same process stay together
+    allocator.release('learner1')
+    assert allocator.allocate('learner1', [1., 1.], [8, 8]) == [2, 3]
+
+    allocator = _allocator(num_gpus=8)
+    assert allocator.allocate('a', [1.], [1]) == [0]
+    assert allocator.allocate('b', [1.], [1]) == [7]
+    # fractional users go away from the exclusive ones
+    assert allocator.allocate('c', [0.5], [1]) == [3]
+    assert allocator.allocate('d', [0.5], [1]) == [3]
+
+
+def test_does_not_fit():
+    allocator = _allocator(num_gpus=2)
+    allocator.allocate('agent', [0.2], [2])
+    allocator.allocate('learner', [1.], [8])
+    with pytest.raises(PlacementError):
+        allocator.allocate('other', [1.], [8])
+    with pytest.raises(PlacementError):
+        allocator.allocate('other', [0.5, 0.5], [1, 1])
+    # partial allocations are given back
+    assert allocator.free_compute == pytest.approx([0.8, 0.])
+    assert 'other' not in allocator.assignments
+
+
+def test_failed_reallocation_keeps_previous_gpus():
+    allocator = _allocator(num_gpus=2)
+    allocator.allocate('agent', [0.2], [2])
+    assert allocator.allocate('learner', [1.], [8]) == [1]
+    with pytest.raises(PlacementError):
+        allocator.allocate('learner', [1., 1.], [8, 8])
+    assert allocator.assignments['learner'] == [(1, 1., 8)]
+    assert allocator.free_compute == pytest.approx([0.8, 0.])
+    with pytest.raises(PlacementError):
+        allocator.allocate('other', [1.], [8])
+
+
+def test_process_allocate_gpus():
+    exp = TmuxExperimentSpec('exp')
+    process = exp.new_process('learner', cmds=['echo'])
+    allocator = _allocator()
+    with pytest.raises(ValueError):
+        process.allocate_gpus(allocator)
+    process.set_costs(1, 1, [1., 1.], [8, 8])
+    assert process.allocate_gpus(allocator) == [0, 1]
+    assert process.env['CUDA_VISIBLE_DEVICES'] == '0,1'
@@ -0,0 +1,66 @@
+import pytest
+from symphony.tmux import TmuxExperimentSpec
+from symphony.tmux.placement import NodeResources, PlacementError, place
+
+
+def _nodes():
+    return [
+        NodeResources('big', cpu=16, mem=64, gpu_compute=[1, 1],
+                      gpu_mem=[16, 16]),
+        NodeResources('small', cpu=4, mem=16),
+    ]
+
+
+def _experiment(costs):
+    exp = TmuxExperimentSpec('exp')
+    for name, cost in costs.items():
+        exp.new_process(name, cmds=['echo']).set_costs(*cost)
+    return exp
+
+
+def test_best_fit_fills_small_node_first():
+    exp = _experiment({'a': (4, 8, [], []), 'b': (2, 4, [], [])})
+    placement = place(exp, _nodes())
+    assert placement.assignments['a'] == ('small', [])
+    assert placement.assignments['b'] == ('big', [])
+
+
+def test_first_fit():
+    exp = _experiment({'a': (4, 8, [], []), 'b': (2, 4, [], [])})
+    placement = place(exp, _nodes(), strategy='first-fit')
+    assert placement.assignments == {'a': ('big', []), 'b': ('big', [])}
+    assert placement.utilization()['big']['cpu'] == pytest.approx(6 / 16)
+
+
+def test_hard_placement_and_gpus():
+    exp = _experiment({
+        'learner': (2, 8, [0.6], [8]),
+        'agent': (1, 1, [0.6], [4]),
+        'replay': (4, 16, [], []),
+    })
+    exp.get_process('replay').set_hard_placement('big')
+    nodes = _nodes()
+    placement = place(exp, nodes)
+    assert placement.assignments['replay'] == ('big', [])
+    assert placement.assignments['learner'] == ('big', [0])
+    # GPU 0 has 0.4 compute left
+    assert placement.assignments['agent'] == ('big', [1])
+    assert exp.get_process('learner').node is nodes[0]
+    assert exp.get_process('agent').env['CUDA_VISIBLE_DEVICES'] == '1'
+    assert 'learner (GPU 0)' in placement.report()
+
+
+def test_dry_run_and_errors():
+    exp = _experiment({'a': (1, 1, [], [])})
+    exp.new_process('no-costs', cmds=['echo'])
+    placement = place(exp, _nodes(), dry_run=True)
+    assert list(placement.assignments) == ['a']
+    assert exp.get_process('a').node is None
+    assert placement.report().splitlines()[0].startswith('big: cpu 0%')
+
+    with pytest.raises(PlacementError):
+        place(_experiment({'a': (1, 1, [0.5, 0.5, 0.5], [1, 1, 1])}), _nodes())
+    exp = _experiment({'a': (1, 1, [], [])})
+    exp.get_process('a').set_hard_placement('missing')
+    with pytest.raises(PlacementError):
+        place(exp, _nodes())
@@ -0,0 +1,65 @@
+from symphony.tmux import TmuxExperimentSpec
+
+
+class _FakeNode:
+    def __init__(self, ip, listening):
+        self.ip = ip
+        self.listening = listening
+        self.reserved = []
+        self.probes = 0
+
+    def get_unavailable_ports(self, allocation=None):
+        self.probes += 1
+        return list(self.listening) + self.reserved
+
+    def reserve_port(self, port, allocation=None):
+        self.reserved.append(port)
+
+    def release_port(self, port, allocation=None):
+        self.reserved.remove(port)
+
+    def get_ip_addr(self, allocation=None):
+        return self.ip
+
+
+def test_one_probe_per_node():
+    nodes = [_FakeNode('10.0.0.1', [6000, 6002]), _FakeNode('10.0.0.2', [])]
+    exp = TmuxExperimentSpec('exp')
+    for i in range(10):
+        process = exp.new_process('p{}'.format(i), node=nodes[i % 2])
+        process.binds(['a{}'.format(i), 'b{}'.format(i)])
+    exp.compile()
+    assert [node.probes for node in nodes] == [1, 1]
+    ports = [port for ip, port in exp.binded_services.values() if ip == '10.0.0.1']
+    assert sorted(ports) == [6001] + list(range(6003, 6012))
+
+
+def test_stale_snapshot_is_refreshed():
+    node = _FakeNode('10.0.0.1', [6006])
+    probe = node.get_unavailable_ports
+
+    def get_unavailable_ports(allocation=None):
+        ports = probe(allocation)
+        # 6006 is released right after the first probe
+        node.listening = []
+        return ports
+    node.get_unavailable_ports = get_unavailable_ports
+    exp = TmuxExperimentSpec('exp')
+    exp.new_process('p', node=node).binds({'tensorboard': 6006})
+    exp.compile()
+    assert exp.binded_services['tensorboard'] == ('10.0.0.1', 6006)
+    assert node.probes == 2
+
+
+def test_moved_process_releases_ports():
+    old, new = _FakeNode('10.0.0.1', []), _FakeNode('10.0.0.2', [])
+    exp = TmuxExperimentSpec('exp')
+    process = exp.new_process('p', node=old)
+    process.binds({'tensorboard': 6006, 'server': None})
+    exp.compile()
+    assert sorted(old.reserved) == [6000, 6006]
+    process.set_placement(new)
+    exp.compile()
+    assert old.reserved == []
+    assert sorted(new.reserved) == [6000, 6006]
+    assert exp.binded_services['tensorboard'] == ('10.0.0.2', 6006)
@@ -0,0 +1,68 @@
+import time
+import numpy as np
+from symphony.tmux.placement import place
+from symphony.tmux.spy_stats import SpyStatsCollector, parse_spy_util
+from symphony.tmux import TmuxExperimentSpec
+from symphony.utils import ConfigDict
+
+
+class _FakeNode:
+    def __init__(self, name, num_gpus, fail=False):
+        self.name = name
+        self.num_gpus = num_gpus
+        self.fail = fail
+        self.capacity_fetches = 0
+
+    def fetch_spy_capacity(self):
+        self.capacity_fetches += 1
+        return ConfigDict(cpu=2., memory=4., gpu_model=['Tesla V100'] * self.num_gpus,
+                          gpu_mem=[16.] * self.num_gpus)
+
+    def fetch_spy_util(self, measurement_time):
+        time.sleep(measurement_time)
+        if self.fail:
+            raise RuntimeError('spy is down')
+        profile = {'cpu': 10., 'memory': 36.}
+        for i in range(self.num_gpus):
+            profile['gpu/%d/compute' % i] = 0.25 * i
+            profile['gpu/%d/memory' % i] = 4. * i
+        return parse_spy_util(profile)
+
+    def set_spy_stats(self, capacity, util):
+        self.stats = (capacity, util)
+
+
+def test_collect_concurrently():
+    nodes = [_FakeNode('n{}'.format(i), i % 3) for i in range(20)]
+    collector = SpyStatsCollector(nodes)
+    start = time.time()
+    fleet = collector.collect(0.2)
+    assert time.time() - start < 1.
+    assert len(fleet) == 20 and fleet.gpu_mem_capacity.shape == (20, 2)
+    assert fleet.avail_cpu().tolist() == [8.] * 20
+    np.testing.assert_allclose(fleet.avail_gpu_mem()[2], [16., 12.])
+    assert np.isnan(fleet.avail_gpu_mem()[1, 1])
+    np.testing.assert_allclose(fleet.avail_gpu_compute({'V100': 2.})[2], [2., 1.5])
+    assert nodes[2].stats[1].gpu_compute == [0., 0.25]
+
+    collector.collect(0.)
+    assert [node.capacity_fetches for node in nodes] == [1] * 20
+    collector.invalidate_capacity(nodes[0])
+    collector.collect(0.)
+    assert nodes[0].capacity_fetches == 2 and nodes[1].capacity_fetches == 1
+
+
+def test_failed_nodes_are_left_out():
+    nodes = [_FakeNode('up', 1), _FakeNode('down', 1, fail=True)]
+    fleet = SpyStatsCollector(nodes).collect(0.)
+    assert fleet.names == ['up'] and list(fleet.failed) == ['down']
+
+
+def test_place_on_fleet():
+    nodes = [_FakeNode('n0', 0), _FakeNode('n1', 2)]
+    fleet = SpyStatsCollector(nodes).collect(0.)
+    exp = TmuxExperimentSpec('exp')
+    exp.new_process('learner', cmds=['echo']).set_costs(1, 1, [1.5], [8])
+    placement = place(exp, fleet, gpu_model_to_scale={'V100': 2.})
+    assert placement.assignments['learner'] == ('n1', [1])
+    assert exp.get_process('learner').node is nodes[1]
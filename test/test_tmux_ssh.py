@@ -0,0 +1,179 @@
+import os
+import socket
+import subprocess
+import threading
+import time
+import paramiko
+import pytest
+from symphony.tmux.process import TmuxProcessSpec
+from symphony.tmux.ssh import SSHConnection, SSHCommandError
+from symphony.tmux.staging import stage_dir
+
+
+class _SFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.writefile.fileno()))
+
+
+class _SFTPServer(paramiko.SFTPServerInterface):
+    """
+    Only supports uploads
+    """
+    def open(self, path, flags, attr):
+        handle = _SFTPHandle(flags)
+        handle.filename = path
+        handle.writefile = open(path, 'wb')
+        return handle
+
+    def stat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.stat(path))
+
+    lstat = stat
+
+
+class _Server(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        def feed(proc):
+            try:
+                while True:
+                    data = channel.recv(65536)
+                    if not data:
+                        break
+                    proc.stdin.write(data)
+                proc.stdin.close()
+            except (OSError, ValueError):  # the command exited first
+                pass
+
+        def run():
+            # paramiko replies to the exec request after this returns
+            time.sleep(0.05)
+            proc = subprocess.Popen(command.decode(), shell=True,
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            threading.Thread(target=feed, args=(proc,), daemon=True).start()
+            channel.sendall(proc.stdout.read())
+            channel.sendall_stderr(proc.stderr.read())
+            channel.send_exit_status(proc.wait())
+            channel.close()
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+
+class _LocalSSHD:
+    """
+    Stand-in for sshd that runs commands locally and counts connections
+    """
+    def __init__(self):
+        self.key = paramiko.RSAKey.generate(1024)
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(10)
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer,
+                                            _SFTPServer)
+            transport.start_server(server=_Server())
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def sshd():
+    server = _LocalSSHD()
+    yield server
+    server.close()
+
+
+def _connect(sshd):
+    return SSHConnection('127.0.0.1', port=sshd.port, username='test',
+                         password='test', look_for_keys=False,
+                         allow_agent=False, max_channels=4)
+
+
+def test_run_many(sshd):
+    connection = _connect(sshd)
+    outputs = connection.run_many(['echo {}'.format(i) for i in range(20)])
+    assert outputs == ['{}\n'.format(i) for i in range(20)]
+    futures = connection.run_many(['echo a', 'echo b'], wait=False)
+    assert [f.result() for f in futures] == ['a\n', 'b\n']
+    with pytest.raises(SSHCommandError) as e:
+        connection.run('echo oops >&2; exit 3')
+    assert e.value.exit_status == 3 and e.value.stderr == 'oops\n'
+    connection.close()
+    assert sshd.connections == 1
+
+
+def test_put_many(sshd, tmpdir):
+    src = tmpdir.mkdir('src')
+    dst = tmpdir.mkdir('dst')
+    files = []
+    for i in range(10):
+        src.join(str(i)).write('content {}'.format(i))
+        files.append((str(src.join(str(i))), str(dst.join(str(i)))))
+    connection = _connect(sshd)
+    connection.put_many(files)
+    connection.close()
+    for i in range(10):
+        assert dst.join(str(i)).read() == 'content {}'.format(i)
+    assert sshd.connections == 1
+
+
+def test_stage_dir(sshd, tmpdir):
+    src = tmpdir.mkdir('src')
+    src.join('a.py').write('a')
+    src.mkdir('pkg').join('b.py').write('b')
+    dsts = [tmpdir.join('node{}'.format(i)) for i in range(3)]
+    connections = [_connect(sshd) for _ in dsts]
+    sent = [stage_dir([connection], str(src), str(dst))[0]
+            for connection, dst in zip(connections, dsts)]
+    assert [sorted(files) for files in sent] == [['a.py', 'pkg/b.py']] * 3
+    assert dsts[2].join('pkg', 'b.py').read() == 'b'
+
+    src.join('a.py').write('changed')
+    sent = [stage_dir([connection], str(src), str(dst))[0]
+            for connection, dst in zip(connections, dsts)]
+    assert sent == [['a.py'], ['a.py'], ['a.py']]
+    assert dsts[1].join('a.py').read() == 'changed'
+    for connection in connections:
+        connection.close()
+
+
+class _RemoteNode:
+    def get_login_cmds(self):
+        return ['ssh -t user@host']
+
+    def get_allocation_cleanup_cmds(self, allocation):
+        return []
+
+    def dry_run(self, *cmds, allocation=None):
+        return list(cmds)
+
+
+def test_pane_login_is_multiplexed():
+    process = TmuxProcessSpec('p', node=_RemoteNode(), cmds=['echo hi'])
+    login_cmd, app_cmd = process.get_tmux_cmd([])
+    assert login_cmd.startswith('ssh -o ControlMaster=auto -o ControlPath=')
+    assert login_cmd.endswith(' -t user@host')
+    assert app_cmd == 'echo hi'